@@ -4,6 +4,8 @@ import sys
 import uvicorn
 from pathlib import Path
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
 from aiogram import Bot, Dispatcher, types
 from dotenv import load_dotenv
 
@@ -27,6 +29,13 @@ else:
 
 from handlers.tarot_handlers import router as tarot_router
 from handlers.payment_handlers import router as payment_router
+from services import generation_service, metrics, reading_schema
+from services.fsm_storage import create_fsm_storage
+from services.metrics import setup_metrics
+from services.tracing import setup_tracing
+from services.outbound_scheduler import OutboundScheduler
+from services.update_dedup import setup_update_deduplication
+from services.update_queue import ACCEPTED, REJECTED, UpdateQueue
 
 # --- Переменные ---
 # Токен бота из переменных окружения
@@ -64,12 +73,30 @@ app = FastAPI()
 # Aiogram бот и диспетчер
 from aiogram.client.default import DefaultBotProperties
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
+dp = Dispatcher(storage=create_fsm_storage())
+# Трассировка (TRACING=jsonl или otlp) подключается до планировщика,
+# чтобы спаны запросов к Bot API включали ожидание в нем
+setup_tracing(dp, bot)
+# Исходящие запросы проходят через планировщик с учетом лимитов Telegram
+scheduler = OutboundScheduler()
+bot.session.middleware(scheduler)
 
 # --- Роутеры ---
 dp.include_router(tarot_router)
 dp.include_router(payment_router)
 
+# Повторно доставленные обновления и платежи обрабатываются один раз
+setup_update_deduplication(dp)
+
+# --- Очередь обновлений ---
+# Вебхук только ставит обновление в очередь и сразу отвечает Telegram,
+# а обработку (с анимацией и генерацией расклада) выполняют обработчики очереди
+update_queue = UpdateQueue(handler=lambda update: dp.feed_update(bot=bot, update=update))
+
+# --- Метрики ---
+# Обработчики, запросы к OpenAI и Telegram, глубина очереди (отдаются на /metrics)
+setup_metrics(dp, bot, queue=update_queue, scheduler=scheduler)
+
 
 # --- Логика вебхука ---
 # Флаг для отслеживания установки вебхука
@@ -99,6 +126,12 @@ async def on_startup():
     else:
         logging.warning("Не удалось установить вебхук: отсутствует URL сервиса.")
 
+@app.on_event("startup")
+async def on_dispatcher_startup():
+    """Запускает startup-обработчики роутеров (фоновые задачи бота) и очередь обновлений."""
+    await dp.emit_startup(bot=bot)
+    update_queue.start()
+
 # Функция для запуска вебхука из start_replit.py
 async def start_webhook():
     """Запускает бота в режиме вебхука."""
@@ -116,17 +149,48 @@ async def start_webhook():
 @app.post(WEBHOOK_PATH)
 async def bot_webhook(update: dict):
     """
-    Принимает обновления от Telegram, преобразует их
-    и передает в диспетчер aiogram.
+    Принимает обновления от Telegram, проверяет их и ставит в очередь
+    на обработку, не дожидаясь ответа диспетчера aiogram.
     """
-    telegram_update = types.Update(**update)
-    await dp.feed_update(bot=bot, update=telegram_update)
+    try:
+        telegram_update = types.Update(**update)
+    except ValidationError as e:
+        logging.warning(f"Некорректное обновление от Telegram: {e}")
+        return JSONResponse(status_code=400, content={"ok": False, "error": "invalid update"})
+    result = update_queue.submit(telegram_update)
+    if result == REJECTED:
+        # Telegram повторит доставку позже
+        logging.warning(f"Очередь обновлений переполнена, обновление {telegram_update.update_id} отклонено")
+        return JSONResponse(status_code=429, content={"ok": False, "error": "queue is full"},
+                            headers={"Retry-After": "1"})
+    if result != ACCEPTED:
+        logging.warning(f"Очередь обновлений переполнена, обновление {telegram_update.update_id} отброшено")
     return {"ok": True}
 
+@app.get("/stats/queue")
+def queue_stats():
+    """Глубина очереди обновлений, время ожидания и счетчики."""
+    return update_queue.stats()
+
+@app.get("/stats/generation")
+def generation_stats():
+    """Кэш ответов модели, объединение одинаковых запросов и доля неразобранных ответов."""
+    return {**generation_service.stats(), "parsing": reading_schema.stats()}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Метрики бота в текстовом формате Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.on_event("shutdown")
 async def on_shutdown():
     """Корректно завершает сессию бота при остановке."""
+    # Сначала дорабатываем уже принятые обновления
+    await update_queue.stop()
+    # Диспетчер при этом закрывает и хранилище состояний FSM
+    await dp.emit_shutdown(bot=bot)
     await bot.session.close()
+    await generation_service.close()
     logging.info("Сессия бота закрыта.")
 
 @app.get("/")
@@ -0,0 +1,89 @@
+"""Бенчмарк пакетной генерации стандартных раскладов
+
+Для каждого K выполняет несколько запросов generate_tarot_readings(K) к
+настроенному API (OPENAI_API_KEY, при необходимости OPENAI_BASE_URL) и выводит
+скорость генерации токенов, стоимость одного расклада и задержку запроса.
+
+Запуск:
+    python benchmarks/batch_generation_bench.py --sizes 1 5 10 --calls 10 --concurrency 2
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from handlers.tarot_handlers import generate_tarot_readings
+from services import generation_service
+
+
+def percentile(values, q):
+    """Возвращает перцентиль q (0..100) отсортированного списка"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_size(size, calls, concurrency):
+    """Выполняет calls запросов по size раскладов и собирает задержки и расход токенов"""
+    latencies = []
+    readings = [0]
+    failures = [0]
+    remaining = [calls]
+    usage_before = dict(generation_service.usage)
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                result = await generate_tarot_readings(size)
+            except Exception as e:
+                failures[0] += 1
+                print(f"K={size}: ошибка запроса: {type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - started)
+            readings[0] += len(result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    usage = {key: generation_service.usage[key] - usage_before[key] for key in usage_before}
+    latencies.sort()
+    return elapsed, latencies, readings[0], failures[0], usage
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10], help="Количество раскладов в запросе (K)")
+    parser.add_argument("--calls", type=int, default=10, help="Количество запросов для каждого K")
+    parser.add_argument("--concurrency", type=int, default=2, help="Количество параллельных запросов")
+    parser.add_argument("--price-input", type=float, default=0.5, help="Цена 1M входных токенов, $")
+    parser.add_argument("--price-output", type=float, default=1.5, help="Цена 1M выходных токенов, $")
+    args = parser.parse_args()
+
+    rows = []
+    try:
+        for size in args.sizes:
+            rows.append((size, *await run_size(size, args.calls, args.concurrency)))
+    finally:
+        await generation_service.close()
+
+    print(f"{'K':>3} {'раскладов':>10} {'ошибок':>7} {'ток/с':>8} {'ток/расклад':>12} "
+          f"{'$/1000 раскладов':>17} {'p50, с':>7} {'p95, с':>7} {'с/расклад':>10}")
+    for size, elapsed, latencies, readings, failures, usage in rows:
+        tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+        cost = (usage["prompt_tokens"] * args.price_input + usage["completion_tokens"] * args.price_output) / 1_000_000
+        per_reading = readings or 1
+        print(f"{size:>3} {readings:>10} {failures:>7} {usage['completion_tokens'] / elapsed:>8.1f} "
+              f"{tokens / per_reading:>12.0f} {cost / per_reading * 1000:>17.4f} "
+              f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} "
+              f"{elapsed * args.concurrency / per_reading:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
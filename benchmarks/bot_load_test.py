@@ -0,0 +1,329 @@
+"""Нагрузочный тест всего бота на локальных заглушках OpenAI и Telegram
+
+Поднимает заглушки из mock_servers.py (или использует уже запущенные), собирает
+бота так же, как main.py (роутеры, планировщик исходящих запросов, защита от
+повторов, очередь обновлений), и имитирует N пользователей, проходящих путь
+/start -> тест -> оплата премиума -> дата рождения -> премиум-расклад.
+
+Выводит пропускную способность (обновлений в секунду), p50/p95/p99 времени
+обработки по обработчикам и количество сообщений на расклад. Хранилища FSM,
+квот и повторов по умолчанию в памяти, чтобы не трогать рабочие базы.
+
+Запуск:
+    python benchmarks/bot_load_test.py --users 50 --ramp 5 --openai-latency lognormal:0.8,0.5
+    python benchmarks/bot_load_test.py --users 200 --openai-error-rate 0.05 --openai-malformed-rate 0.1
+    python benchmarks/bot_load_test.py --openai-url http://127.0.0.1:8081 --telegram-url http://127.0.0.1:8082
+"""
+import os
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Хранилища бота в памяти: настройки читаются при импорте сервисов
+os.environ.setdefault('FSM_STORAGE', 'memory')
+os.environ.setdefault('QUOTA_STORE', 'memory')
+os.environ.setdefault('UPDATE_DEDUP_STORE', 'memory')
+os.environ.setdefault('PREMIUM_CACHE_PATH', '')
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from benchmarks.mock_servers import (
+    OpenAIMockConfig, TelegramMockConfig, TelegramRecorder, create_openai_app, create_telegram_app, start_app
+)
+from handlers.payment_handlers import router as payment_router
+from handlers.tarot_handlers import router as tarot_router
+from services import generation_service, metrics, tracing
+from services.fsm_storage import create_fsm_storage
+from services.metrics import setup_metrics
+from services.tracing import JsonlExporter, setup_tracing
+from services.outbound_scheduler import OutboundScheduler
+from services.update_dedup import setup_update_deduplication
+from services.update_queue import WEBHOOK_WORKERS, UpdateQueue
+
+BOT_TOKEN = "123456:LOAD-TEST"
+
+# Первый ID пользователя (далеко от реальных ID из FREE_USERS)
+FIRST_USER_ID = 7_000_000_000
+
+BIRTHDATES = ["15.05.1990", "01.01.1985", "29.02.2000", "31.12.1977", "07.07.1999"]
+
+# Шаги пути пользователя в порядке выполнения
+STEPS = ["start", "test_reading", "pay_premium_reading", "pre_checkout", "successful_payment", "birthdate"]
+
+
+def percentile(values, q):
+    """Возвращает перцентиль q (0..100) отсортированного списка"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class UpdateFactory:
+    """Собирает обновления Telegram от имени пользователя"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Load {user_id}", "language_code": "ru"}
+
+    def _message(self, user_id, **fields):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **fields
+        }
+
+    def _update(self, **fields):
+        return Update.model_validate({"update_id": next(self._update_ids), **fields}, context={"bot": self.bot})
+
+    def message(self, user_id, text):
+        return self._update(message=self._message(user_id, text=text))
+
+    def callback(self, user_id, data):
+        return self._update(callback_query={
+            "id": f"cb-{user_id}-{data}",
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "message": self._message(user_id, text="menu"),
+            "data": data
+        })
+
+    def pre_checkout(self, user_id, amount=300):
+        return self._update(pre_checkout_query={
+            "id": f"pcq-{user_id}",
+            "from": self._user(user_id),
+            "currency": "XTR",
+            "total_amount": amount,
+            "invoice_payload": "tarot_reading"
+        })
+
+    def successful_payment(self, user_id, amount=300):
+        return self._update(message=self._message(user_id, successful_payment={
+            "currency": "XTR",
+            "total_amount": amount,
+            "invoice_payload": "tarot_reading",
+            "telegram_payment_charge_id": f"load-charge-{user_id}",
+            "provider_payment_charge_id": f"load-provider-{user_id}"
+        }))
+
+    def step(self, name, user_id):
+        """Обновление для шага name пути пользователя"""
+        if name == "start":
+            return self.message(user_id, "/start")
+        if name in ("test_reading", "pay_premium_reading"):
+            return self.callback(user_id, name)
+        if name == "pre_checkout":
+            return self.pre_checkout(user_id)
+        if name == "successful_payment":
+            return self.successful_payment(user_id)
+        return self.message(user_id, random.choice(BIRTHDATES))
+
+
+class LoadRunner:
+    """Прогоняет обновления через очередь и замеряет время обработки по шагам"""
+
+    def __init__(self, dp, bot, recorder, workers):
+        self.dp = dp
+        self.bot = bot
+        self.recorder = recorder
+        self.factory = UpdateFactory(bot)
+        self.queue = UpdateQueue(handler=self._handle, workers=workers, max_size=1_000_000)
+        # update_id -> (шаг, future завершения обработки)
+        self._pending = {}
+        self.handler_times = defaultdict(list)
+        self.response_times = defaultdict(list)
+        self.step_messages = defaultdict(list)
+        self.flow_times = []
+        self.updates = 0
+        self.failed_flows = 0
+
+    async def _handle(self, update):
+        step, done = self._pending.pop(update.update_id)
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(bot=self.bot, update=update)
+        except Exception as e:
+            if not done.done():
+                done.set_exception(e)
+            raise
+        finally:
+            self.handler_times[step].append(time.perf_counter() - started)
+            self.updates += 1
+        if not done.done():
+            done.set_result(None)
+
+    async def send(self, step, user_id):
+        """Отправляет обновление шага и ждет окончания его обработки"""
+        update = self.factory.step(step, user_id)
+        done = asyncio.get_running_loop().create_future()
+        self._pending[update.update_id] = (step, done)
+        messages_before = self.recorder.messages(user_id)
+        submitted = time.perf_counter()
+        self.queue.submit(update)
+        await done
+        self.response_times[step].append(time.perf_counter() - submitted)
+        self.step_messages[step].append(self.recorder.messages(user_id) - messages_before)
+
+    async def user_flow(self, user_id, delay, think_time):
+        """Проходит путь одного пользователя с паузами на "чтение" между шагами"""
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        try:
+            for step in STEPS:
+                await self.send(step, user_id)
+                if think_time:
+                    await asyncio.sleep(random.uniform(0, 2 * think_time))
+        except Exception as e:
+            self.failed_flows += 1
+            print(f"Пользователь {user_id}: путь прерван: {type(e).__name__}: {e}")
+            return
+        self.flow_times.append(time.perf_counter() - started)
+
+
+def build_bot(telegram_url):
+    """Собирает бота и диспетчер так же, как main.py, но с сервером Bot API из telegram_url"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(telegram_url))
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    dp = Dispatcher(storage=create_fsm_storage())
+    setup_tracing(dp, bot)
+    scheduler = OutboundScheduler()
+    bot.session.middleware(scheduler)
+    dp.include_router(tarot_router)
+    dp.include_router(payment_router)
+    setup_update_deduplication(dp)
+    setup_metrics(dp, bot, scheduler=scheduler)
+    return bot, dp, scheduler
+
+
+def report(runner, elapsed, users, openai_counters):
+    """Печатает пропускную способность, задержки по обработчикам и сообщения на расклад"""
+    readings = len(runner.response_times["birthdate"])
+    print(f"\nПользователей: {users}, завершили путь: {len(runner.flow_times)}, прервано: {runner.failed_flows}")
+    print(f"Обновлений: {runner.updates} за {elapsed:.1f} с ({runner.updates / elapsed:.2f} обновлений/с)")
+    if runner.flow_times:
+        flow_times = sorted(runner.flow_times)
+        print(f"Путь пользователя: p50 {percentile(flow_times, 50):.1f} с, p95 {percentile(flow_times, 95):.1f} с")
+
+    print(f"\n{'обработчик':<22} {'кол-во':>7} {'p50, с':>8} {'p95, с':>8} {'p99, с':>8} "
+          f"{'p99 с очередью':>15} {'сообщ./обновл.':>15}")
+    for step in STEPS:
+        times = sorted(runner.handler_times[step])
+        responses = sorted(runner.response_times[step])
+        messages = runner.step_messages[step]
+        print(f"{step:<22} {len(times):>7} {percentile(times, 50):>8.3f} {percentile(times, 95):>8.3f} "
+              f"{percentile(times, 99):>8.3f} {percentile(responses, 99):>15.3f} "
+              f"{statistics.fmean(messages) if messages else 0:>15.1f}")
+
+    total_messages = runner.recorder.messages()
+    premium_messages = sum(runner.step_messages["birthdate"])
+    print(f"\nСообщений (отправки и редактирования): {total_messages}")
+    if readings:
+        print(f"Сообщений на премиум-расклад: {premium_messages / readings:.1f}, "
+              f"на весь путь пользователя: {total_messages / readings:.1f}")
+    print(f"Методы Bot API: {dict(runner.recorder.methods)}")
+
+    stats = generation_service.stats()
+    print(f"OpenAI: запросов к заглушке {openai_counters.get('requests', 'н/д')}, "
+          f"токенов {stats['usage']['prompt_tokens']} + {stats['usage']['completion_tokens']}, "
+          f"предохранитель {stats['circuit']['state']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="Количество пользователей")
+    parser.add_argument("--ramp", type=float, default=5.0, help="За сколько секунд приходят все пользователи")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Средняя пауза пользователя между шагами, с")
+    parser.add_argument("--workers", type=int, default=WEBHOOK_WORKERS, help="Количество обработчиков очереди")
+    parser.add_argument("--openai-url", default=None, help="Адрес запущенной заглушки OpenAI (иначе своя)")
+    parser.add_argument("--telegram-url", default=None, help="Адрес запущенной заглушки Telegram (иначе своя)")
+    parser.add_argument("--openai-latency", default="lognormal:0.8,0.5", help="Распределение задержки OpenAI")
+    parser.add_argument("--openai-chunk-delay", type=float, default=0.02, help="Пауза между фрагментами потока")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="Доля ответов OpenAI с ошибкой")
+    parser.add_argument("--openai-hang-rate", type=float, default=0.0, help="Доля зависающих запросов OpenAI")
+    parser.add_argument("--openai-malformed-rate", type=float, default=0.0, help="Доля обрезанных ответов OpenAI")
+    parser.add_argument("--telegram-latency", default="fixed:0.03", help="Распределение задержки Bot API")
+    parser.add_argument("--telegram-flood-rate", type=float, default=0.0, help="Доля ответов Bot API 429")
+    parser.add_argument("--metrics-out", default=None, help="Файл, в который сохранить /metrics после прогона")
+    parser.add_argument("--trace-file", default=None,
+                        help="Записать спаны в этот JSONL-файл (отчет: benchmarks/trace_report.py)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    runners = []
+    recorder = TelegramRecorder()
+    openai_config = OpenAIMockConfig(
+        latency=args.openai_latency,
+        chunk_delay=args.openai_chunk_delay,
+        error_rate=args.openai_error_rate,
+        hang_rate=args.openai_hang_rate,
+        malformed_rate=args.openai_malformed_rate
+    )
+    openai_url = args.openai_url
+    if openai_url is None:
+        runner, openai_url = await start_app(create_openai_app(openai_config))
+        runners.append(runner)
+    telegram_url = args.telegram_url
+    if telegram_url is None:
+        runner, telegram_url = await start_app(create_telegram_app(
+            TelegramMockConfig(latency=args.telegram_latency, flood_rate=args.telegram_flood_rate), recorder
+        ))
+        runners.append(runner)
+    else:
+        print("Внешняя заглушка Telegram: сообщения на расклад смотрите в ее GET /_stats")
+
+    # Клиент OpenAI создается при первом запросе и берет адрес из окружения
+    os.environ['OPENAI_BASE_URL'] = f"{openai_url.rstrip('/')}/v1"
+    os.environ.setdefault('OPENAI_API_KEY', 'load-test')
+
+    if args.trace_file:
+        tracing.configure(JsonlExporter(args.trace_file))
+
+    bot, dp, scheduler = build_bot(telegram_url)
+    load = LoadRunner(dp, bot, recorder, args.workers)
+    await dp.emit_startup(bot=bot)
+    load.queue.start()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            load.user_flow(FIRST_USER_ID + index, args.ramp * index / max(1, args.users), args.think_time)
+            for index in range(args.users)
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        await load.queue.stop()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await generation_service.close()
+        for runner in runners:
+            await runner.cleanup()
+
+    report(load, elapsed, args.users, openai_config.counters)
+    print(f"Планировщик Telegram: {scheduler.stats()}")
+    if args.metrics_out:
+        Path(args.metrics_out).write_text(metrics.render(), encoding="utf-8")
+        print(f"Метрики сохранены в {args.metrics_out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
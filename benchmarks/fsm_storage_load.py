@@ -0,0 +1,110 @@
+"""Нагрузочный тест хранилища состояний FSM
+
+Заполняет SQLiteStorage состояниями N активных пользователей и измеряет
+задержку get_state/set_state/get_data/update_data при параллельной нагрузке.
+
+Запуск:
+    python benchmarks/fsm_storage_load.py --users 100000 --ops 50000 --concurrency 200
+    python benchmarks/fsm_storage_load.py --users 2000 --ops 20000 --cache-size 0
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram.fsm.storage.base import StorageKey
+
+from services.fsm_storage import FSM_CACHE_SIZE, SQLiteStorage
+
+BOT_ID = 1
+
+# Состояние ожидания даты рождения после оплаты (PaymentStates.waiting_for_birthdate)
+WAITING_FOR_BIRTHDATE = "PaymentStates:waiting_for_birthdate"
+
+
+def percentile(values, q):
+    """Возвращает перцентиль q (0..100) отсортированного списка"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def populate(storage, users):
+    """Заполняет хранилище состояниями ожидания даты рождения"""
+    started = time.perf_counter()
+    for user_id in range(users):
+        key = StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+        await storage.set_state(key, WAITING_FOR_BIRTHDATE)
+        await storage.set_data(key, {"is_free_user": False})
+    await storage.flush()
+    return time.perf_counter() - started
+
+
+async def run_load(storage, users, ops, concurrency):
+    """Выполняет ops случайных операций в concurrency параллельных задачах"""
+    latencies = {"get_state": [], "set_state": [], "get_data": [], "update_data": []}
+    remaining = [ops]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            user_id = random.randrange(users)
+            key = StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+            op = random.choice(list(latencies))
+            started = time.perf_counter()
+            if op == "get_state":
+                await storage.get_state(key)
+            elif op == "set_state":
+                await storage.set_state(key, WAITING_FOR_BIRTHDATE)
+            elif op == "get_data":
+                await storage.get_data(key)
+            else:
+                await storage.update_data(key, {"birthdate": "01.01.1990"})
+            latencies[op].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await storage.flush()
+    return time.perf_counter() - started, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000, help="Количество активных пользователей")
+    parser.add_argument("--ops", type=int, default=50_000, help="Количество операций")
+    parser.add_argument("--concurrency", type=int, default=200, help="Количество параллельных задач")
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="Интервал объединения записей")
+    parser.add_argument("--cache-size", type=int, default=FSM_CACHE_SIZE,
+                        help="Сколько прочитанных состояний держать в памяти (0 - без кэша)")
+    parser.add_argument("--db", type=str, default=None, help="Путь к базе (по умолчанию временный файл)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or Path(tmp) / "fsm.sqlite3"
+        storage = SQLiteStorage(path=path, flush_interval=args.flush_interval, cache_size=args.cache_size)
+
+        populate_time = await populate(storage, args.users)
+        print(f"Заполнение {args.users} пользователей: {populate_time:.2f} с")
+
+        total_time, latencies = await run_load(storage, args.users, args.ops, args.concurrency)
+        print(f"{args.ops} операций за {total_time:.2f} с ({args.ops / total_time:.0f} оп/с), "
+              f"параллельность {args.concurrency}")
+        print(f"{'операция':<12} {'кол-во':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'среднее':>9}")
+        for op, values in latencies.items():
+            values.sort()
+            print(f"{op:<12} {len(values):>8} {percentile(values, 50):>9.3f} {percentile(values, 95):>9.3f} "
+                  f"{percentile(values, 99):>9.3f} {statistics.fmean(values) if values else 0:>9.3f}")
+
+        await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Микробенчмарк накладных расходов метрик
+
+Измеряет стоимость одного события: увеличения счетчика, наблюдения в
+гистограмме и прохода обновления через middleware метрик по сравнению с
+вызовом обработчика без него. Бюджет - меньше микросекунды на событие.
+
+Запуск:
+    python benchmarks/metrics_overhead_bench.py --iterations 200000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.metrics import Counter, HandlerMetricsMiddleware, Histogram, observe_llm_call
+
+
+class _Handler:
+    """Заглушка HandlerObject: middleware берет из нее имя обработчика"""
+
+    @staticmethod
+    async def callback():
+        return None
+
+
+def measure(func, iterations):
+    """Возвращает время одного вызова func() в наносекундах"""
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+async def measure_async(func, iterations):
+    """Возвращает время одного await func() в наносекундах"""
+    await func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="Количество событий в каждом замере")
+    args = parser.parse_args()
+
+    counter = Counter("bench_total", "Бенчмарк", ("method", "outcome"))
+    histogram = Histogram("bench_seconds", "Бенчмарк", ("handler",))
+    labels = ("sendMessage", "ok")
+
+    async def handler(event, data):
+        return None
+
+    middleware = HandlerMetricsMiddleware()
+    data = {"handler": _Handler()}
+
+    rows = [
+        ("Counter.inc", measure(lambda: counter.inc(labels), args.iterations)),
+        ("Histogram.observe", measure(lambda: histogram.observe(0.37, ("start_command",)), args.iterations)),
+        ("хук запроса к OpenAI", measure(lambda: observe_llm_call("complete", 0.8, None, None), args.iterations)),
+    ]
+    bare = await measure_async(lambda: handler(None, data), args.iterations)
+    wrapped = await measure_async(lambda: middleware(handler, None, data), args.iterations)
+    rows.append(("middleware обработчика", wrapped - bare))
+
+    print(f"{'событие':<26} {'нс/событие':>11}")
+    for name, nanoseconds in rows:
+        print(f"{name:<26} {nanoseconds:>11.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,434 @@
+"""Локальные заглушки OpenAI API и Telegram Bot API для нагрузочных тестов
+
+Заглушка OpenAI отвечает на POST /v1/chat/completions (в том числе потоково и
+с n > 1) правдоподобным JSON по ключам, которые просит промпт, с задержкой из
+заданного распределения и с внедрением ошибок, зависаний и испорченных ответов.
+
+Заглушка Telegram отвечает на /bot<token>/<метод> как настоящий Bot API и
+записывает все отправки и редактирования по чатам. Статистика доступна по
+GET /_stats, сброс - POST /_reset.
+
+Коллектор трассировки принимает спаны в формате OTLP/HTTP JSON на
+POST /v1/traces (TRACING=otlp) и дописывает их в JSONL-файл, который читает
+benchmarks/trace_report.py.
+
+Распределение задержки задается строкой:
+    fixed:0.5            - всегда 0.5 с
+    uniform:0.2,1.5      - равномерно от 0.2 до 1.5 с
+    lognormal:0.8,0.5    - логнормальное с медианой 0.8 с и sigma 0.5
+    exp:0.5              - экспоненциальное со средним 0.5 с
+
+Запуск:
+    python benchmarks/mock_servers.py openai --port 8081 --latency lognormal:0.8,0.5 --error-rate 0.02
+    python benchmarks/mock_servers.py telegram --port 8082 --latency fixed:0.03
+    python benchmarks/mock_servers.py collector --port 4318 --trace-file data/traces.jsonl
+
+Бот подключается к заглушкам через OPENAI_BASE_URL=http://127.0.0.1:8081/v1 и
+TelegramAPIServer.from_base("http://127.0.0.1:8082") (см. bot_load_test.py).
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiohttp import web
+
+from services.tracing import from_otlp
+
+# Сколько символов отдавать в одном фрагменте потокового ответа
+STREAM_CHUNK_CHARS = 24
+
+# Ключи JSON в шаблоне ответа из промпта: "summary": "..."
+_KEY_PATTERN = re.compile(r'"(\w+)"\s*:')
+# Количество объектов в пакетном промпте: "JSON-массива из 5 объектов"
+_BATCH_PATTERN = re.compile(r'JSON-массива из (\d+)')
+
+# Фразы, из которых собираются тексты ответов
+_PHRASES = [
+    "Карты советуют не торопиться с выводами.",
+    "Звезды намекают на приятный вечер в хорошей компании.",
+    "Впереди неожиданная встреча и бокал чего-нибудь игристого.",
+    "Сегодня интуиция сильнее логики, особенно после второго бокала.",
+    "Маленький шаг сейчас обернется большим праздником потом.",
+    "Не спорьте с судьбой, лучше закажите еще один коктейль.",
+]
+
+
+def parse_latency(spec):
+    """Возвращает функцию без аргументов, выдающую задержку по строке распределения
+
+    Raises:
+        ValueError: если распределение неизвестно или параметры некорректны
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Некорректное распределение задержки: {spec}")
+
+
+def _sentence(words=2):
+    return " ".join(random.choice(_PHRASES) for _ in range(words))
+
+
+def _fake_object(keys):
+    return {key: _sentence() for key in keys}
+
+
+def fake_content(prompt):
+    """Собирает ответ модели по промпту: JSON с запрошенными ключами или обычный текст"""
+    if "Схема:" in prompt:
+        # Промпт исправления ответа: ключи берем из JSON Schema
+        schema_line = prompt.split("Схема:", 1)[1].strip().splitlines()[0]
+        try:
+            keys = list(json.loads(schema_line).get("properties", {}))
+        except ValueError:
+            keys = []
+        return json.dumps(_fake_object(keys), ensure_ascii=False)
+    keys = list(dict.fromkeys(_KEY_PATTERN.findall(prompt)))
+    if not keys:
+        return _sentence(3)
+    batch = _BATCH_PATTERN.search(prompt)
+    if batch:
+        return json.dumps([_fake_object(keys) for _ in range(int(batch.group(1)))], ensure_ascii=False)
+    return json.dumps(_fake_object(keys), ensure_ascii=False)
+
+
+def _count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class OpenAIMockConfig:
+    """Настройки заглушки OpenAI
+
+    Args:
+        latency: Распределение времени до ответа (до первого фрагмента при потоковом ответе)
+        chunk_delay: Пауза между фрагментами потокового ответа в секундах
+        error_rate: Доля запросов, завершающихся ошибкой error_status
+        error_status: HTTP-статус внедряемой ошибки
+        hang_rate: Доля запросов, которые зависают на hang_seconds (проверка таймаутов)
+        hang_seconds: Длительность зависания
+        malformed_rate: Доля ответов, обрезанных посередине (проверка исправления JSON)
+    """
+    latency: str = "lognormal:0.8,0.5"
+    chunk_delay: float = 0.02
+    error_rate: float = 0.0
+    error_status: int = 500
+    hang_rate: float = 0.0
+    hang_seconds: float = 120.0
+    malformed_rate: float = 0.0
+    counters: Counter = field(default_factory=Counter)
+
+
+def create_openai_app(config=None):
+    """Создает aiohttp-приложение заглушки OpenAI API"""
+    config = config or OpenAIMockConfig()
+    sample_latency = parse_latency(config.latency)
+    counters = config.counters
+
+    def make_content(prompt):
+        content = fake_content(prompt)
+        if config.malformed_rate and random.random() < config.malformed_rate:
+            counters["malformed"] += 1
+            content = content[:len(content) // 2]
+        return content
+
+    async def chat_completions(request):
+        body = await request.json()
+        counters["requests"] += 1
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        model = body.get("model", "mock")
+        n = int(body.get("n") or 1)
+        created = int(time.time())
+        completion_id = f"chatcmpl-mock-{counters['requests']}"
+
+        roll = random.random()
+        if roll < config.hang_rate:
+            counters["hangs"] += 1
+            await asyncio.sleep(config.hang_seconds)
+        elif roll < config.hang_rate + config.error_rate:
+            counters["errors"] += 1
+            await asyncio.sleep(sample_latency() / 4)
+            return web.json_response(
+                {"error": {"message": "Внедренная ошибка заглушки", "type": "server_error", "code": None}},
+                status=config.error_status
+            )
+        await asyncio.sleep(sample_latency())
+
+        contents = [make_content(prompt) for _ in range(n)]
+        usage = {
+            "prompt_tokens": _count_tokens(prompt),
+            "completion_tokens": sum(_count_tokens(content) for content in contents),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        counters["prompt_tokens"] += usage["prompt_tokens"]
+        counters["completion_tokens"] += usage["completion_tokens"]
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": index, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                    for index, content in enumerate(contents)
+                ],
+                "usage": usage
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(choices, **extra):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+
+        content = contents[0]
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            await send([{"index": 0, "delta": {"content": content[start:start + STREAM_CHUNK_CHARS]},
+                         "finish_reason": None}])
+            if config.chunk_delay:
+                await asyncio.sleep(config.chunk_delay)
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        # Как и API, расход токенов потока - отдельным последним фрагментом без choices
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], usage=usage)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def get_stats(request):
+        return web.json_response(dict(counters))
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/_stats", get_stats)
+    return app
+
+
+@dataclass
+class TelegramMockConfig:
+    """Настройки заглушки Telegram Bot API
+
+    Args:
+        latency: Распределение времени ответа на запрос
+        flood_rate: Доля запросов, на которые отвечаем 429 Too Many Requests
+        retry_after: retry_after в ответе 429 в секундах
+    """
+    latency: str = "fixed:0.03"
+    flood_rate: float = 0.0
+    retry_after: int = 1
+
+
+class TelegramRecorder:
+    """Записанные запросы к заглушке Telegram: методы по чатам и время запросов"""
+
+    # Методы, которые показывают пользователю новое или измененное сообщение
+    MESSAGE_METHODS = frozenset({"sendMessage", "editMessageText", "sendInvoice", "sendPhoto", "sendAnimation"})
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.methods = Counter()
+        self.by_chat = defaultdict(Counter)
+        self.floods = 0
+        self._message_id = 0
+
+    def next_message_id(self):
+        self._message_id += 1
+        return self._message_id
+
+    def record(self, method, chat_id):
+        self.methods[method] += 1
+        if chat_id is not None:
+            self.by_chat[chat_id][method] += 1
+
+    def messages(self, chat_id=None):
+        """Количество отправленных и отредактированных сообщений (всего или в чате)"""
+        counters = self.methods if chat_id is None else self.by_chat.get(chat_id, Counter())
+        return sum(count for method, count in counters.items() if method in self.MESSAGE_METHODS)
+
+    def stats(self):
+        return {
+            "methods": dict(self.methods),
+            "chats": len(self.by_chat),
+            "messages": self.messages(),
+            "floods": self.floods
+        }
+
+
+def _parse_value(value):
+    """Параметры приходят формой: вложенные объекты aiogram сериализует в JSON"""
+    if isinstance(value, str) and value[:1] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def create_telegram_app(config=None, recorder=None):
+    """Создает aiohttp-приложение заглушки Telegram Bot API
+
+    Args:
+        config: TelegramMockConfig
+        recorder: TelegramRecorder, в который записываются запросы (для встраивания в тесты)
+    """
+    config = config or TelegramMockConfig()
+    recorder = recorder or TelegramRecorder()
+    sample_latency = parse_latency(config.latency)
+
+    def message(chat_id, **fields):
+        return {
+            "message_id": int(fields.pop("message_id", None) or recorder.next_message_id()),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **fields
+        }
+
+    async def bot_method(request):
+        method = request.match_info["method"]
+        params = {key: _parse_value(value) for key, value in (await request.post()).items()}
+        if not params and request.content_type == "application/json":
+            params = await request.json()
+        chat_id = params.get("chat_id")
+        chat_id = int(chat_id) if chat_id is not None else None
+
+        delay = sample_latency()
+        if delay:
+            await asyncio.sleep(delay)
+        if config.flood_rate and chat_id is not None and random.random() < config.flood_rate:
+            recorder.floods += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {config.retry_after}",
+                "parameters": {"retry_after": config.retry_after}
+            })
+        recorder.record(method, chat_id)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Mock Tarot", "username": "mock_tarot_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = message(chat_id, message_id=params.get("message_id"), text=params.get("text", ""))
+        elif method == "sendInvoice":
+            result = message(chat_id, invoice={
+                "title": params.get("title", ""),
+                "description": params.get("description", ""),
+                "start_parameter": params.get("start_parameter", ""),
+                "currency": params.get("currency", "XTR"),
+                "total_amount": sum(price.get("amount", 0) for price in params.get("prices") or [])
+            })
+        elif method == "getUpdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def get_stats(request):
+        return web.json_response(recorder.stats())
+
+    async def reset(request):
+        recorder.reset()
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", bot_method)
+    app.router.add_get("/_stats", get_stats)
+    app.router.add_post("/_reset", reset)
+    return app
+
+
+def create_collector_app(path):
+    """Создает aiohttp-приложение коллектора трассировки, дописывающего спаны в JSONL-файл path"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    async def traces(request):
+        spans = from_otlp(await request.json())
+        with path.open("a", encoding="utf-8") as file:
+            file.writelines(json.dumps(span, ensure_ascii=False) + "\n" for span in spans)
+        return web.json_response({"partialSuccess": {}})
+
+    app = web.Application()
+    app.router.add_post("/v1/traces", traces)
+    return app
+
+
+async def start_app(app, host="127.0.0.1", port=0):
+    """Запускает приложение в текущем цикле событий
+
+    Returns:
+        (runner, base_url); остановка - await runner.cleanup()
+    """
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("server", choices=["openai", "telegram", "collector"], help="Какую заглушку запустить")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default=None, help="Распределение задержки ответа")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="OpenAI: пауза между фрагментами потока")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="OpenAI: доля ответов с ошибкой")
+    parser.add_argument("--error-status", type=int, default=500, help="OpenAI: HTTP-статус ошибки")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="OpenAI: доля зависающих запросов")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="OpenAI: доля обрезанных ответов")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Telegram: доля ответов 429")
+    parser.add_argument("--trace-file", default="data/traces.jsonl", help="Коллектор: файл для спанов")
+    args = parser.parse_args()
+
+    if args.server == "openai":
+        app = create_openai_app(OpenAIMockConfig(
+            latency=args.latency or OpenAIMockConfig.latency,
+            chunk_delay=args.chunk_delay,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            hang_rate=args.hang_rate,
+            malformed_rate=args.malformed_rate
+        ))
+    elif args.server == "collector":
+        app = create_collector_app(args.trace_file)
+    else:
+        app = create_telegram_app(TelegramMockConfig(
+            latency=args.latency or TelegramMockConfig.latency,
+            flood_rate=args.flood_rate
+        ))
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Сравнение полных и компактных промптов: токены на входе и выходе, задержка и доля разобранных ответов
+
+Для каждого промпта из реестра (standard, premium, astro, premium_cards, batch, test, message)
+выполняет --calls запросов с полным и компактным вариантом шаблона поочередно,
+с одинаковым статическим max_tokens, и выводит средние токены промпта (по
+локальному подсчету и по usage API), токены ответа, p50/p95 задержки и долю
+ответов, которые разбираются по схеме.
+
+По умолчанию запросы идут на локальную заглушку OpenAI из mock_servers.py: так
+проверяется, что компактные шаблоны собираются и их ответы разбираются, но
+размер ответа и задержка заглушки от промпта не зависят. Для настоящих цифр
+укажите --api (используются OPENAI_API_KEY и OPENAI_BASE_URL из окружения).
+
+Запуск:
+    python benchmarks/prompt_budget_bench.py --calls 5
+    python benchmarks/prompt_budget_bench.py --api --calls 20 --prompts premium standard
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.mock_servers import OpenAIMockConfig, create_openai_app, start_app
+from handlers.tarot_handlers import (
+    ASTRO_PROMPT, BATCH_PROMPT, MESSAGE_PROMPT, PREMIUM_CARDS_PROMPT, PREMIUM_PROMPT, STANDARD_PROMPT, TEST_PROMPT,
+    build_astro_facts, build_batch_interpretation_prompt, build_interpretation_prompt, build_premium_cards_prompt,
+    draw_tarot_cards, parse_batch_interpretations
+)
+from services import generation_service, prompt_registry, tarot_deck
+from services.reading_schema import (
+    AstroSections, ModelOutputError, PremiumInterpretation, StandardInterpretation, TestReadingMessage, parse_output
+)
+
+# Промпты, которые можно сравнить
+PROMPTS = ["standard", "premium", "astro", "premium_cards", "batch", "test", "message"]
+
+# Сколько раскладов в одном пакетном запросе
+BATCH_SIZE = 5
+
+
+def random_birthdate():
+    return f"{random.randint(1, 28):02d}.{random.randint(1, 12):02d}.{random.randint(1950, 2005)}"
+
+
+def make_request(name):
+    """Собирает промпт текущего варианта и функцию проверки ответа
+
+    Returns:
+        (промпт, max_tokens, check), где check(text) бросает ModelOutputError, если ответ не разобран
+    """
+    if name == "standard":
+        prompt = build_interpretation_prompt(draw_tarot_cards(3))
+        return prompt, STANDARD_PROMPT.limit, partial(parse_output, schema=StandardInterpretation)
+    if name == "premium":
+        prompt = build_interpretation_prompt(draw_tarot_cards(3), random_birthdate())
+        return prompt, PREMIUM_PROMPT.limit, partial(parse_output, schema=PremiumInterpretation)
+    if name == "astro":
+        birthdate = random_birthdate()
+        prompt = ASTRO_PROMPT.render(birthdate=birthdate, facts=build_astro_facts(birthdate))
+        return prompt, ASTRO_PROMPT.limit, partial(parse_output, schema=AstroSections)
+    if name == "premium_cards":
+        prompt = build_premium_cards_prompt(draw_tarot_cards(3), random_birthdate())
+        return prompt, PREMIUM_CARDS_PROMPT.limit, partial(parse_output, schema=PremiumInterpretation)
+    if name == "batch":
+        card_sets = [draw_tarot_cards(3) for _ in range(BATCH_SIZE)]
+
+        def check(text):
+            if len(parse_batch_interpretations(text, card_sets)) < BATCH_SIZE:
+                raise ModelOutputError(text, "Разобраны не все расклады пачки")
+
+        return build_batch_interpretation_prompt(card_sets), BATCH_PROMPT.limit * BATCH_SIZE, check
+    if name == "test":
+        prompt = TEST_PROMPT.render(card_name=tarot_deck.draw(1)[0].name)
+        return prompt, TEST_PROMPT.limit, partial(parse_output, schema=TestReadingMessage)
+    return MESSAGE_PROMPT.render(), MESSAGE_PROMPT.limit, None
+
+
+def percentile(values, q):
+    """Возвращает перцентиль q (0..100) отсортированного списка"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_call(name, variant, row):
+    """Выполняет один запрос варианта variant и добавляет замеры в row"""
+    prompt_registry.PROMPT_VARIANT = variant
+    prompt, max_tokens, check = make_request(name)
+    usage_before = dict(generation_service.usage)
+    started = time.perf_counter()
+    try:
+        text = await generation_service.complete(prompt, temperature=0.7, max_tokens=max_tokens, coalesce=False)
+    except Exception as e:
+        row["errors"] += 1
+        print(f"{name}/{variant}: ошибка запроса: {type(e).__name__}: {e}")
+        return
+    row["latencies"].append(time.perf_counter() - started)
+    row["local_tokens"] += prompt_registry.count_tokens(prompt)
+    row["prompt_tokens"] += generation_service.usage["prompt_tokens"] - usage_before["prompt_tokens"]
+    row["completion_tokens"] += generation_service.usage["completion_tokens"] - usage_before["completion_tokens"]
+    try:
+        if check is not None:
+            check(text)
+        row["parsed"] += 1
+    except ModelOutputError:
+        pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5, help="Количество запросов на промпт и вариант")
+    parser.add_argument("--prompts", nargs="+", default=PROMPTS, choices=PROMPTS, help="Какие промпты сравнивать")
+    parser.add_argument("--api", action="store_true", help="Запросы к настроенному API вместо локальной заглушки")
+    parser.add_argument("--openai-latency", default="lognormal:0.8,0.5", help="Задержка заглушки OpenAI")
+    args = parser.parse_args()
+
+    runner = None
+    if not args.api:
+        runner, openai_url = await start_app(create_openai_app(OpenAIMockConfig(latency=args.openai_latency)))
+        # Клиент OpenAI создается при первом запросе и берет адрес из окружения
+        os.environ['OPENAI_BASE_URL'] = f"{openai_url.rstrip('/')}/v1"
+        os.environ.setdefault('OPENAI_API_KEY', 'prompt-bench')
+
+    print(prompt_registry.report())
+    rows = {}
+    try:
+        for name in args.prompts:
+            for variant in ("full", "compact"):
+                rows[name, variant] = {"latencies": [], "errors": 0, "parsed": 0, "local_tokens": 0,
+                                       "prompt_tokens": 0, "completion_tokens": 0}
+            # Варианты чередуются, чтобы колебания задержки API влияли на оба одинаково
+            for _ in range(args.calls):
+                for variant in ("full", "compact"):
+                    await run_call(name, variant, rows[name, variant])
+    finally:
+        await generation_service.close()
+        if runner is not None:
+            await runner.cleanup()
+
+    print(f"\n{'промпт':<13} {'вариант':<8} {'ответов':>8} {'разобрано':>10} {'вход (лок.)':>12} "
+          f"{'вход (API)':>11} {'выход':>7} {'p50, с':>7} {'p95, с':>7}")
+    for (name, variant), row in rows.items():
+        done = len(row["latencies"]) or 1
+        latencies = sorted(row["latencies"])
+        print(f"{name:<13} {variant:<8} {len(row['latencies']):>8} {row['parsed'] / done:>10.0%} "
+              f"{row['local_tokens'] / done:>12.0f} {row['prompt_tokens'] / done:>11.0f} "
+              f"{row['completion_tokens'] / done:>7.0f} {percentile(latencies, 50):>7.2f} "
+              f"{percentile(latencies, 95):>7.2f}")
+    print("\nЭкономия компактного варианта:")
+    for name in args.prompts:
+        full, compact = rows[name, "full"], rows[name, "compact"]
+        if not full["prompt_tokens"] or not compact["latencies"]:
+            continue
+        full_in = full["prompt_tokens"] / len(full["latencies"])
+        compact_in = compact["prompt_tokens"] / len(compact["latencies"])
+        print(f"{name:<13} вход {1 - compact_in / full_in:>6.1%}, "
+              f"изменение p50 {percentile(sorted(compact['latencies']), 50) - percentile(sorted(full['latencies']), 50):+.2f} с")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
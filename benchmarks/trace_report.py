@@ -0,0 +1,142 @@
+"""Отчет по критическому пути самых медленных раскладов
+
+Читает спаны из JSONL-файла (TRACING=jsonl, коллектор из mock_servers.py или
+bot_load_test.py --trace-file), выбирает N самых медленных обновлений с
+обработчиками раскладов и для каждого выводит критический путь: цепочку
+спанов, из-за которых обработка длилась столько, сколько длилась. Время, когда
+ни один дочерний спан не выполнялся, относится к самому родителю (self).
+
+В конце печатается сводка по категориям (llm, sleep, telegram, queue_wait,
+handler/update self) для всех выбранных раскладов.
+
+Запуск:
+    python benchmarks/trace_report.py data/traces.jsonl --top 5
+    python benchmarks/trace_report.py data/traces.jsonl --handler test_tarot_reading --top 10
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+# Обработчики, которые показывают расклад
+READING_HANDLERS = [
+    "process_birthdate_after_payment", "process_birthdate", "successful_payment_handler",
+    "start_tarot_reading", "test_tarot_reading"
+]
+
+
+def load_spans(path):
+    """Читает спаны из JSONL-файла, пропуская поврежденные строки"""
+    spans = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def category(span):
+    return span["name"].split(".", 1)[0]
+
+
+def label(span):
+    """Имя спана для отчета: обработчик или длительность паузы"""
+    attrs = span["attrs"]
+    if "handler" in attrs:
+        return f"{span['name']}:{attrs['handler']}"
+    if span["name"] == "sleep":
+        return f"sleep {attrs.get('seconds', 0):.2f}"
+    return span["name"]
+
+
+def critical_path(span, children, end=None):
+    """Возвращает критический путь спана: список (спан, собственное время на пути) в порядке времени
+
+    Дочерние спаны перебираются от позднего окончания к раннему: на путь
+    попадает тот, что закончился последним, затем тот, что закончился до его
+    начала, и так далее. Промежутки между ними - собственное время родителя.
+    """
+    end = span["end"] if end is None else min(end, span["end"])
+    cursor = end
+    segments = []
+    for child in sorted(children.get(span["span_id"], []), key=lambda item: min(item["end"], end), reverse=True):
+        if child["start"] >= cursor:
+            # Ребенок целиком перекрыт уже выбранным (выполнялся параллельно)
+            continue
+        child_end = min(child["end"], cursor)
+        if cursor > child_end:
+            segments.append((span, cursor - child_end))
+        segments.extend(reversed(critical_path(child, children, child_end)))
+        cursor = child["start"]
+    if cursor > span["start"]:
+        segments.append((span, cursor - span["start"]))
+    segments.reverse()
+    return segments
+
+
+def merge(segments):
+    """Склеивает соседние отрезки одного и того же спана"""
+    merged = []
+    for span, duration in segments:
+        if merged and merged[-1][0] is span:
+            merged[-1] = (span, merged[-1][1] + duration)
+        else:
+            merged.append((span, duration))
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSONL-файл со спанами")
+    parser.add_argument("--top", type=int, default=5, help="Сколько самых медленных раскладов разобрать")
+    parser.add_argument("--handler", nargs="+", default=READING_HANDLERS, help="Обработчики раскладов")
+    parser.add_argument("--min-segment", type=float, default=0.005,
+                        help="Не показывать отрезки пути короче стольких секунд")
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    children = defaultdict(list)
+    roots = []
+    handlers = {}
+    for span in spans:
+        if span["parent_id"] is None:
+            roots.append(span)
+        else:
+            children[span["parent_id"]].append(span)
+        if span["name"] == "handler":
+            handlers[span["trace_id"]] = span["attrs"].get("handler")
+
+    readings = [root for root in roots if handlers.get(root["trace_id"]) in args.handler]
+    if not readings:
+        print(f"В {args.path} нет трасс с обработчиками {', '.join(args.handler)} ({len(spans)} спанов)")
+        sys.exit(1)
+    readings.sort(key=lambda root: root["end"] - root["start"], reverse=True)
+    durations = sorted(root["end"] - root["start"] for root in readings)
+    print(f"Раскладов: {len(readings)}, p50 {durations[len(durations) // 2]:.2f} с, "
+          f"максимум {durations[-1]:.2f} с")
+
+    totals = defaultdict(float)
+    total_time = 0.0
+    for root in readings[:args.top]:
+        duration = root["end"] - root["start"]
+        total_time += duration
+        print(f"\nТрасса {root['trace_id']} ({handlers[root['trace_id']]}, "
+              f"пользователь {root['attrs'].get('user_id')}): {duration:.2f} с")
+        for span, segment in merge(critical_path(root, children)):
+            name = category(span)
+            key = f"{name} self" if span["span_id"] == root["span_id"] or name == "handler" else name
+            totals[key] += segment
+            if segment >= args.min_segment:
+                offset = span["start"] - root["start"]
+                print(f"  +{offset:7.2f} с  {segment:7.3f} с  {label(span)}")
+
+    print(f"\nКритический путь {min(args.top, len(readings))} самых медленных раскладов по категориям:")
+    print(f"{'категория':<16} {'секунд':>9} {'доля':>7}")
+    for name, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        print(f"{name:<16} {seconds:>9.2f} {seconds / total_time:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Микробенчмарк готовых клавиатур и шаблонов сообщений
+
+Сравнивает то, что обработчик делал на каждое обновление раньше (сборка
+InlineKeyboardBuilder и f-строки), с выборкой из реестра services/ui_templates.
+Для каждого варианта выводится время и объем выделенной памяти на вызов.
+
+Запуск:
+    python benchmarks/ui_templates_bench.py --iterations 20000
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from services.ui_templates import CARD, KEYBOARDS, TEXTS, WELCOME
+
+CARD_DATA = {
+    "name": "Шут",
+    "description": "Новые начинания и приключения",
+    "drunk_interpretation": "Время для спонтанных решений и веселья!"
+}
+
+
+def builder_after_reading():
+    """Клавиатура после расклада, как ее собирали обработчики"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔮 Сделать новый расклад", callback_data="start_reading")
+    builder.button(text="🏠 Вернуться в меню", callback_data="return_to_menu")
+    builder.adjust(1)
+    return "Хотите сделать новый расклад или вернуться в главное меню?", builder.as_markup()
+
+
+def registry_after_reading():
+    return TEXTS["new_reading_or_menu"], KEYBOARDS["after_reading"]
+
+
+def builder_welcome(remaining_tests=2, max_tests=3):
+    """Приветствие /start, как его собирал обработчик"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔮 Начать гадать", callback_data="start_reading")
+    builder.button(text="🌟 Индивидуальное гадание", callback_data="premium_reading")
+    builder.button(text="🧪 Тест", callback_data="test_reading")
+    builder.adjust(1, 1, 1)
+    text = (
+        "🔮 <b>Добро пожаловать в Пьяное Таро!</b> 🍸\n\n"
+        "Я - бот-таролог с алкогольным уклоном. Я могу погадать вам на картах Таро "
+        "и дать интерпретацию с алкогольной тематикой.\n\n"
+        f"У вас осталось <b>{remaining_tests} из {max_tests}</b> бесплатных тестовых раскладов.\n\n"
+        "Нажмите кнопку ниже, чтобы начать гадание:"
+    )
+    return text, builder.as_markup()
+
+
+def registry_welcome(remaining_tests=2):
+    return WELCOME.render(remaining_tests=remaining_tests), KEYBOARDS["main_menu"]
+
+
+def fstring_card(card=CARD_DATA):
+    return (
+        f"🃏 *{card['name']}*\n\n"
+        f"{card['description']}\n\n"
+        f"🍸 *Алкогольная интерпретация:*\n{card['drunk_interpretation']}"
+    )
+
+
+def template_card(card=CARD_DATA):
+    return CARD.render(card)
+
+
+def measure(func, iterations):
+    """Возвращает время (мкс) и выделенную память (байт) на один вызов"""
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call = (time.perf_counter() - started) / iterations * 1_000_000
+
+    # Память считаем отдельно: tracemalloc сильно замедляет вызовы
+    sample = min(iterations, 1000)
+    tracemalloc.start()
+    results = [func() for _ in range(sample)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return per_call, allocated / sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000, help="Количество вызовов каждого варианта")
+    args = parser.parse_args()
+
+    cases = [
+        ("клавиатура после расклада", builder_after_reading, registry_after_reading),
+        ("приветствие /start", builder_welcome, registry_welcome),
+        ("сообщение карты", fstring_card, template_card),
+    ]
+    print(f"{'сообщение':<28} {'вариант':<10} {'мкс/вызов':>10} {'байт/вызов':>11}")
+    for name, before, after in cases:
+        for label, func in (("сборка", before), ("реестр", after)):
+            per_call, allocated = measure(func, args.iterations)
+            print(f"{name:<28} {label:<10} {per_call:>10.2f} {allocated:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
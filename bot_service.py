@@ -1,10 +1,47 @@
 import os
 import sys
 import time
+import zlib
+import signal
+import asyncio
 import logging
+import argparse
+import threading
 import subprocess
+import multiprocessing
+from collections import OrderedDict
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Количество процессов-обработчиков (1 - один процесс main.py, как раньше)
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 1))
+
+# Максимальное количество обновлений, отправленных обработчикам и еще не обработанных
+BOT_MAX_IN_FLIGHT = int(os.getenv('BOT_MAX_IN_FLIGHT', 1000))
+
+# Сколько секунд бот дорабатывает полученные обновления при остановке (см. services/polling.py)
+BOT_DRAIN_TIMEOUT = float(os.getenv('BOT_DRAIN_TIMEOUT', 30))
+
+# Сколько секунд сверх BOT_DRAIN_TIMEOUT ждать завершения бота, прежде чем убить процесс
+BOT_KILL_GRACE = 10
+
+# Пауза перед перезапуском после быстрого падения: от минимальной, удваивается до максимальной
+BOT_RESTART_MIN_DELAY = float(os.getenv('BOT_RESTART_MIN_DELAY', 0.5))
+BOT_RESTART_MAX_DELAY = float(os.getenv('BOT_RESTART_MAX_DELAY', 60))
+
+# Если бот проработал дольше, падение не считается циклом и перезапуск мгновенный
+BOT_RESTART_RESET_AFTER = float(os.getenv('BOT_RESTART_RESET_AFTER', 60))
+
+# Интервал проверки процессов-обработчиков в секундах
+WORKER_CHECK_INTERVAL = 0.2
+
+# Как часто обработчики присылают получателю снимок своих метрик (в секундах)
+WORKER_METRICS_INTERVAL = 5
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -12,16 +49,21 @@ logging.basicConfig(
     filename='bot_service.log'
 )
 
-def start_bot():
+def start_bot(profile_startup=False):
     """Запускает бота в режиме long polling (быстрее для локального использования)"""
     try:
         # Путь к директории проекта
         project_dir = Path(__file__).parent
         
-        # Запуск бота через main.py (long polling)
+        # Запуск бота через main.py (long polling); время перезапуска нужно боту,
+        # чтобы сообщить, через сколько после него пришло первое обновление
+        args = [sys.executable, os.path.join(project_dir, "main.py")]
+        if profile_startup:
+            args.append("--profile-startup")
         bot_process = subprocess.Popen(
-            [sys.executable, os.path.join(project_dir, "main.py")],
-            cwd=project_dir
+            args,
+            cwd=project_dir,
+            env={**os.environ, "BOT_RESTART_AT": str(time.time())}
         )
         
         logging.info(f"Бот запущен с PID: {bot_process.pid}")
@@ -30,27 +72,360 @@ def start_bot():
         logging.error(f"Ошибка при запуске бота: {e}")
         return None
 
+def shard_for(update, shards):
+    """Возвращает номер обработчика для обновления (все обновления чата - одному обработчику)"""
+    from services.update_queue import update_order_key
+    return zlib.crc32(update_order_key(update).encode('utf-8')) % shards
+
+
+async def feed_and_ack(feed, acks, index, update_id):
+    """Обрабатывает обновление и сообщает получателю, что его можно забыть
+
+    Обновление, завершившееся ошибкой, тоже подтверждается: повторно оно не
+    выполняется. Прерванное отменой (остановка после BOT_DRAIN_TIMEOUT) не
+    подтверждается: получатель оставляет его неподтвержденным в Telegram.
+
+    Args:
+        feed: Функция без аргументов, возвращающая корутину обработки
+        acks: Очередь подтверждений получателя
+        index: Номер обработчика
+        update_id: Номер обновления
+    """
+    try:
+        await feed()
+    except Exception:
+        acks.put(('ack', index, update_id))
+        raise
+    acks.put(('ack', index, update_id))
+
+
+async def _run_worker(inbox, acks, index, global_rate):
+    from aiogram import types
+    from main import bot, dp, scheduler
+    from services import metrics
+    from services.polling import log_first_update
+    from services.update_queue import UpdateQueue
+
+    # Все обработчики отправляют сообщения от имени одного бота: общий лимит делится между ними
+    scheduler.set_global_rate(global_rate)
+    first = True
+
+    async def handle(update):
+        nonlocal first
+        if first:
+            log_first_update()
+            first = False
+        await feed_and_ack(lambda: dp.feed_update(bot=bot, update=update), acks, index, update.update_id)
+
+    async def push_metrics():
+        # Метрики обработчика отдает сервер /metrics получателя
+        while True:
+            acks.put(('metrics', index, metrics.collect()))
+            await asyncio.sleep(WORKER_METRICS_INTERVAL)
+
+    # Порядок внутри чата соблюдается и внутри процесса: очередь с полосами по чатам
+    queue = UpdateQueue(handler=handle, max_size=BOT_MAX_IN_FLIGHT + 1)
+    await dp.emit_startup(bot=bot)
+    queue.start()
+    pusher = asyncio.create_task(push_metrics()) if metrics.METRICS_ENABLED else None
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, inbox.get)
+            if raw is None:
+                break
+            queue.submit(types.Update.model_validate(raw, context={"bot": bot}))
+    finally:
+        await queue.stop(BOT_DRAIN_TIMEOUT)
+        if pusher is not None:
+            pusher.cancel()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        from services import generation_service
+        await generation_service.close()
+
+
+def worker_process(inbox, acks, index, global_rate, profile_startup=False):
+    """Процесс-обработчик: выполняет роутеры бота для своей доли чатов"""
+    if profile_startup:
+        from services import startup_profile
+        startup_profile.enable()
+    logging.info(f"Обработчик {index} запущен с PID: {os.getpid()}")
+    # Обработчик останавливается только по команде получателя, доработав свои обновления
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_run_worker(inbox, acks, index, global_rate))
+
+
+def _join_until(process, deadline):
+    """Ждет завершения процесса не дольше, чем до момента deadline (time.monotonic)"""
+    process.join(max(0.0, deadline - time.monotonic()))
+
+
+class ShardedPolling:
+    """Получает обновления одним процессом и раздает их N процессам-обработчикам
+
+    Обновление попадает к обработчику по хэшу chat_id, поэтому обновления
+    одного чата обрабатываются по порядку. Пока обработчик не подтвердил
+    обновление, получатель хранит его; если процесс-обработчик упал, он
+    перезапускается, а все неподтвержденные обновления отправляются новому
+    процессу заново. Обновление, обработка которого была прервана падением,
+    обрабатывается новым процессом, а уже обработанное, но не успевшее
+    подтвердиться, отсекает защита от повторной обработки (services/update_dedup.py).
+    Обновления, не подтвержденные обработчиками к остановке (в том числе
+    прерванные после BOT_DRAIN_TIMEOUT), получатель не подтверждает Telegram,
+    и после перезапуска они приходят заново.
+
+    Каждый обработчик - отдельный процесс main.py со своим планировщиком
+    исходящих запросов, пулами готовых раскладов и памятью кэшей. Чтобы бот в
+    целом не превышал TELEGRAM_GLOBAL_RATE, каждый планировщик получает долю
+    TELEGRAM_GLOBAL_RATE / workers; доля не перераспределяется, поэтому
+    обработчик с самыми активными чатами может упереться в нее раньше
+    остальных. Пулы раскладов наполняются в каждом процессе отдельно (в N раз
+    больше запросов к OpenAI при пополнении), а хранилища FSM, квот, обработанных
+    обновлений и дисковые уровни кэшей - общие базы SQLite.
+
+    Args:
+        workers: Количество процессов-обработчиков
+        max_in_flight: Максимальное количество неподтвержденных обновлений
+        profile_startup: Выводить профиль запуска получателя и каждого обработчика
+    """
+
+    def __init__(self, workers=BOT_WORKERS, max_in_flight=BOT_MAX_IN_FLIGHT, profile_startup=False):
+        self.workers = max(1, workers)
+        self.max_in_flight = max_in_flight
+        self.profile_startup = profile_startup
+        # spawn: обработчики не наследуют потоки и event loop получателя
+        self._context = multiprocessing.get_context('spawn')
+        self._acks = self._context.Queue()
+        self._processes = [None] * self.workers
+        self._inboxes = [None] * self.workers
+        # Неподтвержденные обновления обработчика: update_id -> данные обновления
+        self._in_flight = [OrderedDict() for _ in range(self.workers)]
+        # Последний снимок метрик каждого обработчика
+        self._metrics = [None] * self.workers
+        self._stopping = False
+
+    def in_flight(self):
+        return sum(len(updates) for updates in self._in_flight)
+
+    def lowest_in_flight(self):
+        """Возвращает номер самого раннего неподтвержденного обновления или None"""
+        # Обновления отправляются по возрастанию номеров, поэтому первое в каждом словаре - самое раннее
+        return min((next(iter(updates)) for updates in self._in_flight if updates), default=None)
+
+    def _start_worker(self, index):
+        from services.outbound_scheduler import TELEGRAM_GLOBAL_RATE
+
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=worker_process,
+            args=(inbox, self._acks, index, TELEGRAM_GLOBAL_RATE / self.workers, self.profile_startup),
+            name=f"bot-worker-{index}"
+        )
+        process.start()
+        self._inboxes[index] = inbox
+        self._processes[index] = process
+        # Счетчики нового процесса начинаются с нуля: старый снимок не показываем
+        self._metrics[index] = None
+        # Новому процессу отдаем все, что не успел обработать предыдущий
+        for raw in self._in_flight[index].values():
+            inbox.put(raw)
+        logging.info(f"Обработчик {index} запущен (PID {process.pid}), "
+                     f"повторно отправлено обновлений: {len(self._in_flight[index])}")
+
+    async def _watch_workers(self):
+        while not self._stopping:
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._stopping:
+                    logging.warning(f"Обработчик {index} завершился с кодом {process.exitcode}, перезапускаем...")
+                    self._start_worker(index)
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+
+    async def _read_acks(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            ack = await loop.run_in_executor(None, self._acks.get)
+            if ack is None:
+                return
+            kind, index, payload = ack
+            if kind == 'metrics':
+                self._metrics[index] = payload
+            else:
+                self._in_flight[index].pop(payload, None)
+
+    def render_metrics(self):
+        """Метрики получателя и всех обработчиков одним ответом (метка process)"""
+        from services import metrics
+
+        snapshots = {'receiver': metrics.collect()}
+        for index, snapshot in enumerate(self._metrics):
+            if snapshot is not None:
+                snapshots[f'worker-{index}'] = snapshot
+        return metrics.merge_snapshots(snapshots)
+
+    def dispatch(self, update):
+        """Отправляет обновление обработчику его чата"""
+        index = shard_for(update, self.workers)
+        raw = update.model_dump(mode='json', exclude_none=True)
+        self._in_flight[index][update.update_id] = raw
+        self._inboxes[index].put(raw)
+
+    async def run(self):
+        """Запускает обработчики и получает обновления до сигнала SIGTERM или SIGINT"""
+        if self.profile_startup:
+            from services import startup_profile
+            startup_profile.enable()
+        from main import bot, dp
+        from services.metrics import start_metrics_server
+        from services.polling import confirm_updates, fetch_updates, log_first_update, next_offset
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        for index in range(self.workers):
+            self._start_worker(index)
+        watcher = asyncio.create_task(self._watch_workers())
+        reader = asyncio.create_task(self._read_acks())
+        metrics_runner = await start_metrics_server(self.render_metrics)
+
+        await bot.delete_webhook(drop_pending_updates=False)
+        logging.info(f"Бот запущен в режиме шардирования: {self.workers} обработчиков")
+        last = None
+        try:
+            first = True
+            updates = fetch_updates(bot, stop, allowed_updates=dp.resolve_used_update_types(),
+                                    unfinished=self.lowest_in_flight)
+            async for update in updates:
+                last = update.update_id
+                if first:
+                    log_first_update()
+                    first = False
+                # Не отдаем новые обновления, пока обработчики не справятся с текущими
+                while self.in_flight() >= self.max_in_flight and not stop.is_set():
+                    await asyncio.sleep(0.1)
+                self.dispatch(update)
+        finally:
+            logging.info(f"Получение обновлений остановлено, обработчики дорабатывают {self.in_flight()} обновлений")
+            await self.stop()
+            watcher.cancel()
+            # Получатель подтверждений завершается, прочитав все, что обработчики прислали до остановки
+            await asyncio.gather(reader, return_exceptions=True)
+            # Неподтвержденные обработчиками обновления Telegram пришлет после перезапуска
+            await confirm_updates(bot, next_offset(self.lowest_in_flight, last))
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+            await bot.session.close()
+
+    async def stop(self):
+        """Останавливает обработчики: каждый дорабатывает уже полученные обновления"""
+        self._stopping = True
+        for inbox in self._inboxes:
+            if inbox is not None:
+                inbox.put(None)
+        # Обработчики дорабатывают одновременно, с общим сроком на всех
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + BOT_DRAIN_TIMEOUT + BOT_KILL_GRACE
+        processes = [process for process in self._processes if process is not None]
+        await asyncio.gather(*(loop.run_in_executor(None, _join_until, process, deadline) for process in processes))
+        for process in processes:
+            if process.is_alive():
+                logging.warning(f"Обработчик {process.name} не завершился вовремя, принудительная остановка")
+                process.kill()
+        self._acks.put(None)
+
+
+def run_sharded(workers, profile_startup=False):
+    """Запускает бота в режиме шардирования обновлений по нескольким процессам"""
+    polling = ShardedPolling(workers=workers, profile_startup=profile_startup)
+    asyncio.run(polling.run())
+
+
+class Supervisor:
+    """Перезапускает процесс бота сразу после падения и плавно останавливает его
+
+    Служба ждет завершения процесса (wait), а не опрашивает его, поэтому
+    перезапуск происходит через миллисекунды. Если бот падает сразу после
+    запуска, пауза перед перезапуском удваивается (от BOT_RESTART_MIN_DELAY до
+    BOT_RESTART_MAX_DELAY). При остановке службы бот получает SIGTERM,
+    дорабатывает начатые расклады и сохраняет хранилища; если он не успел за
+    BOT_DRAIN_TIMEOUT + BOT_KILL_GRACE секунд, процесс убивается. Бот
+    подтверждает Telegram только обновления до самого раннего необработанного
+    (services/polling.py), поэтому обновления из очереди и прерванные падением,
+    отменой или убийством процесса после перезапуска приходят и обрабатываются
+    заново.
+    """
+
+    def __init__(self, profile_startup=False):
+        self.profile_startup = profile_startup
+        self.process = None
+        self.stopping = threading.Event()
+        self.delay = 0.0
+
+    def request_stop(self, signum=None, frame=None):
+        """Обработчик SIGTERM/SIGINT: передает боту сигнал плавной остановки"""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        logging.info("Получен сигнал остановки службы, бот дорабатывает начатые расклады")
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            killer = threading.Timer(BOT_DRAIN_TIMEOUT + BOT_KILL_GRACE, self._kill, args=(process,))
+            killer.daemon = True
+            killer.start()
+
+    def _kill(self, process):
+        if process.poll() is None:
+            logging.warning("Бот не завершился вовремя, принудительная остановка")
+            process.kill()
+
+    def run(self):
+        while not self.stopping.is_set():
+            started_at = time.monotonic()
+            self.process = start_bot(self.profile_startup)
+            if self.process is None:
+                exit_code = None
+            else:
+                exit_code = self.process.wait()
+            if self.stopping.is_set():
+                logging.info(f"Бот остановлен с кодом {exit_code}")
+                break
+            uptime = time.monotonic() - started_at
+            if uptime >= BOT_RESTART_RESET_AFTER:
+                self.delay = 0.0
+            else:
+                self.delay = min(BOT_RESTART_MAX_DELAY, max(BOT_RESTART_MIN_DELAY, self.delay * 2))
+            logging.warning(f"Бот завершился с кодом {exit_code} через {uptime:.1f} с, "
+                            f"перезапуск через {self.delay:.1f} с")
+            # Ожидание прерывается сигналом остановки
+            self.stopping.wait(self.delay)
+
+
+def supervise(profile_startup=False):
+    """Запускает бота одним процессом main.py под присмотром службы"""
+    supervisor = Supervisor(profile_startup)
+    signal.signal(signal.SIGTERM, supervisor.request_stop)
+    signal.signal(signal.SIGINT, supervisor.request_stop)
+    supervisor.run()
+
+
 def main():
     """Основная функция службы"""
+    parser = argparse.ArgumentParser(description="Служба Telegram-бота")
+    parser.add_argument("--workers", type=int, default=BOT_WORKERS,
+                        help="Количество процессов-обработчиков (больше 1 - режим шардирования)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Выводить время импортов и время до первого обновления после каждого запуска бота")
+    args = parser.parse_args()
     logging.info("Служба бота запущена")
     
-    # Запускаем бота
-    bot_process = start_bot()
-    
-    try:
-        # Держим процесс активным
-        while True:
-            # Проверяем, работает ли процесс бота
-            if bot_process and bot_process.poll() is not None:
-                logging.warning("Бот остановлен, перезапускаем...")
-                bot_process = start_bot()
-            
-            time.sleep(60)  # Проверка каждую минуту
-    except KeyboardInterrupt:
-        logging.info("Получен сигнал остановки службы")
-        if bot_process:
-            bot_process.terminate()
-            logging.info("Бот остановлен")
+    if args.workers > 1:
+        run_sharded(args.workers, args.profile_startup)
+    else:
+        supervise(args.profile_startup)
     
     logging.info("Служба бота завершена")
 
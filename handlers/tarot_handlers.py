@@ -1,168 +1,214 @@
-import json
+import re
 import asyncio
-import random
 import datetime
-import os
-from pathlib import Path
+from functools import partial
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, LabeledPrice
 from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import StateFilter
-from openai import OpenAI
 from services.payment_service import create_invoice
+from services import astro, generation_service, prompt_registry, tarot_deck, tracing
+from services.circuit_breaker import CircuitOpenError
+from services.premium_cache import PREMIUM_CACHE, premium_cache
+from services.reading_pool import ReadingPool
+from services.quota_store import create_quota_store
+from services.reading_pipeline import AnimationMessage, StreamedReading, animate_while, run_with_animation
+from services.json_stream import IncrementalJSONParser
+from services.reading_schema import (
+    AstroSections, ModelOutputError, PremiumInterpretation, StandardInterpretation, TestReadingMessage,
+    complete_structured, extract_json, record_parse
+)
+from services.ui_templates import (
+    KEYBOARDS, TEXTS, MAX_TEST_READINGS, WELCOME, CARD, READING_SUMMARY, TAROT_MESSAGE,
+    TEST_LIMIT_REACHED, TEST_INTRO, PREMIUM_CARD, PREMIUM_ANALYSIS, PREMIUM_SUMMARY, STANDARD_SUMMARY
+)
 
 # Класс состояний для индивидуального гадания
 class PremiumReadingStates(StatesGroup):
     waiting_for_birthdate = State()  # Ожидание ввода даты рождения
 
-# Инициализация клиента OpenAI
-client = OpenAI()
-
 # Константы для промптов
-PROMPT_TAROT_CARDS = "Сгенерируй 3 уникальные карты Таро с описанием, кратким значением и алкогольной интерпретацией. Верни результат в формате JSON: [{\"id\":..., \"name\":..., \"description\":..., \"short_meaning\":..., \"drunk_interpretation\":...}]"
 PROMPT_TAROT_MESSAGE = "Ты - мистический таролог с чувством юмора. Напиши короткое сообщение (до 200 символов) о том, что карты Таро предсказывают для пользователя. Добавь упоминание алкоголя и шуточную рекомендацию."
 
-# Промпт для генерации полного расклада Таро через ChatGPT
-PROMPT_TAROT_READING = """Сгенерируй полный расклад Таро из 3 карт с подробным описанием и алкогольной интерпретацией. 
-Расклад должен включать:
-1. Три уникальные карты Таро с названием, описанием и алкогольной интерпретацией
-2. Общее толкование расклада
-3. Рекомендуемый алкогольный напиток, соответствующий раскладу
+# Промпт для генерации послания к тестовому гаданию (карта вытягивается из колоды)
+PROMPT_TEST_READING = """В тестовом гадании на одной карте Таро выпала карта «{card_name}».
+Напиши короткое послание от таролога об этой карте (с юмором и алкогольной тематикой).
 
 Верни результат в формате JSON:
-{
-  "cards": [
-    {"name": "...", "description": "...", "drunk_interpretation": "..."},
-    {"name": "...", "description": "...", "drunk_interpretation": "..."},
-    {"name": "...", "description": "...", "drunk_interpretation": "..."}
-  ],
-  "summary": "...",
-  "recommended_drink": "..."
-}"""
-
-# Промпт для генерации индивидуального расклада с учетом даты рождения
-PROMPT_PREMIUM_READING = """Ты - опытный таролог с алкогольным уклоном. Твоя задача - сделать индивидуальный расклад Таро для человека, родившегося {birthdate}, учитывая текущую дату {current_date}.
-
-Сделай расклад из 5 карт Таро, учитывая астрологические и нумерологические аспекты даты рождения и текущей даты.
-Для каждой карты дай название, описание и алкогольную интерпретацию.
-
-Включи следующие элементы, связанные с датой рождения:
-1. Знак зодиака и его влияние на личность
-2. Нумерологическое число судьбы (рассчитанное по дате рождения) и его значение
-3. Текущий астрологический транзит и его влияние
-4. Лунную фазу на текущую дату и ее влияние
-5. Совместимость знака зодиака с определенными алкогольными напитками
-
-Также добавь персональное резюме для человека с этой датой рождения, подробный астрологический комментарий и рекомендацию напитка, который лучше всего подходит этому человеку, с объяснением почему именно этот напиток резонирует с его личностью.
-
-Ответ должен быть в формате JSON:
-{
-  "cards": [
-    {
-      "name": "Название карты",
-      "description": "Описание карты",
-      "drunk_interpretation": "Алкогольная интерпретация"
-    },
-    ...
-  ],
-  "zodiac_sign": "Знак зодиака",
-  "destiny_number": "Число судьбы и его значение",
-  "current_transit": "Текущий астрологический транзит",
-  "moon_phase": "Текущая фаза луны",
-  "personal_summary": "Персональное резюме для человека с этой датой рождения",
-  "astrological_comment": "Подробный астрологический комментарий",
-  "recommended_drink": "Рекомендуемый напиток",
-  "drink_compatibility": "Почему этот напиток подходит данному знаку зодиака"
-}
-"""
+{{
+  "tarot_message": "Послание от таролога"
+}}"""
+PROMPT_TEST_READING_COMPACT = """Карта Таро: «{card_name}». Короткое послание таролога о ней, с юмором и алкогольной темой.
+Только JSON: {{"tarot_message": "..."}}"""
 
-# Промпт для генерации тестового гадания
-PROMPT_TEST_READING = """Сгенерируй тестовое гадание на одной карте Таро с алкогольной тематикой.
-Включи:
-1. Название карты Таро
-2. Краткое описание значения карты
-3. Алкогольную интерпретацию карты
-4. Короткое послание от таролога (с юмором и алкогольной тематикой)
+PROMPT_TAROT_MESSAGE_COMPACT = "Ты - таролог с юмором. До 200 символов: что предсказывают карты, с упоминанием алкоголя и шуточным советом."
 
-Верни результат в формате JSON:
-{
-  "card_name": "Название карты",
-  "description": "Описание значения",
-  "drunk_interpretation": "Алкогольная интерпретация",
-  "tarot_message": "Послание от таролога"
-}"""
+# Промпты толкования вытянутых из колоды карт (стандартного и премиум-расклада)
+PROMPT_STANDARD_INTERPRETATION = """На основе следующих карт Таро создай общее толкование расклада и рекомендуемый алкогольный напиток:
+Карты: {cards}
 
-# Вспомогательные функции для работы с OpenAI API
-async def generate_openai_response(prompt, model="gpt-3.5-turbo", temperature=0.7, max_tokens=500):
-    """Генерирует ответ от OpenAI API
-    
-    Args:
-        prompt: Текст промпта
-        model: Модель OpenAI
-        temperature: Температура генерации
-        max_tokens: Максимальное количество токенов
-        
-    Returns:
-        Текст ответа от OpenAI API
-    """
-    try:
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model=model,
-            messages=[{"role": "system", "content": prompt}],
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Ошибка при запросе к OpenAI API: {e}")
-        return None
+Ответ должен содержать:
+1. Общее толкование расклада (2-3 предложения)
+2. Рекомендуемый алкогольный напиток с кратким юмористическим объяснением
 
-# Список пользователей, которые получают бесплатный полный расклад
-FREE_USERS = [869218484, 218484013]  #218484013 ID пользователей, которым доступен бесплатный расклад
+Формат ответа должен быть в виде JSON:
+{{
+  "summary": "Общее толкование расклада",
+  "recommended_drink": "Рекомендуемый напиток с объяснением"
+}}"""
+PROMPT_STANDARD_INTERPRETATION_COMPACT = """Карты Таро: {cards}. Дай толкование расклада (2-3 предложения) и алкогольный напиток с шуточным объяснением.
+Только JSON: {{"summary": "...", "recommended_drink": "..."}}"""
 
-# Максимальное количество тестовых раскладов для одного пользователя
-MAX_TEST_READINGS = 3
+PROMPT_PREMIUM_INTERPRETATION = """На основе следующих карт Таро создай ПРЕМИУМ-толкование расклада для человека с датой рождения: {birthdate}.
+Карты: {cards}
 
-# Путь к файлу для хранения данных о тестовых раскладах
-DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent / 'data'
-TEST_READINGS_FILE = DATA_DIR / 'test_readings.json'
+Астрологические и нумерологические данные уже рассчитаны, используй их как есть и не пересчитывай:
+{facts}
 
-# Создаем директорию для данных, если она не существует
-DATA_DIR.mkdir(exist_ok=True)
+Добавь следующие персонализированные элементы:
+1. Астрологический анализ (что знак зодиака, влияние планет и фаза Луны значат для этого расклада)
+2. Нумерологический анализ (значение числа жизненного пути)
+3. Как эти факторы взаимодействуют с выпавшими картами
+4. Более глубокое и детальное толкование с учетом личных характеристик
+5. Персонализированные рекомендации и рекомендуемый алкогольный напиток
 
-# Словарь для отслеживания количества тестовых раскладов пользователей
-# Ключ - ID пользователя (в виде строки), значение - количество тестовых раскладов
-TEST_READINGS_COUNT = {}
+Сделай анализ более глубоким, детальным и визуально привлекательным, чтобы оправдать премиум-статус.
 
-# Функция для загрузки данных о тестовых раскладах из файла
-def load_test_readings_data():
-    """Загружает данные о тестовых раскладах из JSON-файла"""
-    global TEST_READINGS_COUNT
-    try:
-        if TEST_READINGS_FILE.exists():
-            with open(TEST_READINGS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Преобразуем ключи из строк в целые числа
-                TEST_READINGS_COUNT = {int(k): v for k, v in data.items()}
-    except Exception as e:
-        print(f"Ошибка при загрузке данных о тестовых раскладах: {e}")
+Формат ответа должен быть в виде JSON:
+{{
+  "astrology": "Астрологический анализ",
+  "numerology": "Нумерологический анализ",
+  "summary": "Общее толкование расклада",
+  "personal_advice": "Персонализированный совет",
+  "recommended_drink": "Рекомендуемый напиток"
+}}"""
+PROMPT_PREMIUM_INTERPRETATION_COMPACT = """ПРЕМИУМ-толкование расклада Таро для человека, родившегося {birthdate}. Карты: {cards}.
+Рассчитанные данные (не пересчитывай):
+{facts}
+Дай глубоко и образно: астрологию (знак, планеты, фаза Луны), нумерологию (значение числа), их связь с картами, личный совет и алкогольный напиток.
+Только JSON: {{"astrology": "...", "numerology": "...", "summary": "...", "personal_advice": "...", "recommended_drink": "..."}}"""
 
-# Функция для сохранения данных о тестовых раскладах в файл
-def save_test_readings_data():
-    """Сохраняет данные о тестовых раскладах в JSON-файл"""
-    try:
-        # Преобразуем ключи из целых чисел в строки для JSON
-        data = {str(k): v for k, v in TEST_READINGS_COUNT.items()}
-        with open(TEST_READINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Ошибка при сохранении данных о тестовых раскладах: {e}")
+# Премиум-толкование из двух частей (PREMIUM_CACHE=1): персональные разделы зависят только от даты
+# рождения и дня и берутся из кэша, а толкование карт генерируется для каждого расклада
+PROMPT_PREMIUM_ASTROLOGY = """Ты - таролог-астролог с алкогольным уклоном. Напиши персональный анализ на сегодня для человека с датой рождения: {birthdate}.
+
+Астрологические и нумерологические данные уже рассчитаны, используй их как есть и не пересчитывай:
+{facts}
+
+Ответ должен содержать:
+1. Астрологический анализ (что знак зодиака, влияние планет и фаза Луны значат для этого человека сегодня)
+2. Нумерологический анализ (значение числа жизненного пути и его влияние на личность)
+
+Сделай анализ глубоким, детальным и визуально привлекательным, чтобы оправдать премиум-статус. Не упоминай конкретные карты Таро - расклад делается отдельно.
+
+Формат ответа должен быть в виде JSON:
+{{
+  "astrology": "Астрологический анализ",
+  "numerology": "Нумерологический анализ"
+}}"""
+PROMPT_PREMIUM_ASTROLOGY_COMPACT = """Персональный анализ на сегодня для человека, родившегося {birthdate}. Рассчитанные данные (не пересчитывай):
+{facts}
+Глубоко и образно, с алкогольным юмором, без упоминания карт Таро: астрология (знак, планеты, фаза Луны) и нумерология (значение числа).
+Только JSON: {{"astrology": "...", "numerology": "..."}}"""
+
+PROMPT_PREMIUM_CARDS = """На основе следующих карт Таро создай ПРЕМИУМ-толкование расклада для человека с датой рождения: {birthdate}.
+Карты: {cards}
+
+Астрологические и нумерологические данные уже рассчитаны, используй их как есть:
+{facts}
+
+Ответ должен содержать:
+1. Общее толкование расклада (как знак зодиака и число жизненного пути взаимодействуют с выпавшими картами)
+2. Персонализированный совет
+3. Рекомендуемый алкогольный напиток с объяснением, почему он подходит этому человеку
+
+Отдельный астрологический и нумерологический анализ писать не нужно.
+
+Формат ответа должен быть в виде JSON:
+{{
+  "summary": "Общее толкование расклада",
+  "personal_advice": "Персонализированный совет",
+  "recommended_drink": "Рекомендуемый напиток"
+}}"""
+PROMPT_PREMIUM_CARDS_COMPACT = """ПРЕМИУМ-толкование карт Таро для человека, родившегося {birthdate}. Карты: {cards}.
+Рассчитанные данные (не пересчитывай):
+{facts}
+Дай: толкование расклада с учетом знака и числа, личный совет и алкогольный напиток. Отдельно астрологию и нумерологию не пиши.
+Только JSON: {{"summary": "...", "personal_advice": "...", "recommended_drink": "..."}}"""
+
+# Промпт толкования сразу нескольких раскладов (пакетная генерация для пула)
+PROMPT_BATCH_INTERPRETATION = """Ниже {count} независимых раскладов Таро по 3 карты. Для каждого расклада создай общее толкование и рекомендуемый алкогольный напиток:
+{spreads}
+
+Для каждого расклада ответ должен содержать:
+1. Общее толкование расклада (2-3 предложения)
+2. Рекомендуемый алкогольный напиток с кратким юмористическим объяснением
+
+Толкования не должны повторять друг друга.
+
+Формат ответа должен быть в виде JSON-массива из {count} объектов в том же порядке, что и расклады:
+[
+  {{"summary": "Общее толкование расклада", "recommended_drink": "Рекомендуемый напиток с объяснением"}}
+]"""
+PROMPT_BATCH_INTERPRETATION_COMPACT = """{count} независимых раскладов Таро по 3 карты:
+{spreads}
+Для каждого: толкование (2-3 предложения) и алкогольный напиток с шуточным объяснением, без повторов между раскладами.
+Только JSON в виде JSON-массива из {count} объектов в порядке раскладов: [{{"summary": "...", "recommended_drink": "..."}}]"""
+
+# Сколько токенов ответа отводить на одно толкование в пакетной генерации
+BATCH_TOKENS_PER_READING = 250
+
+# Реестр промптов: токены шаблонов считаются при импорте, max_tokens подбирается по ответам
+STANDARD_PROMPT = prompt_registry.register(
+    "standard", PROMPT_STANDARD_INTERPRETATION, PROMPT_STANDARD_INTERPRETATION_COMPACT, max_tokens=300
+)
+PREMIUM_PROMPT = prompt_registry.register(
+    "premium", PROMPT_PREMIUM_INTERPRETATION, PROMPT_PREMIUM_INTERPRETATION_COMPACT, max_tokens=800
+)
+ASTRO_PROMPT = prompt_registry.register(
+    "astro", PROMPT_PREMIUM_ASTROLOGY, PROMPT_PREMIUM_ASTROLOGY_COMPACT, max_tokens=500
+)
+PREMIUM_CARDS_PROMPT = prompt_registry.register(
+    "premium_cards", PROMPT_PREMIUM_CARDS, PROMPT_PREMIUM_CARDS_COMPACT, max_tokens=400
+)
+BATCH_PROMPT = prompt_registry.register(
+    "batch", PROMPT_BATCH_INTERPRETATION, PROMPT_BATCH_INTERPRETATION_COMPACT, max_tokens=BATCH_TOKENS_PER_READING
+)
+TEST_PROMPT = prompt_registry.register("test", PROMPT_TEST_READING, PROMPT_TEST_READING_COMPACT, max_tokens=200)
+MESSAGE_PROMPT = prompt_registry.register("message", PROMPT_TAROT_MESSAGE, PROMPT_TAROT_MESSAGE_COMPACT, max_tokens=200)
+
+# Запасные данные на случай ошибки генерации
+FALLBACK_CARDS = [
+    {"name": "Шут", "description": "Новые начинания и приключения", "drunk_interpretation": "Время для спонтанных решений и веселья!"},
+    {"name": "Маг", "description": "Сила воли и манипуляция энергиями", "drunk_interpretation": "Ваши способности усиливаются с каждым бокалом!"},
+    {"name": "Верховная Жрица", "description": "Интуиция и тайные знания", "drunk_interpretation": "Доверьтесь внутреннему голосу, особенно после третьего шота!"}
+]
+FALLBACK_SUMMARY = "Ваши карты указывают на интересный период в жизни. Доверяйте своей интуиции и будьте открыты новым возможностям."
+FALLBACK_DRINK = "Виски с колой - классика, которая никогда не подведет."
+
+FALLBACK_TEST_READING = {
+    "card_name": "Шут",
+    "description": "Карта Шута символизирует новые начинания, спонтанность и свободу.",
+    "drunk_interpretation": "Сегодня вечером вы можете быть немного безрассудны. Попробуйте что-то новое, но не переусердствуйте с алкоголем!",
+    "tarot_message": "Звезды подсказывают, что сегодня хороший день для экспериментов. Возможно, стоит попробовать новый коктейль или встретиться с друзьями в необычном месте."
+}
+
+def create_fallback_reading():
+    """Создает запасной расклад из трех карт"""
+    return {
+        "cards": [dict(card) for card in FALLBACK_CARDS],
+        "summary": FALLBACK_SUMMARY,
+        "recommended_drink": FALLBACK_DRINK
+    }
+
+# Список пользователей, которые получают бесплатный полный расклад
+FREE_USERS = [869218484, 218484013]  #218484013 ID пользователей, которым доступен бесплатный расклад
 
-# Загружаем данные при запуске модуля
-load_test_readings_data()
+# Хранилище количества тестовых раскладов пользователей (SQLite по умолчанию)
+# Ключ - ID пользователя, значение - количество тестовых раскладов
+test_readings_store = create_quota_store()
 
 # Создаем роутер для обработки команд гадания
 router = Router()
@@ -171,30 +217,18 @@ router = Router()
 @router.message(Command("start"))
 async def start_command(message: Message):
     """Обработчик команды /start"""
-    # Создаем клавиатуру с кнопками "Начать гадать", "Индивидуальное гадание" и "Тест"
-    from aiogram.utils.keyboard import InlineKeyboardBuilder
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🔮 Начать гадать", callback_data="start_reading")
-    builder.button(text="🌟 Индивидуальное гадание", callback_data="premium_reading")
-    builder.button(text="🧪 Тест", callback_data="test_reading")
-    builder.adjust(1, 1, 1)
-    
     # Получаем ID пользователя
     user_id = message.from_user.id
     
     # Проверяем, сколько раз пользователь уже делал тестовый расклад
-    test_count = TEST_READINGS_COUNT.get(user_id, 0)
+    test_count = await test_readings_store.get(user_id)
     remaining_tests = max(0, MAX_TEST_READINGS - test_count)
     
     # Отправляем приветственное сообщение
     await message.answer(
-        "🔮 <b>Добро пожаловать в Пьяное Таро!</b> 🍸\n\n"
-        "Я - бот-таролог с алкогольным уклоном. Я могу погадать вам на картах Таро "
-        "и дать интерпретацию с алкогольной тематикой.\n\n"
-        f"У вас осталось <b>{remaining_tests} из {MAX_TEST_READINGS}</b> бесплатных тестовых раскладов.\n\n"
-        "Нажмите кнопку ниже, чтобы начать гадание:",
-        parse_mode="HTML",
-        reply_markup=builder.as_markup()
+        WELCOME.render(remaining_tests=remaining_tests),
+        parse_mode=WELCOME.parse_mode,
+        reply_markup=KEYBOARDS["main_menu"]
     )
 
 # Обработчик кнопки "Начать гадать"
@@ -208,118 +242,50 @@ async def start_tarot_reading(callback: CallbackQuery):
     user_id = callback.from_user.id
     if user_id in FREE_USERS:
         # Для пользователей из списка - бесплатный полный расклад через GPT
-        await callback.message.answer(
-            "🔮 *Специальный расклад Таро* 🔮\n\n"
-            "Подготавливаю ваш полный расклад...",
-            parse_mode="Markdown"
-        )
-        
-        # Показываем анимацию перед выдачей расклада
-        await show_tarot_animation(callback.message)
-        
-        # Генерируем полный расклад через GPT
-        reading = await generate_tarot_reading()
-        
-        # Отправляем результаты гадания
-        await callback.message.answer('🔮 *Ваш расклад готов!* 🍸\n\nВот что говорят карты:', parse_mode="Markdown")
+        await callback.message.answer(TEXTS["special_reading_intro"], parse_mode="Markdown")
         
-        # Отправляем каждую карту с интерпретацией
-        for card in reading['cards']:
-            await callback.message.answer(
-                f"🃏 *{card['name']}*\n\n"
-                f"{card['description']}\n\n"
-                f"🍸 *Алкогольная интерпретация:*\n{card['drunk_interpretation']}",
-                parse_mode="Markdown"
-            )
+        # Запускаем генерацию сразу, чтобы она шла параллельно с анимацией
+        reading_task = asyncio.ensure_future(take_standard_reading())
+        message_task = asyncio.ensure_future(generate_tarot_message())
         
-        # Отправляем общее толкование
-        await callback.message.answer(
-            f"🔮 *Общее толкование:*\n\n{reading['summary']}\n\n"
-            f"🍸 *Рекомендуемый напиток:*\n"
-            f"{reading['recommended_drink']}",
-            parse_mode="Markdown"
-        )
-        
-        # Генерируем сообщение от таролога через ChatGPT
-        tarot_message = await generate_tarot_message()
+        try:
+            # Показываем анимацию, пока готовится расклад
+            await show_tarot_animation(callback.message, reading_task)
+            reading = await reading_task
+            
+            # Отправляем результаты гадания
+            await callback.message.answer(TEXTS["reading_ready"], parse_mode="Markdown")
+            
+            # Отправляем каждую карту с интерпретацией
+            for card in reading['cards']:
+                await callback.message.answer(CARD.render(card), parse_mode=CARD.parse_mode)
+            
+            # Отправляем общее толкование
+            await callback.message.answer(READING_SUMMARY.render(reading), parse_mode=READING_SUMMARY.parse_mode)
+            
+            # Получаем сообщение от таролога (генерация запущена вместе с раскладом)
+            tarot_message = await message_task
+        finally:
+            # Если анимация или отправка упали, генерация больше не нужна
+            reading_task.cancel()
+            message_task.cancel()
         
         # Отправляем сообщение от таролога
         await callback.message.answer(
-            f"✨ *Послание таролога:*\n\n{tarot_message}",
-            parse_mode="Markdown"
+            TAROT_MESSAGE.render(tarot_message=tarot_message),
+            parse_mode=TAROT_MESSAGE.parse_mode
         )
         
         # Добавляем кнопки для нового расклада и возврата в меню
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        builder.button(text="🔮 Сделать новый расклад", callback_data="start_reading")
-        builder.button(text="🏠 Вернуться в меню", callback_data="return_to_menu")
-        builder.adjust(1)
-        
-        await callback.message.answer(
-            "Что бы вы хотели сделать дальше?",
-            reply_markup=builder.as_markup()
-        )
+        await callback.message.answer(TEXTS["what_next"], reply_markup=KEYBOARDS["after_reading"])
     else:
         # Для обычных пользователей - предложение оплаты
-        # Создаем клавиатуру напрямую здесь
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        builder.button(text="💳 Оплатить 100 Stars", callback_data="pay_reading")
-        builder.button(text="❌ Отмена", callback_data="cancel_reading")
-        builder.adjust(1)  # Размещаем кнопки в один столбец
-        
-        # Отправляем сообщение о начале гадания
         await callback.message.answer(
-            "🔮 *Пьяное Таро* 🍸\n\n"
-            "Я проведу для вас гадание на картах Таро с алкогольной интерпретацией!\n"
-            "Стоимость гадания: 100 Stars.\n\n"
-            "Нажмите кнопку ниже, чтобы перейти к оплате.",
+            TEXTS["standard_offer"],
             parse_mode="Markdown",
-            reply_markup=builder.as_markup()
+            reply_markup=KEYBOARDS["payment"]
         )
 
-# Вспомогательные функции для создания клавиатур
-def create_keyboard(buttons):
-    """Создает клавиатуру с заданными кнопками
-    
-    Args:
-        buttons: Список кортежей (текст, callback_data)
-    
-    Returns:
-        Клавиатура с кнопками
-    """
-    from aiogram.utils.keyboard import InlineKeyboardBuilder
-    builder = InlineKeyboardBuilder()
-    for text, callback_data in buttons:
-        builder.button(text=text, callback_data=callback_data)
-    builder.adjust(1)  # Размещаем кнопки в один столбец
-    return builder.as_markup()
-
-# Создаем клавиатуру с кнопкой оплаты
-def create_payment_keyboard():
-    """Создает клавиатуру с кнопками оплаты и отмены"""
-    buttons = [
-        ("💳 Оплатить 100 Stars", "pay_reading"),
-        ("❌ Отмена", "cancel_reading")
-    ]
-    return create_keyboard(buttons)
-
-# Создаем клавиатуру с кнопкой оплаты премиум-гадания
-def create_premium_payment_keyboard():
-    """Создает клавиатуру с кнопками оплаты премиум и отмены"""
-    buttons = [
-        ("💳 Оплатить 300 Stars", "pay_premium_reading"),
-        ("❌ Отмена", "cancel_reading")
-    ]
-    return create_keyboard(buttons)
-
-# Создаем клавиатуру для начала гадания
-def create_start_reading_keyboard():
-    """Создает клавиатуру с кнопкой начала гадания"""
-    buttons = [("🔮 Начать гадать", "start_reading")]
-    return create_keyboard(buttons)
-
 # Обработчик кнопки "Оплатить"
 @router.callback_query(F.data == "pay_reading")
 async def pay_tarot_reading(callback: CallbackQuery):
@@ -350,10 +316,7 @@ async def pay_tarot_reading(callback: CallbackQuery):
         )
     except Exception as e:
         print(f"Ошибка при создании счета: {e}")
-        await callback.message.answer(
-            "❌ Произошла ошибка при создании счета. Пожалуйста, попробуйте позже.",
-            parse_mode="Markdown"
-        )
+        await callback.message.answer(TEXTS["invoice_error"], parse_mode="Markdown")
 
 # Обработчик кнопки "Отмена"
 @router.callback_query(F.data == "cancel_reading")
@@ -363,10 +326,7 @@ async def cancel_tarot_reading(callback: CallbackQuery):
     await callback.answer()
     
     # Отправляем сообщение об отмене
-    await callback.message.answer(
-        "❌ Гадание отменено. Вы можете начать снова в любое время.",
-        parse_mode="Markdown"
-    )
+    await callback.message.answer(TEXTS["reading_cancelled"], parse_mode="Markdown")
 
 # Обработчик кнопки "Заказать гадание"
 @router.callback_query(F.data == "order_reading")
@@ -377,22 +337,11 @@ async def order_tarot_reading(callback: CallbackQuery):
     
     # Отправляем сообщение о заказе индивидуального гадания
     await callback.message.answer(
-        "💰 *Индивидуальное гадание* 💰\n\n"
-        "Вы можете заказать персональное гадание с подробной интерпретацией.\n"
-        "Стоимость индивидуального гадания: 300 Stars.\n\n"
-        "Гадание будет включать расширенный расклад из 5 карт и детальный анализ вашей ситуации.",
+        TEXTS["premium_offer"],
         parse_mode="Markdown",
-        reply_markup=create_premium_payment_keyboard()
+        reply_markup=KEYBOARDS["premium_payment"]
     )
 
-# Создаем клавиатуру с кнопкой оплаты премиум-гадания
-def create_premium_payment_keyboard():
-    from aiogram.utils.keyboard import InlineKeyboardBuilder
-    builder = InlineKeyboardBuilder()
-    builder.button(text="💳 Оплатить 300 Stars", callback_data="pay_premium_reading")
-    builder.button(text="❌ Отмена", callback_data="cancel_reading")
-    return builder.as_markup()
-
 # Обработчик кнопки "Индивидуальное гадание"
 @router.callback_query(F.data == "premium_reading")
 async def premium_tarot_reading(callback: CallbackQuery):
@@ -402,12 +351,9 @@ async def premium_tarot_reading(callback: CallbackQuery):
     
     # Отправляем сообщение о заказе индивидуального гадания
     await callback.message.answer(
-        "💰 *Индивидуальное гадание* 💰\n\n"
-        "Вы можете заказать персональное гадание с подробной интерпретацией.\n"
-        "Стоимость индивидуального гадания: 300 Stars.\n\n"
-        "Гадание будет включать расширенный расклад из 5 карт и детальный анализ вашей ситуации.",
+        TEXTS["premium_offer"],
         parse_mode="Markdown",
-        reply_markup=create_premium_payment_keyboard()
+        reply_markup=KEYBOARDS["premium_payment"]
     )
 
 # Обработчик кнопки "Оплатить премиум"
@@ -421,11 +367,7 @@ async def pay_premium_tarot_reading(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     # Запрашиваем дату рождения
-    await callback.message.answer(
-        "🔮 *Индивидуальное гадание* 🔮\n\n"
-        "Для составления персонального расклада, пожалуйста, введите вашу дату рождения в формате ДД.ММ.ГГГГ (например, 15.05.1990).",
-        parse_mode="Markdown"
-    )
+    await callback.message.answer(TEXTS["ask_birthdate"], parse_mode="Markdown")
     
     # Устанавливаем состояние ожидания даты рождения
     await state.set_state(PremiumReadingStates.waiting_for_birthdate)
@@ -449,10 +391,7 @@ async def pay_premium_tarot_reading(callback: CallbackQuery, state: FSMContext):
     )
     
     if not result:
-        await callback.message.answer(
-            "❌ Произошла ошибка при создании счета. Пожалуйста, попробуйте позже.",
-            parse_mode="Markdown"
-        )
+        await callback.message.answer(TEXTS["invoice_error"], parse_mode="Markdown")
 
 # Пользователи в списке FREE_USERS получают полный расклад без оплаты
 
@@ -465,186 +404,67 @@ async def test_tarot_reading(callback: CallbackQuery):
     # Получаем ID пользователя
     user_id = callback.from_user.id
     
-    # Проверяем, сколько раз пользователь уже делал тестовый расклад
-    test_count = TEST_READINGS_COUNT.get(user_id, 0)
+    # Атомарно увеличиваем счетчик тестовых раскладов, если лимит еще не исчерпан
+    allowed, test_count = await test_readings_store.increment_if_below(user_id, MAX_TEST_READINGS)
     
     # Если пользователь превысил лимит тестовых раскладов
-    if test_count >= MAX_TEST_READINGS:
+    if not allowed:
         # Предлагаем пользователю сделать полный расклад
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        builder.button(text="🔮 Начать гадать", callback_data="start_reading")
-        builder.adjust(1)
-        
         await callback.message.answer(
-            "⚠️ *Вы уже использовали максимальное количество тестовых раскладов!*\n\n"
-            f"Лимит: {MAX_TEST_READINGS} тестовых раскладов.\n\n"
-            "Для полного расклада из 3 карт с рекомендацией напитка, "
-            "нажмите кнопку ниже:",
-            parse_mode="Markdown",
-            reply_markup=builder.as_markup()
+            TEST_LIMIT_REACHED.text,
+            parse_mode=TEST_LIMIT_REACHED.parse_mode,
+            reply_markup=KEYBOARDS["start_reading"]
         )
         return
     
-    # Увеличиваем счетчик тестовых раскладов для пользователя
-    TEST_READINGS_COUNT[user_id] = test_count + 1
-    
-    # Сохраняем обновленные данные в файл
-    save_test_readings_data()
-    
     # Для всех пользователей - стандартное тестовое гадание
-    await callback.message.answer(
-        "🧪 *Тестовое гадание* 🧪\n\n"
-        "Это бесплатное демо-гадание на одной карте.\n"
-        "Вы получите базовую интерпретацию с алкогольной тематикой.\n\n"
-        f"Осталось тестовых раскладов: {MAX_TEST_READINGS - test_count - 1} из {MAX_TEST_READINGS}\n\n"
-        "Подготавливаю вашу карту..."
-    )
-    await show_tarot_animation(callback.message)
+    await callback.message.answer(TEST_INTRO.render(remaining_tests=MAX_TEST_READINGS - test_count))
     
+    # Запускаем генерацию сразу, чтобы она шла параллельно с анимацией
+    reading_task = asyncio.ensure_future(take_test_reading())
     try:
-        # Генерируем тестовое гадание полностью через ChatGPT
-        prompt = """Сгенерируй тестовое гадание на одной карте Таро с алкогольной тематикой.
-        Включи:
-        1. Название карты Таро
-        2. Краткое описание значения карты
-        3. Алкогольную интерпретацию карты
-        4. Короткое послание от таролога (с юмором и алкогольной тематикой)
-        
-        Верни результат в формате JSON:
-        {
-          "card_name": "Название карты",
-          "description": "Описание значения",
-          "drunk_interpretation": "Алкогольная интерпретация",
-          "tarot_message": "Послание от таролога"
-        }"""
+        await show_tarot_animation(callback.message, reading_task)
+    except BaseException:
+        reading_task.cancel()
+        raise
+    
+    try:
+        reading_data = await reading_task
         
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500
+        # Отправляем результат тестового гадания
+        await callback.message.answer(
+            CARD.render(
+                name=reading_data['card_name'],
+                description=reading_data['description'],
+                drunk_interpretation=reading_data['drunk_interpretation']
+            ),
+            parse_mode=CARD.parse_mode
         )
         
-        # Получаем текст ответа
-        reading_text = response.choices[0].message.content
+        # Отправляем сгенерированное сообщение от таролога
+        await callback.message.answer(TAROT_MESSAGE.render(reading_data), parse_mode=TAROT_MESSAGE.parse_mode)
         
-        try:
-            # Пытаемся распарсить JSON из ответа
-            reading_data = json.loads(reading_text)
-            
-            # Отправляем результат тестового гадания
-            await callback.message.answer(
-                f"🃏 *{reading_data['card_name']}*\n\n"
-                f"{reading_data['description']}\n\n"
-                f"🍸 *Алкогольная интерпретация:*\n{reading_data['drunk_interpretation']}",
-                parse_mode="Markdown"
-            )
-            
-            # Отправляем сгенерированное сообщение от таролога
-            await callback.message.answer(
-                f"✨ *Послание таролога:*\n\n{reading_data['tarot_message']}",
-                parse_mode="Markdown"
-            )
-            
-            # Предлагаем пользователю начать полное гадание
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            builder = InlineKeyboardBuilder()
-            builder.button(text="🔮 Начать гадать", callback_data="start_reading")
-            builder.adjust(1)
-            await callback.message.answer(
-                "Это было демо-гадание. Для полного расклада из 3 карт с рекомендацией напитка, "
-                "нажмите кнопку ниже:",
-                parse_mode="Markdown",
-                reply_markup=builder.as_markup()
-            )
-            
-        except (json.JSONDecodeError, KeyError) as e:
-            # Если не удалось распарсить JSON или найти нужные ключи
-            print(f"Ошибка при парсинге JSON в test_tarot_reading: {e}")
-            
-            # Используем запасные данные
-            fallback_card = {
-                "card_name": "Шут",
-                "description": "Карта Шута символизирует новые начинания, спонтанность и свободу.",
-                "drunk_interpretation": "Сегодня вечером вы можете быть немного безрассудны. Попробуйте что-то новое, но не переусердствуйте с алкоголем!",
-                "tarot_message": "Звезды подсказывают, что сегодня хороший день для экспериментов. Возможно, стоит попробовать новый коктейль или встретиться с друзьями в необычном месте."
-            }
-            
-            # Отправляем результат с запасными данными
-            await callback.message.answer(
-                f"🃏 *{fallback_card['card_name']}*\n\n"
-                f"{fallback_card['description']}\n\n"
-                f"🍸 *Алкогольная интерпретация:*\n{fallback_card['drunk_interpretation']}",
-                parse_mode="Markdown"
-            )
-            
-            # Отправляем запасное сообщение от таролога
-            await callback.message.answer(
-                f"✨ *Послание таролога:*\n\n{fallback_card['tarot_message']}",
-                parse_mode="Markdown"
-            )
-            
-            # Предлагаем пользователю начать полное гадание
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            builder = InlineKeyboardBuilder()
-            builder.button(text="🔮 Начать гадать", callback_data="start_reading")
-            builder.adjust(1)
-            await callback.message.answer(
-                "Это было демо-гадание. Для полного расклада из 3 карт с рекомендацией напитка, "
-                "нажмите кнопку ниже:",
-                parse_mode="Markdown",
-                reply_markup=builder.as_markup()
-            )
+        # Предлагаем пользователю начать полное гадание
+        await callback.message.answer(
+            TEXTS["test_demo_done"],
+            parse_mode="Markdown",
+            reply_markup=KEYBOARDS["start_reading"]
+        )
     
     except Exception as e:
         # Обрабатываем любые другие ошибки
         print(f"Ошибка в test_tarot_reading: {e}")
         
         # Отправляем сообщение об ошибке
-        await callback.message.answer(
-            "😔 *Упс! Что-то пошло не так...*\n\n"
-            "Карты Таро сегодня капризничают. Пожалуйста, попробуйте еще раз позже.",
-            parse_mode="Markdown"
-        )
-
-
-# Рекомендуемые напитки
-recommended_drinks = [
-    "Виски с колой - классика никогда не подводит!",
-    "Мохито - освежающий выбор для новых начинаний.",
-    "Кровавая Мэри - идеально для интуитивных решений.",
-    "Маргарита - сбалансированный выбор для любой ситуации.",
-    "Пина Колада - сладкий вкус успеха ждет вас!"
-]
+        await callback.message.answer(TEXTS["test_error"], parse_mode="Markdown")
 
 @router.message(Command("reading"))
 async def cmd_reading(message: Message):
     """Обработчик команды /reading"""
-    await message.answer(
-        "🔮 *Пьяное Таро* 🍸\n\n"
-        "Я проведу для вас гадание на картах Таро с алкогольной интерпретацией!\n"
-        "Стоимость гадания: 100 Stars.\n\n"
-        "Нажмите кнопку ниже, чтобы оплатить и получить гадание.",
-        parse_mode="Markdown"
-    )
+    await message.answer(TEXTS["reading_command_offer"], parse_mode="Markdown")
     
     # Создаем счет для оплаты
-    from aiogram import Bot
-    bot = Bot.get_current()
-    await create_invoice(bot, message.chat.id)
-
-async def show_tarot_animation(message: Message):
-    """Показывает анимацию перемешивания и выбора карт"""
-    await message.answer("🔮 Перемешиваю карты...")
-    await asyncio.sleep(1)
-    await message.answer("🃏 Выбираю карты для вашего расклада...")
-    await asyncio.sleep(1)
-    await message.answer("✨ Настраиваюсь на вашу энергетику...")
-    await asyncio.sleep(1)
-    await message.answer("🍸 Добавляю алкогольную интерпретацию...")
-    await asyncio.sleep(1)
+    await create_invoice(message.bot, message.chat.id)
 
 # Обработчик кнопки "Вернуться в меню"
 @router.callback_query(F.data == "return_to_menu")
@@ -656,189 +476,240 @@ async def return_to_menu(callback: CallbackQuery):
     # Отправляем пользователя в главное меню
     await start_command(callback.message)
 
-async def generate_tarot_reading(birthdate: str = None):
-    """Генерирует полное гадание на Таро через GPT с учетом даты рождения для премиум-гадания"""
+def draw_tarot_cards(count: int = 3):
+    """Вытягивает карты из локальной колоды в формате расклада"""
+    return [card.to_dict() for card in tarot_deck.draw(count)]
+
+def build_astro_facts(birthdate: str, day: datetime.date = None):
+    """Знак зодиака, число жизненного пути и фаза Луны на день day (по умолчанию сегодня) - считаются локально"""
+    birth = astro.parse_date(birthdate)
+    if birth is None:
+        # Дата рождения проверяется при вводе, сюда попадает только старая сохраненная дата
+        return "не рассчитаны, определи знак зодиака и число жизненного пути по дате рождения"
+    return astro.describe(birth, day or datetime.date.today())
+
+def build_interpretation_prompt(cards: list, birthdate: str = None):
+    """Собирает промпт толкования для уже вытянутых карт (премиум, если указана дата рождения)"""
+    cards_info = ", ".join([card["name"] for card in cards])
+    
+    # Если указана дата рождения, добавляем астрологические и нумерологические элементы
+    if birthdate:
+        return PREMIUM_PROMPT.render(cards=cards_info, birthdate=birthdate, facts=build_astro_facts(birthdate))
+    
+    # Обычный промпт для стандартного гадания
+    return STANDARD_PROMPT.render(cards=cards_info)
+
+def build_premium_cards_prompt(cards: list, birthdate: str):
+    """Собирает промпт толкования карт премиум-расклада (без астрологического и нумерологического анализа)"""
+    cards_info = ", ".join([card["name"] for card in cards])
+    return PREMIUM_CARDS_PROMPT.render(cards=cards_info, birthdate=birthdate, facts=build_astro_facts(birthdate))
+
+def build_batch_interpretation_prompt(card_sets: list):
+    """Собирает промпт толкования сразу для нескольких независимых раскладов"""
+    spreads = "\n".join(
+        f"{index}. {', '.join(card['name'] for card in cards)}"
+        for index, cards in enumerate(card_sets, 1)
+    )
+    return BATCH_PROMPT.render(count=len(card_sets), spreads=spreads)
+
+def parse_batch_interpretations(text: str, card_sets: list):
+    """Проверяет ответ пакетной генерации и делит его на отдельные расклады
+
+    Толкования без нужных полей отбрасываются, поэтому раскладов может
+    получиться меньше, чем наборов карт.
+
+    Raises:
+        ModelOutputError: если в ответе нет JSON-массива
+    """
     try:
-        # Получаем карты через GPT
-        tarot_cards = await fetch_tarot_cards_gpt()
-        
-        # Проверяем, что tarot_cards это список и он не пустой
-        if not isinstance(tarot_cards, list) or len(tarot_cards) == 0:
-            # Если карты не получены, запрашиваем полное гадание напрямую через GPT
-            # Базовый промпт для обычного гадания
-            base_prompt = """Создай полное гадание на Таро с тремя картами. Для каждой карты укажи:
-1. Название карты
-2. Описание значения карты в контексте гадания
-3. Алкогольную интерпретацию (юмористическую)
-
-Также добавь общее толкование расклада и рекомендуемый алкогольный напиток."""
-            
-            # Если указана дата рождения, добавляем астрологические и нумерологические элементы
-            if birthdate:
-                prompt = f"""{base_prompt}
+        interpretations = extract_json(text, opener="[")
+        if not isinstance(interpretations, list):
+            raise ModelOutputError(text, "Ответ пакетной генерации должен быть JSON-массивом")
+    except ModelOutputError:
+        record_parse("batch", ok=False)
+        raise
+    record_parse("batch", ok=True)
+    readings = []
+    for cards, interpretation in zip(card_sets, interpretations):
+        try:
+            interpretation = StandardInterpretation.model_validate(interpretation)
+        except ValueError:
+            continue
+        readings.append({"cards": cards, **interpretation.model_dump()})
+    return readings
 
-Это ПРЕМИУМ-гадание для человека с датой рождения: {birthdate}.
-Добавь следующие персонализированные элементы:
-1. Астрологический анализ (знак зодиака, влияние планет)
-2. Нумерологический анализ (число жизненного пути на основе даты рождения)
-3. Как эти факторы взаимодействуют с выпавшими картами
-4. Более глубокое и детальное толкование с учетом личных характеристик
-5. Персонализированные рекомендации
+async def generate_tarot_readings(count: int):
+    """Генерирует count стандартных раскладов одним запросом к GPT
 
-Сделай анализ более глубоким, детальным и визуально привлекательным, чтобы оправдать премиум-статус.
+    Карты каждого расклада вытягиваются из локальной колоды, модель пишет
+    толкования для всех раскладов сразу.
 
-Формат ответа должен быть в виде JSON:
-{
-  "cards": [
-    {
-      "name": "Название карты",
-      "description": "Описание значения",
-      "drunk_interpretation": "Алкогольная интерпретация"
-    },
-    ...
-  ],
-  "astrology": "Астрологический анализ",
-  "numerology": "Нумерологический анализ",
-  "summary": "Общее толкование расклада",
-  "personal_advice": "Персонализированный совет",
-  "recommended_drink": "Рекомендуемый напиток"
-}"""
-            else:
-                # Обычный промпт для стандартного гадания
-                prompt = f"""{base_prompt}
+    Returns:
+        Список раскладов (невалидные толкования отброшены)
 
-Формат ответа должен быть в виде JSON:
-{{
-  "cards": [
-    {{
-      "name": "Название карты",
-      "description": "Описание значения",
-      "drunk_interpretation": "Алкогольная интерпретация"
-    }},
-    ...
-  ],
-  "summary": "Общее толкование расклада",
-  "recommended_drink": "Рекомендуемый напиток"
-}}"""
-            
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "system", "content": prompt}],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            try:
-                # Пытаемся распарсить JSON из ответа
-                reading_text = response.choices[0].message.content
-                reading = json.loads(reading_text)
-                return reading
-            except Exception as e:
-                print(f"Ошибка при парсинге JSON из ответа GPT: {e}")
-                # Используем fallback карты в случае ошибки
-                fallback_cards = [
-                    {"name": "Шут", "description": "Новые начинания и приключения", "drunk_interpretation": "Время для спонтанных решений и веселья!"},
-                    {"name": "Маг", "description": "Сила воли и манипуляция энергиями", "drunk_interpretation": "Ваши способности усиливаются с каждым бокалом!"},
-                    {"name": "Верховная Жрица", "description": "Интуиция и тайные знания", "drunk_interpretation": "Доверьтесь внутреннему голосу, особенно после третьего шота!"}
-                ]
-                return {
-                    "cards": fallback_cards,
-                    "summary": "Ваши карты указывают на интересный период в жизни. Доверяйте своей интуиции и будьте открыты новым возможностям.",
-                    "recommended_drink": "Виски с колой - классика, которая никогда не подведет."
-                }
-        else:
-            # Если карт меньше 3, используем все имеющиеся
-            if len(tarot_cards) < 3:
-                selected_cards = tarot_cards
-            else:
-                selected_cards = random.sample(tarot_cards, 3)
-    
-        # Генерируем общее толкование через GPT
-        cards_info = ", ".join([card["name"] for card in selected_cards])
-        prompt = f"""На основе следующих карт Таро создай общее толкование расклада и рекомендуемый алкогольный напиток:
-Карты: {cards_info}
+    Raises:
+        Исключения генерации и разбора ответа пробрасываются вызывающему коду
+    """
+    card_sets = [draw_tarot_cards(3) for _ in range(count)]
+    text = await generation_service.complete(
+        build_batch_interpretation_prompt(card_sets),
+        temperature=0.7,
+        max_tokens=BATCH_PROMPT.max_tokens(count)
+    )
+    BATCH_PROMPT.observe(text, units=count)
+    readings = parse_batch_interpretations(text, card_sets)
+    if len(readings) < count:
+        print(f"Пакетная генерация: получено {len(readings)} раскладов из {count}")
+    return readings
 
-Ответ должен содержать:
-1. Общее толкование расклада (2-3 предложения)
-2. Рекомендуемый алкогольный напиток с кратким юмористическим объяснением
+async def generate_tarot_reading(birthdate: str = None, use_fallback: bool = True):
+    """Генерирует полное гадание на Таро с учетом даты рождения для премиум-гадания
 
-Формат ответа должен быть в виде JSON:
-{{
-  "summary": "Общее толкование расклада",
-  "recommended_drink": "Рекомендуемый напиток с объяснением"
-}}"""
+    Карты вытягиваются из локальной колоды, через GPT генерируется только толкование.
+
+    Args:
+        birthdate: Дата рождения для премиум-гадания
+        use_fallback: Возвращать запасной расклад при ошибке (иначе исключение пробрасывается)
+    """
+    try:
+        # Вытягиваем карты из локальной колоды - модель пишет только толкование
+        selected_cards = draw_tarot_cards(3)
+        prompt = build_interpretation_prompt(selected_cards, birthdate)
     
         try:
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "system", "content": prompt}],
+            # Ответ разбирается по схеме (с одной попыткой исправления); персональное толкование не кэшируем
+            interpretation = await complete_structured(
+                prompt,
+                PremiumInterpretation if birthdate else StandardInterpretation,
+                name="premium" if birthdate else "standard",
                 temperature=0.7,
-                max_tokens=300
+                max_tokens=(PREMIUM_PROMPT if birthdate else STANDARD_PROMPT).max_tokens(),
+                cache=not birthdate
             )
             
-            # Пытаемся распарсить JSON из ответа
-            interpretation_text = response.choices[0].message.content
-            interpretation = json.loads(interpretation_text)
-            
-            return {
-                "cards": selected_cards,
-                "summary": interpretation.get("summary", "Ваши карты указывают на интересный период в жизни."),
-                "recommended_drink": interpretation.get("recommended_drink", "Виски с колой - классика, которая никогда не подведет.")
-            }
+            reading = {"cards": selected_cards, **interpretation.model_dump(exclude_none=True)}
+            return reading
         except Exception as e:
             print(f"Ошибка при генерации толкования через GPT: {e}")
+            if not use_fallback:
+                raise
             # Используем стандартное толкование в случае ошибки
             return {
                 "cards": selected_cards,
-                "summary": "Ваши карты указывают на интересный период в жизни. Доверяйте своей интуиции и будьте открыты новым возможностям.",
-                "recommended_drink": "Виски с колой - классика, которая никогда не подведет."
+                "summary": FALLBACK_SUMMARY,
+                "recommended_drink": FALLBACK_DRINK
             }
     except Exception as e:
         print(f"Общая ошибка при генерации гадания: {e}")
         # Используем fallback карты в случае ошибки
-        fallback_cards = [
-            {"name": "Шут", "description": "Новые начинания и приключения", "drunk_interpretation": "Время для спонтанных решений и веселья!"},
-            {"name": "Маг", "description": "Сила воли и манипуляция энергиями", "drunk_interpretation": "Ваши способности усиливаются с каждым бокалом!"},
-            {"name": "Верховная Жрица", "description": "Интуиция и тайные знания", "drunk_interpretation": "Доверьтесь внутреннему голосу, особенно после третьего шота!"}
-        ]
-        return {
-            "cards": fallback_cards,
-            "summary": "Ваши карты указывают на интересный период в жизни. Доверяйте своей интуиции и будьте открыты новым возможностям.",
-            "recommended_drink": "Виски с колой - классика, которая никогда не подведет."
-        }
+        if not use_fallback:
+            raise
+        return create_fallback_reading()
 
 async def generate_tarot_message():
     """Генерирует сообщение от таролога через ChatGPT API"""
     try:
-        response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "system", "content": PROMPT_TAROT_MESSAGE}],
-                temperature=0.7,
-                max_tokens=200
-            )
-        return response.choices[0].message.content
+        text = await generation_service.complete(
+            MESSAGE_PROMPT.render(),
+            temperature=0.7,
+            max_tokens=MESSAGE_PROMPT.max_tokens(),
+            cache=True,
+            prompt_name=MESSAGE_PROMPT.name
+        )
+        return text
     except Exception as e:
         print(f"Ошибка при генерации сообщения через GPT: {e}")
         # Возвращаем стандартное сообщение в случае ошибки
         return "Карты говорят, что вам стоит выпить что-нибудь крепкое и не принимать важных решений в ближайшее время. Удача улыбнется вам после третьего бокала!"
 
+async def generate_test_reading():
+    """Генерирует тестовое гадание на одной карте из колоды с посланием от ChatGPT
+
+    Raises:
+        ModelOutputError: если ответ модели не содержит нужных данных и после исправления
+    """
+    # Карта вытягивается из локальной колоды, модель пишет только послание
+    card = tarot_deck.draw(1)[0]
+    reading_data = await complete_structured(
+        TEST_PROMPT.render(card_name=card.name),
+        TestReadingMessage,
+        name="test",
+        temperature=0.7,
+        max_tokens=TEST_PROMPT.max_tokens()
+    )
+    return {
+        "card_name": card.name,
+        "description": card.description,
+        "drunk_interpretation": card.drunk_interpretation,
+        "tarot_message": reading_data.tarot_message
+    }
+
+async def take_standard_reading():
+    """Берет стандартный расклад из пула, а при пустом пуле генерирует его через GPT"""
+    reading = reading_pool.take()
+    if reading is None:
+        reading = await generate_tarot_reading()
+    return reading
+
+async def take_test_reading():
+    """Берет тестовое гадание из пула, а при пустом пуле генерирует его через ChatGPT"""
+    reading_data = test_reading_pool.take()
+    if reading_data is None:
+        try:
+            reading_data = await generate_test_reading()
+        except (ModelOutputError, CircuitOpenError) as e:
+            # Если ответ не удалось разобрать даже после исправления или API сейчас недоступен
+            print(f"Ошибка при генерации тестового гадания: {e}")
+            
+            # Используем запасные данные
+            reading_data = FALLBACK_TEST_READING
+    return reading_data
+
+async def _produce_standard_reading():
+    """Генерирует стандартный расклад для пула (без запасных данных)"""
+    return await generate_tarot_reading(use_fallback=False)
+
+# Пулы готовых раскладов, пополняемые в фоне; стандартные расклады генерируются пачками
+reading_pool = ReadingPool("standard", _produce_standard_reading, batch_producer=generate_tarot_readings)
+test_reading_pool = ReadingPool("test", generate_test_reading)
+
+@router.startup()
+async def start_reading_pools():
+    """Запускает фоновое пополнение пулов раскладов при старте бота"""
+    reading_pool.start()
+    test_reading_pool.start()
+
+@router.startup()
+async def report_prompt_budget():
+    """Выводит размеры шаблонов промптов в токенах и их лимиты ответа при старте бота"""
+    print(prompt_registry.report())
+
+@router.shutdown()
+async def stop_reading_pools():
+    """Останавливает фоновое пополнение пулов раскладов"""
+    await reading_pool.stop()
+    await test_reading_pool.stop()
+
+@router.shutdown()
+async def close_premium_cache():
+    """Закрывает дисковый уровень кэша персональных разделов"""
+    premium_cache.close()
+
+@router.shutdown()
+async def close_test_readings_store():
+    """Закрывает хранилище тестовых раскладов"""
+    await test_readings_store.close()
+
 # Обработчик ввода даты рождения для премиум-гадания
-@router.message(PremiumReadingStates.waiting_for_birthdate)
+@router.message(PremiumReadingStates.waiting_for_birthdate, F.text)
 async def process_birthdate(message: Message, state: FSMContext):
     """Обработчик ввода даты рождения для премиум-гадания"""
     # Получаем дату рождения из сообщения
     birthdate = message.text.strip()
     
-    # Проверяем формат даты (простая проверка)
-    import re
-    if not re.match(r'^\d{2}\.\d{2}\.\d{4}$', birthdate):
-        await message.answer(
-            "❌ Пожалуйста, введите дату в формате ДД.ММ.ГГГГ (например, 15.05.1990).",
-            parse_mode="HTML"
-        )
+    # Проверяем формат даты и что такая дата существует (знак зодиака и число судьбы считаются по ней)
+    if not re.match(r'^\d{2}\.\d{2}\.\d{4}$', birthdate) or astro.parse_date(birthdate) is None:
+        await message.answer(TEXTS["invalid_birthdate"], parse_mode="HTML")
         return
     
     # Сохраняем дату рождения в состоянии
@@ -859,193 +730,170 @@ async def process_birthdate(message: Message, state: FSMContext):
     # Для бесплатных пользователей сразу показываем гадание с анимацией
     await show_premium_reading_with_animation(message, birthdate)
 
-async def show_premium_reading_with_animation(message: Message, birthdate: str):
-    """Показывает премиум-гадание с анимацией и задержками"""
-    # Отправляем сообщение о начале гадания
-    await message.answer(
-        "<b>🔮 Начинаю индивидуальное гадание...</b>",
-        parse_mode="HTML"
-    )
-    
-    # Генерируем премиум-гадание с учетом даты рождения
-    reading = await generate_tarot_reading(birthdate)
-    
-    # Задержка перед первой картой
-    await asyncio.sleep(2)
+async def stream_tarot_reading(birthdate: str = None):
+    """Потоково генерирует гадание: карты из локальной колоды, толкование через GPT
     
-    # Сообщение о перемешивании карт
-    shuffling_msg = await message.answer(
-        "<b>🃏 Перемешиваю карты...</b>",
-        parse_mode="HTML"
-    )
-    
-    # Задержка перед первой картой
-    await asyncio.sleep(3)
-    
-    # Сообщение о вытягивании первой карты
-    await message.answer(
-        "<b>🃏 Вытягиваю карту...</b>",
-        parse_mode="HTML"
-    )
-    
-    # Небольшая задержка для эффекта
-    await asyncio.sleep(1.5)
-    
-    # Показываем первую карту
-    await message.answer(
-        f"<b>🃏 Первая карта: {reading['cards'][0]['name']}</b>\n\n"
-        f"{reading['cards'][0]['description']}\n\n"
-        f"<b>🍸 Алкогольная интерпретация:</b>\n{reading['cards'][0]['drunk_interpretation']}",
-        parse_mode="HTML"
-    )
-    
-    # Сообщение о перемешивании карт перед второй картой
-    await shuffling_msg.edit_text(
-        "<b>🃏 Снова перемешиваю карты...</b>",
-        parse_mode="HTML"
-    )
-    
-    # Задержка перед второй картой
-    await asyncio.sleep(3)
-    
-    # Сообщение о вытягивании второй карты
-    await message.answer(
-        "<b>🃏 Вытягиваю карту...</b>",
-        parse_mode="HTML"
-    )
-    
-    # Небольшая задержка для эффекта
-    await asyncio.sleep(1.5)
-    
-    # Показываем вторую карту
-    await message.answer(
-        f"<b>🃏 Вторая карта: {reading['cards'][1]['name']}</b>\n\n"
-        f"{reading['cards'][1]['description']}\n\n"
-        f"<b>🍸 Алкогольная интерпретация:</b>\n{reading['cards'][1]['drunk_interpretation']}",
-        parse_mode="HTML"
-    )
-    
-    # Сообщение о перемешивании карт перед третьей картой
-    await shuffling_msg.edit_text(
-        "<b>🃏 Последний раз перемешиваю карты...</b>",
-        parse_mode="HTML"
-    )
-    
-    # Задержка перед третьей картой
-    await asyncio.sleep(3)
+    Yields:
+        События (путь, значение): каждую карту ("cards", i), затем остальные поля ("ключ",)
+    """
+    # Карты вытягиваются из локальной колоды и доступны сразу
+    cards = draw_tarot_cards(3)
+    for index, card in enumerate(cards):
+        yield ("cards", index), card
+    
+    birth = astro.parse_date(birthdate) if birthdate else None
+    if PREMIUM_CACHE and birth is not None:
+        # Персональные разделы из кэша, модель пишет только толкование карт
+        async for event in stream_premium_interpretation(cards, birthdate, birth):
+            yield event
+        return
     
-    # Сообщение о вытягивании третьей карты
-    await message.answer(
-        "<b>🃏 Вытягиваю карту...</b>",
-        parse_mode="HTML"
+    parser = IncrementalJSONParser()
+    prompt = PREMIUM_PROMPT if birthdate else STANDARD_PROMPT
+    async for chunk in generation_service.stream(
+        build_interpretation_prompt(cards, birthdate),
+        temperature=0.7,
+        max_tokens=prompt.max_tokens(),
+        prompt_name=prompt.name
+    ):
+        for event in parser.feed(chunk):
+            yield event
+
+async def generate_astro_sections(birthdate: str, day: datetime.date):
+    """Генерирует астрологический и нумерологический анализ для даты рождения на день day"""
+    sections = await complete_structured(
+        ASTRO_PROMPT.render(birthdate=birthdate, facts=build_astro_facts(birthdate, day)),
+        AstroSections,
+        name="astro",
+        temperature=0.7,
+        max_tokens=ASTRO_PROMPT.max_tokens()
     )
+    return sections.model_dump()
+
+async def get_astro_sections(birthdate: str, birth: datetime.date):
+    """Берет персональные разделы из кэша или генерирует их; при ошибке возвращает пустой словарь"""
+    today = datetime.date.today()
+    try:
+        return await premium_cache.get_or_create(
+            birth, today, ASTRO_PROMPT.version(), partial(generate_astro_sections, birthdate, today)
+        )
+    except Exception as e:
+        print(f"Ошибка при генерации астрологического анализа через GPT: {e}")
+        return {}
+
+async def stream_premium_interpretation(cards: list, birthdate: str, birth: datetime.date):
+    """Потоково генерирует толкование карт премиум-расклада, персональные разделы берет из кэша
+
+    Если разделов для этой даты рождения сегодня еще нет, они генерируются
+    параллельно с толкованием карт.
     
-    # Небольшая задержка для эффекта
-    await asyncio.sleep(1.5)
-    
-    # Показываем третью карту
-    await message.answer(
-        f"<b>🃏 Третья карта: {reading['cards'][2]['name']}</b>\n\n"
-        f"{reading['cards'][2]['description']}\n\n"
-        f"<b>🍸 Алкогольная интерпретация:</b>\n{reading['cards'][2]['drunk_interpretation']}",
-        parse_mode="HTML"
-    )
+    Yields:
+        События толкования карт ("ключ",), затем ("astrology",) и ("numerology",)
+    """
+    sections = asyncio.ensure_future(get_astro_sections(birthdate, birth))
+    try:
+        parser = IncrementalJSONParser()
+        async for chunk in generation_service.stream(
+            build_premium_cards_prompt(cards, birthdate),
+            temperature=0.7,
+            max_tokens=PREMIUM_CARDS_PROMPT.max_tokens(),
+            prompt_name=PREMIUM_CARDS_PROMPT.name
+        ):
+            for event in parser.feed(chunk):
+                yield event
+        for key, value in (await sections).items():
+            yield (key,), value
+    finally:
+        # Генерация разделов продолжится в кэше, даже если толкование прервалось
+        sections.cancel()
+
+# Подписи карт премиум-гадания и тексты перемешивания перед следующей картой
+PREMIUM_CARD_TITLES = ["Первая карта", "Вторая карта", "Третья карта"]
+PREMIUM_SHUFFLE_TEXTS = [
+    "<b>🃏 Снова перемешиваю карты...</b>",
+    "<b>🃏 Последний раз перемешиваю карты...</b>",
+    "<b>✨ Поддаюсь небесам и готовлю вердикт...</b>"
+]
+
+async def show_premium_reading_with_animation(message: Message, birthdate: str):
+    """Показывает премиум-гадание с анимацией и задержками
     
-    # Сообщение о подготовке вердикта
-    await shuffling_msg.edit_text(
-        "<b>✨ Поддаюсь небесам и готовлю вердикт...</b>",
-        parse_mode="HTML"
-    )
+    Карты показываются по мере того, как модель их генерирует (потоковый режим).
+    """
+    # Все служебные кадры показываются в одном сообщении, которое редактируется
+    status = AnimationMessage(message)
+    show_start = partial(status.show, TEXTS["premium_start"], parse_mode="HTML")
+    show_shuffling = partial(status.show, TEXTS["premium_shuffling"], parse_mode="HTML")
     
-    # Задержка перед финальным вердиктом
-    await asyncio.sleep(4)
+    # Генерируем премиум-гадание с учетом даты рождения в потоковом режиме
+    streamed = StreamedReading(stream_tarot_reading(birthdate), fallback=create_fallback_reading())
+    try:
+        # Анимация идет, пока модель не выдаст первую карту
+        await run_with_animation(
+            streamed.card(0),
+            [(show_start, 2), (show_shuffling, 3)]
+        )
+        
+        for index, title in enumerate(PREMIUM_CARD_TITLES):
+            # Кадр о вытягивании карты
+            await status.show(TEXTS["premium_drawing"], parse_mode="HTML")
+            
+            # Небольшая задержка для эффекта, пока карта догенерируется
+            card, _ = await asyncio.gather(streamed.card(index), tracing.sleep(1.5))
+            
+            # Показываем карту
+            await message.answer(
+                PREMIUM_CARD.render(title=title, **card),
+                parse_mode=PREMIUM_CARD.parse_mode
+            )
+            
+            # Кадр о перемешивании карт перед следующей картой или вердиктом
+            await status.show(PREMIUM_SHUFFLE_TEXTS[index], parse_mode="HTML")
+            
+            # Задержка перед следующей картой (перед вердиктом - дольше)
+            if index < len(PREMIUM_CARD_TITLES) - 1:
+                await tracing.sleep(3)
+        
+        # Задержка перед финальным вердиктом, пока догенерируются остальные поля
+        reading, _ = await asyncio.gather(streamed.result(), tracing.sleep(4))
+    finally:
+        streamed.cancel()
     
     # Проверяем, есть ли астрологические и нумерологические данные (для премиум-гадания)
     if 'astrology' in reading and 'numerology' in reading:
         # Отправляем астрологический и нумерологический анализ
-        await message.answer(
-            f"<b>🌟 Астрологический анализ:</b>\n\n{reading['astrology']}\n\n"
-            f"<b>🔢 Нумерологический анализ:</b>\n{reading['numerology']}",
-            parse_mode="HTML"
-        )
+        await message.answer(PREMIUM_ANALYSIS.render(reading), parse_mode=PREMIUM_ANALYSIS.parse_mode)
         
         # Небольшая задержка для лучшего восприятия
-        await asyncio.sleep(2)
+        await tracing.sleep(2)
         
+    # Персональный совет показываем, только если модель успела его сгенерировать (в запасном раскладе его нет)
+    if 'personal_advice' in reading:
         # Отправляем персональный совет и общее толкование
-        await message.answer(
-            f"<b>🔮 Общее толкование расклада:</b>\n\n{reading['summary']}\n\n"
-            f"<b>💫 Персональный совет:</b>\n{reading['personal_advice']}\n\n"
-            f"<b>🍸 Рекомендуемый напиток:</b>\n{reading['recommended_drink']}",
-            parse_mode="HTML"
-        )
-        
-        # Добавляем кнопки для нового расклада и возврата назад
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        builder.button(text="🔮 Сделать новый расклад", callback_data="start_reading")
-        builder.button(text="🏠 Вернуться в меню", callback_data="return_to_menu")
-        builder.adjust(1)  # Размещаем кнопки в один столбец
-        
-        await message.answer(
-            "Хотите сделать новый расклад или вернуться в главное меню?",
-            reply_markup=builder.as_markup()
-        )
+        await message.answer(PREMIUM_SUMMARY.render(reading), parse_mode=PREMIUM_SUMMARY.parse_mode)
     else:
         # Для обычного гадания отправляем только общее толкование
-        await message.answer(
-            f"<b>🔮 Общее толкование расклада:</b>\n\n{reading['summary']}\n\n"
-            f"<b>🍸 Рекомендуемый напиток:</b>\n{reading['recommended_drink']}",
-            parse_mode="HTML"
-        )
-        
-        # Добавляем кнопки для нового расклада и возврата назад
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        builder.button(text="🔮 Сделать новый расклад", callback_data="start_reading")
-        builder.button(text="🏠 Вернуться в меню", callback_data="return_to_menu")
-        builder.adjust(1)  # Размещаем кнопки в один столбец
-        
-        await message.answer(
-            "Хотите сделать новый расклад или вернуться в главное меню?",
-            reply_markup=builder.as_markup()
-        )
-
-async def fetch_tarot_cards_gpt():
-    """Получает карты Таро через ChatGPT API"""
-
+        await message.answer(STANDARD_SUMMARY.render(reading), parse_mode=STANDARD_SUMMARY.parse_mode)
+    
+    # Добавляем кнопки для нового расклада и возврата назад
+    await message.answer(TEXTS["new_reading_or_menu"], reply_markup=KEYBOARDS["after_reading"])
 
-recommended_drinks = [
-    "Виски с колой - классика никогда не подводит!",
-    "Мохито - освежающий выбор для новых начинаний.",
-    "Кровавая Мэри - идеально для интуитивных решений.",
-    "Маргарита - сбалансированный выбор для любой ситуации.",
-    "Пина Колада - сладкий вкус успеха ждет вас!"
+# Кадры анимации перемешивания и выбора карт: (текст, пауза после кадра в секундах)
+TAROT_ANIMATION_FRAMES = [
+    ("🔮 Перемешиваю карты...", 1),
+    ("🃏 Выбираю карты для вашего расклада...", 1),
+    ("✨ Настраиваюсь на вашу энергетику...", 1),
+    ("🍸 Добавляю алкогольную интерпретацию...", 1)
 ]
 
-@router.message(Command("reading"))
-async def cmd_reading(message: Message):
-    """Обработчик команды /reading"""
-    await message.answer(
-        "🔮 *Пьяное Таро* 🍸\n\n"
-        "Я проведу для вас гадание на картах Таро с алкогольной интерпретацией!\n"
-        "Стоимость гадания: 100 Stars.\n\n"
-        "Нажмите кнопку ниже, чтобы оплатить и получить гадание.",
-        parse_mode="Markdown"
-    )
+async def show_tarot_animation(message: Message, task: asyncio.Future = None):
+    """Показывает анимацию перемешивания и выбора карт
     
-    # Создаем счет для оплаты
-    from aiogram import Bot
-    bot = Bot.get_current()
-    await create_invoice(bot, message.chat.id)
-
-async def show_tarot_animation(message: Message):
-    """Показывает анимацию перемешивания и выбора карт"""
-    await message.answer("🔮 Перемешиваю карты...")
-    await asyncio.sleep(1)
-    await message.answer("🃏 Выбираю карты для вашего расклада...")
-    await asyncio.sleep(1)
-    await message.answer("✨ Настраиваюсь на вашу энергетику...")
-    await asyncio.sleep(1)
-    await message.answer("🍸 Добавляю алкогольную интерпретацию...")
-    await asyncio.sleep(1)
+    Args:
+        message: Сообщение, в чат которого отправляется анимация
+        task: Задача генерации расклада; анимация заканчивается, как только она готова
+    """
+    # Кадры сменяют друг друга в одном сообщении
+    animation = AnimationMessage(message)
+    frames = [(partial(animation.show, text), delay) for text, delay in TAROT_ANIMATION_FRAMES]
+    await animate_while(task, frames)
@@ -1,8 +1,10 @@
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread
 import logging
 import os
 
+from services import metrics
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -22,6 +24,11 @@ def ping():
     """Эндпоинт для пинга от внешних сервисов."""
     return "pong"
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики бота в текстовом формате Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 def run():
     """Запускает Flask сервер на порту 8080."""
     port = int(os.environ.get('PORT', 8080))
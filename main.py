@@ -1,18 +1,32 @@
-import asyncio
-import logging
 import sys
-from os import getenv
 
 # Добавляем корневую директорию проекта в sys.path
 sys.path.insert(0, '.')
 
+# С флагом --profile-startup замеряем время импортов и время до первого обновления,
+# поэтому профилировщик подключается раньше всех остальных модулей
+from services import startup_profile
+if '--profile-startup' in sys.argv:
+    startup_profile.enable()
+
+import asyncio
+import logging
+import signal
+from os import getenv
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
 # Импортируем роутеры обработчиков
 from handlers.tarot_handlers import router as tarot_router
 from handlers.payment_handlers import router as payment_router
+from services import generation_service
+from services.fsm_storage import create_fsm_storage
+from services.metrics import setup_metrics, start_metrics_server
+from services.tracing import setup_tracing
+from services.polling import run_polling
+from services.outbound_scheduler import OutboundScheduler
+from services.update_dedup import setup_update_deduplication
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -32,22 +46,57 @@ if not BOT_TOKEN:
 # Инициализация бота и диспетчера
 from aiogram.client.default import DefaultBotProperties
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
+dp = Dispatcher(storage=create_fsm_storage())
+# Трассировка (TRACING=jsonl или otlp) подключается до планировщика,
+# чтобы спаны запросов к Bot API включали ожидание в нем
+setup_tracing(dp, bot)
+# Исходящие запросы проходят через планировщик с учетом лимитов Telegram
+scheduler = OutboundScheduler()
+bot.session.middleware(scheduler)
 
 # Регистрация обработчиков
 dp.include_router(tarot_router)
 dp.include_router(payment_router)
 
-async def main():
-    """Запуск бота в режиме long polling."""
-    # Удаляем вебхук перед запуском long polling
-    await bot.delete_webhook(drop_pending_updates=True)
+# Повторно доставленные обновления и платежи обрабатываются один раз
+setup_update_deduplication(dp)
+
+# Метрики обработчиков, запросов к OpenAI и Telegram (в режиме long polling их отдает
+# сервер /metrics на METRICS_PORT, под start_replit.py - сервер keep_alive)
+setup_metrics(dp, bot, scheduler=scheduler)
+
+startup_profile.mark("импорты и диспетчер")
+
+async def main(metrics_server=True):
+    """Запуск бота в режиме long polling.
+
+    Args:
+        metrics_server: Запустить сервер /metrics (False, если метрики уже отдает другой сервер)
+    """
+    # SIGTERM и SIGINT - сигнал плавной остановки: перестаем получать обновления
+    # и дорабатываем уже полученные (в том числе оплаченные расклады)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    # Удаляем вебхук перед запуском long polling. Накопившиеся обновления не сбрасываем:
+    # они пришли, пока бот перезапускался, а уже обработанные отсечет защита от повторов
+    await bot.delete_webhook(drop_pending_updates=False)
     logging.info("Бот запущен в режиме long polling")
     logging.info(f"Имя бота: {(await bot.get_me()).username}")
     print("Бот успешно запущен! Отправьте команду /start в Telegram.")
     
+    metrics_runner = await start_metrics_server() if metrics_server else None
+
     # Запускаем long polling
-    await dp.start_polling(bot)
+    try:
+        await run_polling(dp, bot, stop)
+    finally:
+        # Закрываем пул соединений к OpenAI API (хранилище FSM закрывает диспетчер)
+        await generation_service.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,183 @@
+"""Астрологические и нумерологические факты по дате
+
+Знак зодиака, число жизненного пути и приблизительная фаза Луны считаются
+локально, чтобы модель не вычисляла их сама: она получает готовые факты в
+промпте и пишет только текст. Так ответ короче, а знак и число всегда верные.
+
+Знак зодиака берется из таблицы на 366 дней года, фаза Луны - по средней
+длине синодического месяца от известного новолуния (точность около суток).
+Функции *_many считают то же для последовательности дат за один проход с теми
+же таблицами (для пакетных задач). Факты по дате рождения и по текущему дню
+запоминаются (lru_cache): дата рождения у пользователя одна, а день - общий
+для всех раскладов за сутки.
+"""
+import datetime
+import math
+from functools import lru_cache
+
+# Знаки зодиака: (название, месяц и день начала)
+ZODIAC_SIGNS = [
+    ("Козерог", 12, 22),
+    ("Водолей", 1, 20),
+    ("Рыбы", 2, 19),
+    ("Овен", 3, 21),
+    ("Телец", 4, 20),
+    ("Близнецы", 5, 21),
+    ("Рак", 6, 21),
+    ("Лев", 7, 23),
+    ("Дева", 8, 23),
+    ("Весы", 9, 23),
+    ("Скорпион", 10, 23),
+    ("Стрелец", 11, 22)
+]
+
+# Фазы Луны по восьмым долям синодического месяца, начиная с новолуния
+MOON_PHASES = [
+    "Новолуние", "Растущий серп", "Первая четверть", "Растущая луна",
+    "Полнолуние", "Убывающая луна", "Последняя четверть", "Убывающий серп"
+]
+
+# Средняя длина синодического месяца в сутках и новолуние 6 января 2000 года, 18:14 UTC
+SYNODIC_MONTH = 29.530588853
+_REFERENCE_NEW_MOON = datetime.date(2000, 1, 6).toordinal() + (18 * 60 + 14) / 1440
+
+# Мастер-числа нумерологии не сокращаются до одной цифры
+MASTER_NUMBERS = (11, 22, 33)
+
+# Сколько дат рождения и дней держать в памяти
+BIRTH_CACHE_SIZE = 4096
+DAY_CACHE_SIZE = 64
+
+# Номер дня в високосном году -> индекс знака зодиака
+_LEAP_YEAR = 2000
+
+
+def _build_sign_table():
+    # Знаки по дате начала внутри года; до 20 января продолжается Козерог (последний в году)
+    starts = sorted((month, start_day, position) for position, (_, month, start_day) in enumerate(ZODIAC_SIGNS))
+    table = []
+    day = datetime.date(_LEAP_YEAR, 1, 1)
+    for _ in range(366):
+        index = starts[-1][2]
+        for month, start_day, position in starts:
+            if (day.month, day.day) >= (month, start_day):
+                index = position
+        table.append(index)
+        day += datetime.timedelta(days=1)
+    return table
+
+
+_SIGN_BY_DAY = _build_sign_table()
+
+# Номер первого дня каждого месяца в високосном году
+_MONTH_OFFSETS = [datetime.date(_LEAP_YEAR, month, 1).timetuple().tm_yday - 1 for month in range(1, 13)]
+
+
+def parse_date(text):
+    """Разбирает дату в формате ДД.ММ.ГГГГ
+
+    Returns:
+        datetime.date или None, если такой даты нет (например, 31.02.1990)
+    """
+    try:
+        return datetime.datetime.strptime(text.strip(), "%d.%m.%Y").date()
+    except ValueError:
+        return None
+
+
+def zodiac_sign(date):
+    """Знак зодиака для даты"""
+    return ZODIAC_SIGNS[_SIGN_BY_DAY[_MONTH_OFFSETS[date.month - 1] + date.day - 1]][0]
+
+
+def _reduce(number):
+    while number > 9 and number not in MASTER_NUMBERS:
+        number = sum(map(int, str(number)))
+    return number
+
+
+def life_path_number(date):
+    """Число жизненного пути: сумма цифр даты, сокращенная до одной цифры или мастер-числа
+
+    День, месяц и год сокращаются по отдельности, затем складываются.
+    """
+    return _reduce(_reduce(date.day) + _reduce(date.month) + _reduce(date.year))
+
+
+def moon_age(date):
+    """Возраст Луны в сутках (0 - новолуние) на полдень даты"""
+    return (date.toordinal() + 0.5 - _REFERENCE_NEW_MOON) % SYNODIC_MONTH
+
+
+def _phase(age):
+    share = age / SYNODIC_MONTH
+    index = int(share * len(MOON_PHASES) + 0.5) % len(MOON_PHASES)
+    return MOON_PHASES[index], (1 - math.cos(2 * math.pi * share)) / 2
+
+
+def moon_phase(date):
+    """Приблизительная фаза Луны на дату
+
+    Returns:
+        (название фазы, доля освещенного диска от 0 до 1)
+    """
+    return _phase(moon_age(date))
+
+
+def zodiac_signs_many(dates):
+    """Знаки зодиака для последовательности дат"""
+    offsets, table = _MONTH_OFFSETS, _SIGN_BY_DAY
+    return [ZODIAC_SIGNS[table[offsets[date.month - 1] + date.day - 1]][0] for date in dates]
+
+
+def life_path_numbers_many(dates):
+    """Числа жизненного пути для последовательности дат
+
+    Сокращение дня, месяца и года запоминается, поэтому на большом массиве
+    дат каждое значение считается один раз.
+    """
+    reduce = lru_cache(maxsize=None)(_reduce)
+    return [reduce(reduce(date.day) + reduce(date.month) + reduce(date.year)) for date in dates]
+
+
+def moon_phases_many(dates):
+    """Фазы Луны для последовательности дат: список (название фазы, освещенность)"""
+    reference = _REFERENCE_NEW_MOON - 0.5
+    return [_phase((date.toordinal() - reference) % SYNODIC_MONTH) for date in dates]
+
+
+@lru_cache(maxsize=BIRTH_CACHE_SIZE)
+def birth_facts(birthdate):
+    """Факты по дате рождения (запоминаются)
+
+    Returns:
+        Словарь zodiac_sign, life_path_number
+    """
+    return {"zodiac_sign": zodiac_sign(birthdate), "life_path_number": life_path_number(birthdate)}
+
+
+@lru_cache(maxsize=DAY_CACHE_SIZE)
+def day_facts(day):
+    """Факты по текущему дню (запоминаются)
+
+    Returns:
+        Словарь moon_phase, moon_illumination
+    """
+    phase, illumination = moon_phase(day)
+    return {"moon_phase": phase, "moon_illumination": illumination}
+
+
+@lru_cache(maxsize=BIRTH_CACHE_SIZE)
+def describe(birthdate, day):
+    """Факты для промпта премиум-толкования одной строкой на факт
+
+    Args:
+        birthdate: Дата рождения (datetime.date)
+        day: Текущая дата (datetime.date)
+    """
+    birth = birth_facts(birthdate)
+    today = day_facts(day)
+    return (f"Знак зодиака: {birth['zodiac_sign']}\n"
+            f"Число жизненного пути: {birth['life_path_number']}\n"
+            f"Фаза Луны на {day:%d.%m.%Y}: {today['moon_phase']}, "
+            f"освещено {today['moon_illumination']:.0%} диска")
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# По скольким последним запросам считать долю ошибок и медленных ответов
+CIRCUIT_WINDOW = int(os.getenv('CIRCUIT_WINDOW', 20))
+
+# Минимальное количество запросов в окне, после которого цепь может разомкнуться
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', 10))
+
+# Доля ошибок, при которой цепь размыкается
+CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', 0.5))
+
+# Запрос дольше стольких секунд считается медленным; доля медленных, при которой цепь размыкается
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', 10))
+CIRCUIT_SLOW_RATE = float(os.getenv('CIRCUIT_SLOW_RATE', 0.8))
+
+# Сколько секунд цепь остается разомкнутой перед пробным запросом
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', 30))
+
+# Сколько последних переключений состояния хранить для статистики
+CIRCUIT_HISTORY = 50
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Цепь разомкнута: запрос к API не выполняется, вызывающий код сразу берет запасной вариант"""
+
+
+def is_upstream_failure(error):
+    """Возвращает True, если ошибка говорит о проблеме API, а не о некорректном запросе"""
+    status = getattr(error, 'status_code', None)
+    if status is not None and 400 <= status < 500 and status not in (408, 409, 429):
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """Предохранитель для запросов к внешнему API
+
+    В замкнутом состоянии запросы выполняются, а их исходы (ошибка или время
+    ответа) запоминаются в окне из window последних запросов. Когда доля ошибок
+    или медленных ответов превышает порог, цепь размыкается: запросы сразу
+    завершаются CircuitOpenError, не занимая обработчики на время таймаута.
+    Через open_seconds пропускается один пробный запрос: если он успешен,
+    цепь замыкается, иначе снова размыкается.
+
+    Args:
+        name: Имя для логов и статистики
+        window: Количество последних запросов в окне
+        min_calls: Минимальное количество запросов для размыкания
+        error_rate: Порог доли ошибок
+        slow_call_seconds: Время ответа, начиная с которого запрос медленный
+        slow_rate: Порог доли медленных запросов
+        open_seconds: Время в разомкнутом состоянии
+    """
+
+    def __init__(self, name, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS, error_rate=CIRCUIT_ERROR_RATE,
+                 slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS, slow_rate=CIRCUIT_SLOW_RATE,
+                 open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.min_calls = max(1, min(min_calls, window))
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # Исходы последних запросов: (ошибка, медленный)
+        self._outcomes = deque(maxlen=max(1, window))
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.transitions = {}
+        self.history = deque(maxlen=CIRCUIT_HISTORY)
+
+    def _transition(self, state, reason):
+        if state == self.state:
+            return
+        logging.warning(f"Предохранитель {self.name}: {self.state} -> {state} ({reason})")
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.history.append({"at": time.time(), "from": self.state, "to": state, "reason": reason})
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == CLOSED:
+            self._outcomes.clear()
+
+    def reject_if_open(self):
+        """Быстрая проверка до ожидания ресурсов (например, семафора)
+
+        Raises:
+            CircuitOpenError: если цепь разомкнута и время пробного запроса еще не пришло
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at < self.open_seconds:
+            self.rejected += 1
+            raise CircuitOpenError(f"Предохранитель {self.name} разомкнут")
+
+    def _acquire(self):
+        """Проверяет, можно ли выполнить запрос; возвращает True для пробного запроса"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(f"Предохранитель {self.name} разомкнут")
+            self._transition(HALF_OPEN, "истекло время размыкания")
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Предохранитель {self.name} ждет результата пробного запроса")
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def _record(self, failed, latency, probe):
+        slow = latency >= self.slow_call_seconds
+        if probe:
+            self._probe_in_flight = False
+            if failed or slow:
+                self._transition(OPEN, "пробный запрос неуспешен")
+            else:
+                self._transition(CLOSED, "пробный запрос успешен")
+            return
+        if self.state != CLOSED:
+            return
+        self._outcomes.append((failed, slow))
+        if len(self._outcomes) < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        if failures / len(self._outcomes) >= self.error_rate:
+            self._transition(OPEN, f"ошибок {failures} из {len(self._outcomes)}")
+        elif slow_calls / len(self._outcomes) >= self.slow_rate:
+            self._transition(OPEN, f"медленных ответов {slow_calls} из {len(self._outcomes)}")
+
+    async def call(self, func):
+        """Выполняет корутину func() через предохранитель
+
+        Raises:
+            CircuitOpenError: если цепь разомкнута
+        """
+        probe = self._acquire()
+        started_at = time.monotonic()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Отмененный запрос (например, проигравший хедж) ничего не говорит о состоянии API
+            if probe:
+                self._probe_in_flight = False
+            raise
+        except Exception as e:
+            self._record(is_upstream_failure(e), time.monotonic() - started_at, probe)
+            raise
+        self._record(False, time.monotonic() - started_at, probe)
+        return result
+
+    def stats(self):
+        """Возвращает состояние, переключения и количество отклоненных запросов"""
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": failures,
+            "window_slow": slow_calls,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+            "history": list(self.history)
+        }
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Директория для данных бота
+DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent / 'data'
+
+# Тип хранилища состояний FSM: sqlite или memory
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+
+# Путь к базе данных SQLite с состояниями FSM (может быть общей для нескольких процессов)
+FSM_DB_PATH = Path(os.getenv('FSM_DB_PATH', DATA_DIR / 'fsm.sqlite3'))
+
+# Время жизни неиспользуемого состояния в секундах
+FSM_STATE_TTL = float(os.getenv('FSM_STATE_TTL', 7 * 24 * 3600))
+
+# Интервал объединения записей в секундах (0 - запись сразу)
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 0.05))
+
+# Интервал удаления устаревших состояний в секундах
+FSM_CLEANUP_INTERVAL = float(os.getenv('FSM_CLEANUP_INTERVAL', 600))
+
+# Сколько прочитанных состояний держать в памяти процесса (0 - каждое чтение идет в базу)
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))
+
+# Сколько ключей читать из базы одним запросом (ограничение числа параметров SQLite)
+FSM_READ_BATCH = 500
+
+# Маркер "поле не менялось" для отложенных записей
+_UNSET = object()
+
+
+def _key_to_str(key):
+    """Преобразует StorageKey в строковый ключ базы данных"""
+    return (
+        f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+        f"{key.business_connection_id or ''}:{key.destiny}"
+    )
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в SQLite (режим WAL)
+
+    Записи объединяются: изменения копятся в памяти и сбрасываются в базу одной
+    транзакцией раз в flush_interval секунд в отдельном потоке. Чтение сначала
+    смотрит в еще не записанные изменения, затем в базу, поэтому несколько
+    процессов могут работать с одним файлом.
+
+    Чтение из базы тоже выполняется в потоке хранилища и не блокирует event
+    loop. Одновременные чтения объединяются в один запрос, поэтому переключение
+    потоков делится на всех ожидающих. Поток один, поэтому чтение и запись идут
+    по порядку. Несохраненные изменения накладываются сразу после чтения, до
+    того как завершенная запись успеет их забыть. Состояния, не менявшиеся
+    дольше ttl секунд, считаются устаревшими и периодически удаляются.
+
+    Прочитанные состояния запоминаются в памяти (до cache_size ключей, давно
+    не читанные вытесняются), и в поток хранилища уходит только первое чтение
+    ключа; изменения этого процесса обновляют запомненное состояние. Изменения
+    ключа из другого процесса память не видит: при шардировании (bot_service.py)
+    чат обрабатывает только один процесс. Если несколько процессов меняют
+    состояния одних и тех же чатов, задайте cache_size=0 (FSM_CACHE_SIZE=0).
+
+    Args:
+        path: Путь к файлу базы данных
+        ttl: Время жизни неиспользуемого состояния в секундах (0 - без ограничения)
+        flush_interval: Интервал объединения записей в секундах (0 - запись сразу)
+        cleanup_interval: Интервал удаления устаревших состояний в секундах
+        cache_size: Сколько прочитанных состояний держать в памяти
+    """
+
+    def __init__(self, path=FSM_DB_PATH, ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL,
+                 cleanup_interval=FSM_CLEANUP_INTERVAL, cache_size=FSM_CACHE_SIZE):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cleanup_interval = cleanup_interval
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._conn = None
+        # Несохраненные изменения: ключ -> [состояние, данные, время изменения]
+        self._pending = {}
+        # Изменения, которые прямо сейчас записываются в базу
+        self._flushing = {}
+        self._flush_task = None
+        # Ожидающие чтения: ключ -> future с (состояние, данные)
+        self._reads = {}
+        self._read_task = None
+        # Прочитанные состояния: ключ -> [состояние, данные, время изменения или None для пустых]
+        self._cache = OrderedDict()
+        self._last_cleanup = 0.0
+        self._closed = False
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}', "
+            "updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at)")
+        return conn
+
+    def _connect(self):
+        """Соединение с базой (используется только в потоке хранилища)"""
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def _min_updated_at(self):
+        return time.time() - self.ttl if self.ttl > 0 else 0.0
+
+    def _read(self, keys):
+        """Читает записи ключей keys: ключ -> (состояние, данные, время изменения); отсутствующих ключей в ответе нет"""
+        conn = self._connect()
+        min_updated_at = self._min_updated_at()
+        records = {}
+        for start in range(0, len(keys), FSM_READ_BATCH):
+            chunk = keys[start:start + FSM_READ_BATCH]
+            rows = conn.execute(
+                f"SELECT key, state, data, updated_at FROM fsm "
+                f"WHERE key IN ({','.join('?' * len(chunk))}) AND updated_at >= ?",
+                (*chunk, min_updated_at)
+            ).fetchall()
+            for key, state, data, updated_at in rows:
+                records[key] = (state, json.loads(data), updated_at)
+        return records
+
+    def _write(self, pending):
+        conn = self._connect()
+        states = [(key, state, updated_at) for key, (state, _, updated_at) in pending.items() if state is not _UNSET]
+        datas = [
+            (key, json.dumps(data, ensure_ascii=False), updated_at)
+            for key, (_, data, updated_at) in pending.items() if data is not _UNSET
+        ]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO fsm (key, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                states
+            )
+            conn.executemany(
+                "INSERT INTO fsm (key, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                datas
+            )
+            # Пустые записи (после state.clear()) не храним
+            conn.executemany(
+                "DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'",
+                [(key,) for key in pending]
+            )
+            if self.ttl > 0 and time.time() - self._last_cleanup >= self.cleanup_interval:
+                conn.execute("DELETE FROM fsm WHERE updated_at < ?", (self._min_updated_at(),))
+                self._last_cleanup = time.time()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _schedule(self, key, state=_UNSET, data=_UNSET):
+        record = self._pending.get(key)
+        if record is None:
+            record = self._pending[key] = [_UNSET, _UNSET, 0.0]
+        if state is not _UNSET:
+            record[0] = state
+        if data is not _UNSET:
+            record[1] = data
+        record[2] = time.time()
+        cached = self._cache.get(key)
+        if cached is not None:
+            if state is not _UNSET:
+                cached[0] = state
+            if data is not _UNSET:
+                cached[1] = data
+            cached[2] = record[2]
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        if self.flush_interval > 0:
+            await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные изменения в базу одной транзакцией"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self._flushing = pending
+        try:
+            await self._run(self._write, pending)
+        except Exception as e:
+            logging.error(f"Ошибка при записи состояний FSM: {e}")
+            # Возвращаем изменения обратно, не затирая более новые
+            for key, record in pending.items():
+                newer = self._pending.get(key)
+                if newer is None:
+                    self._pending[key] = record
+                else:
+                    if newer[0] is _UNSET:
+                        newer[0] = record[0]
+                    if newer[1] is _UNSET:
+                        newer[1] = record[1]
+        finally:
+            self._flushing = {}
+
+    def _overlay(self, key, state, data, updated_at):
+        """Накладывает на прочитанную запись еще не сохраненные изменения"""
+        for records in (self._flushing, self._pending):
+            record = records.get(key)
+            if record is not None:
+                if record[0] is not _UNSET:
+                    state = record[0]
+                if record[1] is not _UNSET:
+                    data = record[1]
+                updated_at = record[2]
+        return state, data, updated_at
+
+    def _remember(self, key, state, data, updated_at):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = [state, data, updated_at]
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _read_pending(self):
+        """Читает все ожидающие ключи одним обращением к потоку хранилища"""
+        while self._reads:
+            reads, self._reads = self._reads, {}
+            try:
+                records = await self._run(self._read, list(reads))
+            except Exception as e:
+                for future in reads.values():
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            # Изменения накладываются сразу: запись, закончившаяся после чтения, еще не забыта
+            for key, future in reads.items():
+                state, data, updated_at = self._overlay(key, *records.get(key, (None, {}, None)))
+                self._remember(key, state, data, updated_at)
+                if not future.done():
+                    future.set_result((state, data))
+
+    async def _get_record(self, key):
+        record = self._pending.get(key)
+        if record is not None and record[0] is not _UNSET and record[1] is not _UNSET:
+            return record[0], record[1]
+        cached = self._cache.get(key)
+        if cached is not None:
+            # Состояние, устаревшее за время в памяти, читается заново (в базе его уже нет)
+            if cached[2] is None or cached[2] >= self._min_updated_at():
+                self._cache.move_to_end(key)
+                return cached[0], cached[1]
+            del self._cache[key]
+        future = self._reads.get(key)
+        if future is None:
+            future = self._reads[key] = asyncio.get_running_loop().create_future()
+            if self._read_task is None or self._read_task.done():
+                self._read_task = asyncio.create_task(self._read_pending())
+        # Отмена одного ожидающего не отменяет чтение для остальных
+        return await asyncio.shield(future)
+
+    async def set_state(self, key, state=None):
+        self._schedule(_key_to_str(key), state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key):
+        state, _ = await self._get_record(_key_to_str(key))
+        return state
+
+    async def set_data(self, key, data):
+        if not isinstance(data, dict):
+            raise ValueError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        self._schedule(_key_to_str(key), data=json.loads(json.dumps(data)))
+
+    async def get_data(self, key):
+        _, data = await self._get_record(_key_to_str(key))
+        return dict(data)
+
+    async def close(self):
+        # Диспетчер aiogram сам закрывает хранилище при остановке, повторный вызов ничего не делает
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+
+def create_fsm_storage(kind=FSM_STORAGE):
+    """Создает хранилище состояний FSM указанного типа (sqlite или memory)"""
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'sqlite':
+        return SQLiteStorage()
+    raise ValueError(f"Неизвестный тип хранилища FSM: {kind}")
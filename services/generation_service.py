@@ -0,0 +1,324 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from collections import deque
+from functools import partial
+
+from dotenv import load_dotenv
+
+from services import prompt_registry
+from services.circuit_breaker import CircuitBreaker
+from services.response_cache import make_key, response_cache
+from services.single_flight import SingleFlight
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Модель по умолчанию для всех запросов генерации
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+
+# Размер пула HTTP-соединений к OpenAI API
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 30))
+
+# Таймаут одного запроса в секундах (можно переопределить при вызове)
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 30))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+
+# Количество повторов на уровне SDK
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 1))
+
+# Максимальное количество одновременных запросов к OpenAI API
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 50))
+
+# Хеджирование: если ответа нет дольше p95 обычного времени ответа, отправляется второй запрос
+OPENAI_HEDGE = os.getenv('OPENAI_HEDGE', '0') == '1'
+
+# Минимальная задержка хеджа в секундах и минимум замеров для расчета p95
+OPENAI_HEDGE_MIN_DELAY = float(os.getenv('OPENAI_HEDGE_MIN_DELAY', 1))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv('OPENAI_HEDGE_MIN_SAMPLES', 20))
+
+# Сколько последних значений времени ответа учитывать для p95
+LATENCY_SAMPLES = 200
+
+# Общий асинхронный клиент и ограничитель параллельности (создаются при первом запросе)
+_client = None
+_semaphore = None
+
+# Предохранитель: при ошибках или медленных ответах API запросы сразу завершаются CircuitOpenError
+circuit_breaker = CircuitBreaker("openai")
+
+# Время ответа успешных запросов и счетчики хеджирования
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+hedging = {"hedged": 0, "hedge_wins": 0, "primary_wins": 0}
+
+# Объединение одинаковых одновременных запросов
+single_flight = SingleFlight()
+
+# Расход токенов по всем запросам (по данным usage из ответов API)
+usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+# Наблюдатели запросов к API: hook(kind, duration, response_usage, error), kind - "complete" или "stream"
+_call_hooks = []
+
+
+def _record_usage(response_usage):
+    usage["requests"] += 1
+    if response_usage is not None:
+        usage["prompt_tokens"] += response_usage.prompt_tokens or 0
+        usage["completion_tokens"] += response_usage.completion_tokens or 0
+
+
+def add_call_hook(hook):
+    """Подписывает hook(kind, duration, response_usage, error) на завершение каждого запроса к API
+
+    Хук вызывается синхронно после ответа или ошибки API (error равно None при
+    успехе), поэтому должен быть быстрым.
+    """
+    _call_hooks.append(hook)
+
+
+def _notify_call(kind, duration, response_usage=None, error=None):
+    for hook in _call_hooks:
+        try:
+            hook(kind, duration, response_usage, error)
+        except Exception as e:
+            logging.warning(f"Ошибка в хуке запроса к API: {e}")
+
+
+def get_client():
+    """Возвращает общий асинхронный клиент OpenAI с пулом keep-alive соединений"""
+    global _client
+    if _client is None:
+        # openai и httpx импортируются при первом запросе, а не при запуске бота
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+        )
+        _client = AsyncOpenAI(http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+    return _client
+
+
+async def _get_client_async():
+    """Возвращает клиент, импортируя тяжелый пакет openai в отдельном потоке
+
+    Импорт openai занимает сотни миллисекунд; в потоке он не блокирует event loop
+    и не задерживает обработку обновлений сразу после перезапуска.
+    """
+    if _client is None:
+        await asyncio.to_thread(importlib.import_module, 'openai')
+    return get_client()
+
+
+def _get_semaphore():
+    """Возвращает семафор, ограничивающий число одновременных запросов"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def _call_api(prompt, model, temperature, max_tokens, timeout, json_mode, n):
+    """Один запрос к API через семафор и предохранитель"""
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    # Разомкнутая цепь отклоняет запрос сразу, не дожидаясь места в семафоре
+    circuit_breaker.reject_if_open()
+    async with _get_semaphore():
+        client = await _get_client_async()
+        started_at = time.monotonic()
+        try:
+            response = await circuit_breaker.call(partial(
+                client.chat.completions.create,
+                model=model,
+                messages=[{"role": "system", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=n,
+                timeout=timeout,
+                **extra
+            ))
+        except Exception as e:
+            _notify_call("complete", time.monotonic() - started_at, error=e)
+            raise
+        latency = time.monotonic() - started_at
+        _latencies.append(latency)
+    response_usage = getattr(response, 'usage', None)
+    _record_usage(response_usage)
+    _notify_call("complete", latency, response_usage)
+    return [choice.message.content for choice in response.choices]
+
+
+def hedge_delay():
+    """Возвращает задержку хеджа (p95 времени ответа) или None, если хеджирование выключено"""
+    if not OPENAI_HEDGE or len(_latencies) < OPENAI_HEDGE_MIN_SAMPLES:
+        return None
+    latencies = sorted(_latencies)
+    return max(OPENAI_HEDGE_MIN_DELAY, latencies[int(len(latencies) * 0.95)])
+
+
+async def _hedged(request):
+    """Выполняет request(); если ответа нет дольше p95, параллельно отправляет второй и берет первый ответ"""
+    delay = hedge_delay()
+    primary = asyncio.ensure_future(request())
+    if delay is None:
+        return await primary
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        hedging["hedged"] += 1
+        hedge = asyncio.ensure_future(request())
+        pending = {primary, hedge}
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # Ошибка одного запроса не важна, пока второй еще может ответить
+                if task.exception() is None or not pending:
+                    hedging["hedge_wins" if task is hedge else "primary_wins"] += 1
+                    return task.result()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _request_choices(prompt, model, temperature, max_tokens, timeout, json_mode=False, n=1):
+    """Выполняет запрос к API (с хеджированием, если оно включено) и возвращает n вариантов ответа"""
+    return await _hedged(partial(_call_api, prompt, model, temperature, max_tokens, timeout, json_mode, n))
+
+
+async def _request_cached(key, prompt, model, temperature, max_tokens, timeout, json_mode, parse, prompt_name):
+    """Выполняет запрос и сохраняет ответ в кэш (один раз на объединенные запросы)"""
+    content = (await _request_choices(prompt, model, temperature, max_tokens, timeout, json_mode))[0]
+    prompt_registry.observe(prompt_name, content)
+    # В кэш попадают только ответы, прошедшие разбор
+    value = parse(content) if parse else content
+    response_cache.put(key, content)
+    return value
+
+
+async def complete(prompt, model=None, temperature=0.7, max_tokens=500, timeout=None, cache=False, coalesce=True,
+                   json_mode=False, parse=None, prompt_name=None):
+    """Выполняет запрос к Chat Completions API через общий пул соединений
+
+    Одинаковые одновременные запросы объединяются (см. SingleFlight): кэшируемые
+    получают один общий ответ, остальные - разные варианты одного вызова.
+
+    Args:
+        prompt: Текст системного промпта
+        model: Модель OpenAI (по умолчанию OPENAI_MODEL)
+        temperature: Температура генерации
+        max_tokens: Максимальное количество токенов
+        timeout: Таймаут запроса в секундах (по умолчанию OPENAI_TIMEOUT)
+        cache: Использовать кэш ответов (для промптов, не зависящих от пользователя)
+        coalesce: Объединять одинаковые одновременные запросы
+        json_mode: Запросить ответ в режиме JSON (response_format json_object)
+        parse: Функция разбора текста ответа; ее исключения пробрасываются,
+            а неразобранный ответ не попадает в кэш
+        prompt_name: Имя промпта в prompt_registry: новые ответы API (не из кэша)
+            учитываются в его бюджете токенов
+
+    Returns:
+        Текст ответа модели или результат parse(текст)
+
+    Raises:
+        Исключения OpenAI SDK и asyncio.TimeoutError пробрасываются вызывающему коду
+    """
+    model = model or OPENAI_MODEL
+    timeout = timeout or OPENAI_TIMEOUT
+    key = make_key(model, prompt, temperature, max_tokens)
+    if cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            return parse(cached) if parse else cached
+        request = partial(_request_cached, key, prompt, model, temperature, max_tokens, timeout, json_mode, parse,
+                          prompt_name)
+        if not coalesce:
+            return await request()
+        return await single_flight.shared(key, request)
+
+    request = partial(_request_choices, prompt, model, temperature, max_tokens, timeout, json_mode)
+    if not coalesce:
+        content = (await request())[0]
+    else:
+        content = await single_flight.unique(key, request)
+    prompt_registry.observe(prompt_name, content)
+    return parse(content) if parse else content
+
+
+async def stream(prompt, model=None, temperature=0.7, max_tokens=500, timeout=None, prompt_name=None):
+    """Выполняет потоковый запрос к Chat Completions API
+
+    Аргументы такие же, как у complete(). Расход токенов приходит последним
+    фрагментом потока (stream_options include_usage); полностью полученный
+    ответ учитывается в бюджете токенов промпта prompt_name.
+
+    Yields:
+        Фрагменты текста ответа по мере их генерации
+    """
+    timeout = timeout or OPENAI_TIMEOUT
+    circuit_breaker.reject_if_open()
+    async with _get_semaphore():
+        client = await _get_client_async()
+        started_at = time.monotonic()
+        error = None
+        response_usage = None
+        chunks = []
+        try:
+            # Через предохранитель проходит установка соединения и ожидание первого ответа API
+            response = await circuit_breaker.call(partial(
+                client.chat.completions.create,
+                model=model or OPENAI_MODEL,
+                messages=[{"role": "system", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                stream=True,
+                stream_options={"include_usage": True}
+            ))
+            async for chunk in response:
+                if chunk.usage is not None:
+                    response_usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunks[-1]
+            prompt_registry.observe(prompt_name, "".join(chunks))
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Учитываем и прерванный потребителем поток (GeneratorExit): время до прерывания
+            _record_usage(response_usage)
+            _notify_call("stream", time.monotonic() - started_at, response_usage, error)
+
+
+async def close():
+    """Закрывает общий клиент и освобождает соединения пула"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    response_cache.close()
+
+
+def stats():
+    """Возвращает статистику кэша ответов, объединения запросов и расход токенов"""
+    return {
+        "usage": dict(usage),
+        "circuit": circuit_breaker.stats(),
+        "hedging": {**hedging, "delay": hedge_delay()},
+        "cache": response_cache.stats(),
+        "single_flight": single_flight.stats()
+    }
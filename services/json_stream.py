@@ -0,0 +1,124 @@
+import json
+
+
+class _Container:
+    """Открытый JSON-объект или массив внутри потока"""
+
+    __slots__ = ("kind", "start", "path", "key", "index", "expect_key", "value_start", "emitted")
+
+    def __init__(self, kind, start, path):
+        self.kind = kind
+        self.start = start
+        self.path = path
+        self.key = None
+        self.index = 0
+        self.expect_key = kind == "{"
+        self.value_start = None
+        self.emitted = False
+
+    def child_path(self):
+        return self.path + ((self.key,) if self.kind == "{" else (self.index,))
+
+
+class IncrementalJSONParser:
+    """Инкрементальный парсер JSON-объекта, приходящего частями
+
+    Выдает события (путь, значение), как только значение полностью получено:
+    - ("ключ",) - значение верхнего уровня корневого объекта;
+    - ("ключ", индекс) - элемент массива верхнего уровня (например, очередная карта).
+
+    Текст до первой "{" (например, ```json) и после закрытия корня игнорируется.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self.done = False
+
+    def feed(self, chunk):
+        """Добавляет очередной фрагмент текста
+
+        Returns:
+            Список событий (путь, значение), завершенных в этом фрагменте
+        """
+        events = []
+        start = len(self._text)
+        self._text += chunk
+        text = self._text
+        for i in range(start, len(text)):
+            if self.done:
+                break
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1].key = json.loads(text[self._string_start:i + 1])
+                continue
+
+            if not self._stack:
+                # Пропускаем все, что идет до корневого объекта
+                if c == "{":
+                    self._stack.append(_Container("{", i, ()))
+                continue
+
+            top = self._stack[-1]
+            if c in " \t\r\n":
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = top.kind == "{" and top.expect_key
+                if not self._string_is_key and top.value_start is None:
+                    top.value_start = i
+            elif c == ":" and top.kind == "{":
+                top.expect_key = False
+            elif c == ",":
+                self._finish_value(top, i, events)
+                if top.kind == "{":
+                    top.expect_key = True
+            elif c in "}]":
+                self._finish_value(top, i, events)
+                closed = self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    continue
+                # Вложенный контейнер закрыт - выдаем его как значение родителя сразу
+                parent = self._stack[-1]
+                self._emit(parent, text[closed.start:i + 1], events)
+                parent.emitted = True
+            elif c in "{[":
+                if top.value_start is None:
+                    top.value_start = i
+                self._stack.append(_Container(c, i, top.child_path()))
+            elif top.value_start is None:
+                top.value_start = i
+        return events
+
+    def _finish_value(self, container, end, events):
+        had_value = container.value_start is not None
+        if had_value and not container.emitted:
+            self._emit(container, self._text[container.value_start:end].strip(), events)
+        container.value_start = None
+        container.emitted = False
+        if had_value and container.kind == "[":
+            container.index += 1
+
+    def _emit(self, container, raw, events):
+        depth = len(container.path)
+        if depth > 1 or (depth == 1 and container.kind != "["):
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        events.append((container.child_path(), value))
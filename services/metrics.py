@@ -0,0 +1,411 @@
+"""Метрики бота в текстовом формате Prometheus
+
+Счетчики и гистограммы обновляются на горячем пути (обработчики, запросы к
+OpenAI и Telegram), поэтому устроены максимально просто: значение по кортежу
+меток в словаре, корзина гистограммы находится бинарным поиском. Обработчики
+измеряются middleware диспетчера, запросы к OpenAI - хуком сервиса генерации,
+запросы к Bot API - middleware сессии бота; код обработчиков не меняется.
+
+Глубина очередей, доли попаданий кэша и пулов и счетчики разбора ответов
+не считаются на каждое событие, а читаются из stats() компонентов при запросе
+/metrics (см. watch_stats).
+
+Вебхук и сервер keep_alive отдают /metrics сами, в режиме long polling
+(main.py и bot_service.py) его отдает небольшой сервер aiohttp на
+METRICS_PORT (см. start_metrics_server). В режиме шардирования обработчики
+присылают снимки своих метрик получателю, и он отдает их одним ответом с
+меткой process (см. merge_snapshots).
+"""
+import logging
+import os
+import re
+from bisect import bisect_left
+from time import perf_counter
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Собирать метрики обработчиков, запросов к OpenAI и Telegram (1 - да)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# Адрес и порт сервера /metrics в режиме long polling (пустой порт - не запускать)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT', '9464')
+
+# Префикс имен всех метрик
+METRICS_PREFIX = 'tarot_'
+
+# Content-Type ответа /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм в секундах: обработчики (до минуты анимации), OpenAI и Bot API
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+TELEGRAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 30)
+
+_NAME_INVALID = re.compile(r'[^a-zA-Z0-9_]+')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счетчик с метками
+
+    Args:
+        name: Имя метрики (без префикса)
+        documentation: Описание для строки # HELP
+        labelnames: Имена меток; значения передаются кортежем в inc()
+    """
+
+    __slots__ = ('name', 'documentation', 'labelnames', '_values')
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        """Увеличивает счетчик для кортежа значений меток labels"""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        # list() - снимок: /metrics может читаться из потока Flask
+        for labels, value in list(self._values.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками
+
+    В корзинах хранятся некумулятивные количества, кумулятивные суммы
+    считаются только при выводе.
+
+    Args:
+        name: Имя метрики (без префикса)
+        documentation: Описание для строки # HELP
+        labelnames: Имена меток
+        buckets: Возрастающие верхние границы корзин
+    """
+
+    __slots__ = ('name', 'documentation', 'labelnames', 'buckets', '_children')
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=HANDLER_BUCKETS):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Кортеж меток -> [количества по корзинам (+ корзина +Inf), сумма, количество]
+        self._children = {}
+
+    def observe(self, value, labels=()):
+        """Учитывает значение value для кортежа значений меток labels"""
+        try:
+            child = self._children[labels]
+        except KeyError:
+            child = self._children[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        child[0][bisect_left(self.buckets, value)] += 1
+        child[1] += value
+        child[2] += 1
+
+    def count(self, labels=()):
+        child = self._children.get(labels)
+        return child[2] if child else 0
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for labels, (counts, total, count) in list(self._children.items()):
+            cumulative = 0
+            for bound, bucket in zip(bounds, list(counts)):
+                cumulative += bucket
+                le = f'le="{_format_value(bound)}"'
+                yield self.name + '_bucket', _format_labels(self.labelnames, labels, le), cumulative
+            formatted = _format_labels(self.labelnames, labels)
+            yield self.name + '_sum', formatted, total
+            yield self.name + '_count', formatted, count
+
+
+class Registry:
+    """Набор метрик и функций статистики, выводимых на /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        # (префикс, метки) -> (функция stats, метки, имя метки для ключей верхнего уровня)
+        self._watched = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=HANDLER_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def watch_stats(self, prefix, stats, label=None, **labels):
+        """Выводит числовые значения словаря stats() как gauge-метрики при каждом запросе /metrics
+
+        Вложенные словари разворачиваются в имена через "_", строки и списки
+        пропускаются. Повторная регистрация с тем же префиксом и метками
+        заменяет предыдущую.
+
+        Args:
+            prefix: Префикс имен метрик (без общего префикса)
+            stats: Функция без аргументов, возвращающая словарь статистики
+            label: Если задано, ключи верхнего уровня stats() становятся значениями этой метки
+            **labels: Постоянные метки всех метрик
+        """
+        key = (prefix, tuple(sorted(labels.items())))
+        self._watched[key] = (stats, labels, label)
+
+    def _watched_samples(self):
+        for (prefix, _), (stats, labels, label) in list(self._watched.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logging.warning(f"Не удалось получить статистику {prefix} для метрик: {e}")
+                continue
+            groups = values.items() if label else [(None, values)]
+            for group, group_values in groups:
+                group_labels = {**labels, label: group} if label else labels
+                for name, value in _flatten(prefix, group_values):
+                    yield METRICS_PREFIX + name, group_labels, value
+
+    def collect(self):
+        """Снимок всех метрик: список (имя, тип, описание, [(имя значения, метки, значение)])
+
+        Снимок состоит из строк и чисел, поэтому его можно передать в другой процесс.
+        """
+        families = [(metric.name, metric.kind, metric.documentation, list(metric.samples()))
+                    for metric in self._metrics]
+        # Значения одной метрики с разными метками (например, нескольких пулов) выводятся подряд
+        gauges = {}
+        for name, labels, value in self._watched_samples():
+            gauges.setdefault(name, []).append((name, _format_labels(labels.keys(), labels.values()), value))
+        families.extend((name, 'gauge', None, samples) for name, samples in gauges.items())
+        return families
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        return _render_families(self.collect())
+
+
+def _render_families(families):
+    lines = []
+    for name, kind, documentation, samples in families:
+        if documentation:
+            lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{labels} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _add_label(labels, pair):
+    return '{' + pair + (',' + labels[1:] if labels else '}')
+
+
+def merge_snapshots(snapshots, label='process'):
+    """Выводит снимки метрик нескольких процессов одним ответом в формате Prometheus
+
+    Args:
+        snapshots: Словарь значение метки -> снимок Registry.collect() процесса
+        label: Метка, которой помечаются значения каждого процесса
+    """
+    families = {}
+    for process, snapshot in snapshots.items():
+        pair = f'{label}="{_escape(process)}"'
+        for name, kind, documentation, samples in snapshot:
+            family = families.setdefault(name, (name, kind, documentation, []))
+            family[3].extend((sample_name, _add_label(labels, pair), value) for sample_name, labels, value in samples)
+    return _render_families(families.values())
+
+
+def _flatten(prefix, values):
+    """Разворачивает вложенный словарь в пары (имя метрики, число)"""
+    for key, value in values.items():
+        name = _NAME_INVALID.sub('_', f'{prefix}_{key}')
+        if isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+        elif isinstance(value, dict):
+            yield from _flatten(name, value)
+
+
+# Общий реестр метрик бота
+registry = Registry()
+watch_stats = registry.watch_stats
+render = registry.render
+collect = registry.collect
+
+updates = registry.counter('updates_total', 'Обновления Telegram по типам', ('type',))
+update_seconds = registry.histogram('update_seconds', 'Время обработки обновления диспетчером', ('type',))
+handler_seconds = registry.histogram('handler_seconds', 'Время работы обработчика', ('handler',))
+handler_errors = registry.counter('handler_errors_total', 'Исключения в обработчиках', ('handler',))
+llm_seconds = registry.histogram(
+    'llm_request_seconds', 'Время запроса к OpenAI API', ('kind', 'outcome'), buckets=LLM_BUCKETS
+)
+llm_tokens = registry.counter('llm_tokens_total', 'Токены запросов к OpenAI API', ('type',))
+telegram_seconds = registry.histogram(
+    'telegram_request_seconds', 'Время запроса к Bot API', ('method',), buckets=TELEGRAM_BUCKETS
+)
+telegram_requests = registry.counter('telegram_requests_total', 'Запросы к Bot API по исходу', ('method', 'outcome'))
+
+
+def observe_llm_call(kind, duration, response_usage, error):
+    """Хук сервиса генерации: учитывает время, исход и токены одного запроса к API"""
+    llm_seconds.observe(duration, (kind, 'ok' if error is None else type(error).__name__))
+    if response_usage is not None:
+        llm_tokens.inc(('prompt',), response_usage.prompt_tokens or 0)
+        llm_tokens.inc(('completion',), response_usage.completion_tokens or 0)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: количество и время обработки обновлений по типам"""
+
+    async def __call__(self, handler, event, data):
+        labels = (event.event_type,)
+        updates.inc(labels)
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            update_seconds.observe(perf_counter() - started, labels)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware событий: время работы и исключения каждого обработчика
+
+    Внутренний middleware вызывается уже после выбора обработчика, поэтому
+    имя обработчика берется из data["handler"].
+    """
+
+    async def __call__(self, handler, event, data):
+        labels = (data['handler'].callback.__name__,)
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(labels)
+            raise
+        finally:
+            handler_seconds.observe(perf_counter() - started, labels)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: количество, исход (в том числе 429) и время запросов к Bot API
+
+    Подключается после OutboundScheduler, чтобы учитывать каждую попытку
+    отправки, а не время ожидания в планировщике.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        outcome = 'ok'
+        started = perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            outcome = 'retry_after'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            telegram_seconds.observe(perf_counter() - started, (name,))
+            telegram_requests.inc((name, outcome))
+
+
+def setup_metrics(dispatcher, bot, queue=None, scheduler=None, enabled=METRICS_ENABLED):
+    """Подключает сбор метрик к диспетчеру, боту и сервису генерации
+
+    Args:
+        dispatcher: Диспетчер aiogram (роутеры уже подключены)
+        bot: Бот, запросы которого к Bot API учитываются
+        queue: Очередь обновлений UpdateQueue, глубина которой выводится
+        scheduler: Планировщик OutboundScheduler, счетчики которого выводятся
+        enabled: False - ничего не подключать
+    """
+    if not enabled:
+        return
+    # Импорт здесь: сервис генерации при импорте подключает кэш и предохранитель
+    from services import generation_service, prompt_registry, reading_schema
+
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware())
+    # Внутренние middleware диспетчера наследуются всеми вложенными роутерами
+    handler_middleware = HandlerMetricsMiddleware()
+    for event_name, observer in dispatcher.observers.items():
+        # update - служебный обработчик диспетчера, error - обработчики ошибок
+        if event_name not in ('update', 'error'):
+            observer.middleware(handler_middleware)
+    bot.session.middleware(TelegramMetricsMiddleware())
+    generation_service.add_call_hook(observe_llm_call)
+
+    watch_stats('generation', generation_service.stats)
+    watch_stats('generation_circuit', lambda: {'open': generation_service.circuit_breaker.state != 'closed'})
+    watch_stats('parsing', reading_schema.stats, label='prompt')
+    watch_stats('prompts', prompt_registry.stats, label='prompt')
+    if queue is not None:
+        watch_stats('update_queue', queue.stats)
+    if scheduler is not None:
+        watch_stats('telegram_scheduler', scheduler.stats)
+
+
+async def start_metrics_server(render_metrics=render, host=METRICS_HOST, port=METRICS_PORT):
+    """Запускает сервер /metrics в текущем event loop (для режима long polling)
+
+    Args:
+        render_metrics: Функция, возвращающая текст метрик
+        host: Адрес сервера
+        port: Порт сервера (пусто или 0 - не запускать)
+
+    Returns:
+        AppRunner aiohttp (остановка - await runner.cleanup()) или None, если сервер не запущен
+    """
+    if not METRICS_ENABLED or not port or not int(port):
+        return None
+    from aiohttp import web
+
+    async def metrics_endpoint(request):
+        return web.Response(body=render_metrics().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_endpoint)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, int(port)).start()
+    except OSError as e:
+        # Бот работает и без метрик: занятый порт не должен мешать запуску
+        logging.error(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
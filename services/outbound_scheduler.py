@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Общий лимит запросов к Telegram в секунду (официально - около 30 сообщений в секунду)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+
+# Лимит запросов в секунду в один личный чат и допустимый всплеск
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', 3))
+
+# Лимит запросов в минуту в одну группу
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv('TELEGRAM_GROUP_RATE_PER_MINUTE', 20))
+
+# Сколько раз повторять запрос после ответа 429 (TelegramRetryAfter)
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', 3))
+
+# Сколько чатов помнить одновременно (лимиты давно молчащих чатов забываются)
+TELEGRAM_MAX_TRACKED_CHATS = 10_000
+
+# При переполнении забываем молчащие чаты, пока их не останется столько (доля от максимума),
+# чтобы полный проход по чатам случался не на каждом новом чате
+TELEGRAM_TRACKED_CHATS_AFTER_SWEEP = 0.9
+
+
+class TokenBucket:
+    """Корзина токенов с резервированием
+
+    reserve() сразу резервирует токен (баланс может уйти в минус) и возвращает
+    время, через которое резерв покроется пополнением. Ожидающие обслуживаются
+    по очереди без блокировок и без фоновых задач.
+
+    Args:
+        rate: Скорость пополнения в токенах в секунду
+        capacity: Максимальный запас токенов (допустимый всплеск)
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "paused_until")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self):
+        """Резервирует токен и возвращает, сколько секунд нужно подождать"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """Запрещает запросы на seconds секунд (после ответа retry_after)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # Токены, накопленные до паузы, сгорают: после нее отправляем не всплеском
+        self.tokens = min(self.tokens, 1.0)
+
+    def idle(self):
+        """Возвращает True, если корзина полная и ее можно забыть"""
+        now = time.monotonic()
+        return now >= self.paused_until and self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих запросов к Telegram (middleware сессии бота)
+
+    Каждый запрос, адресованный чату, ждет токен в общей корзине и в корзине
+    своего чата, поэтому бот отправляет сообщения с максимальной допустимой
+    скоростью, не упираясь в лимиты. Если Telegram все же ответил 429, чат
+    (или весь бот) ставится на паузу на retry_after секунд и запрос повторяется.
+
+    Редактирования одного сообщения, ожидающие своей очереди, схлопываются:
+    место в очереди занимает только первое из них, в его слот отправляется
+    самая новая версия текста, и все ожидавшие редактирования получают ее результат.
+    Обработчики по-прежнему вызывают message.answer() и edit_text().
+
+    Args:
+        global_rate: Общий лимит запросов в секунду
+        chat_rate: Лимит запросов в секунду в личный чат
+        chat_burst: Допустимый всплеск запросов в чат
+        group_rate_per_minute: Лимит запросов в минуту в группу
+        max_retries: Количество повторов после ответа 429
+    """
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                 chat_burst=TELEGRAM_CHAT_BURST, group_rate_per_minute=TELEGRAM_GROUP_RATE_PER_MINUTE,
+                 max_retries=TELEGRAM_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._chats = OrderedDict()
+        # Ожидающие редактирования сообщения: (chat_id, message_id) -> [future, последний запрос]
+        self._edits = {}
+        self.sent = 0
+        self.folded = 0
+        self.retries = 0
+        self.wait_time = 0.0
+
+    def set_global_rate(self, rate):
+        """Меняет общий лимит запросов в секунду
+
+        Нужен, когда сообщения отправляют несколько процессов с одним токеном
+        бота: каждый получает свою долю общего лимита (см. bot_service.py).
+        """
+        self.global_bucket = TokenBucket(rate, rate)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Идентификаторы групп и каналов отрицательные
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > TELEGRAM_MAX_TRACKED_CHATS:
+                self._evict_chats()
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _evict_chats(self):
+        """Забывает чаты сверх лимита: сначала молчащие, от давно молчавших к недавним
+
+        Если молчащих не хватило, вытесняются самые давние чаты: память
+        ограничена при любой нагрузке, а забытый чат просто начнет с полной корзиной.
+        """
+        target = int(TELEGRAM_MAX_TRACKED_CHATS * TELEGRAM_TRACKED_CHATS_AFTER_SWEEP)
+        idle = [chat_id for chat_id, bucket in self._chats.items() if bucket.idle()]
+        for chat_id in idle[:len(self._chats) - target]:
+            del self._chats[chat_id]
+        while len(self._chats) > TELEGRAM_MAX_TRACKED_CHATS:
+            self._chats.popitem(last=False)
+
+    async def _sleep(self, wait):
+        if wait > 0:
+            self.wait_time += wait
+            await asyncio.sleep(wait)
+
+    async def _wait_turn(self, chat_bucket):
+        # Сначала очередь в чате, затем общий токен: запрос, ждущий занятый чат,
+        # не занимает общую квоту, нужную запросам в свободные чаты
+        if chat_bucket is not None:
+            await self._sleep(chat_bucket.reserve())
+        await self._sleep(self.global_bucket.reserve())
+
+    async def _send(self, make_request, bot, method, chat_bucket, wait=True):
+        for attempt in range(self.max_retries + 1):
+            if wait or attempt > 0:
+                await self._wait_turn(chat_bucket)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                logging.warning(f"Telegram просит подождать {e.retry_after} с перед {type(method).__name__}")
+                (chat_bucket or self.global_bucket).pause(e.retry_after)
+
+    async def _send_edit(self, make_request, bot, method, chat_bucket):
+        key = (method.chat_id, method.message_id)
+        batch = self._edits.get(key)
+        if batch is not None:
+            # Редактирование, еще ожидающее очереди, заменяется более новым; очередь ждет только первое
+            batch[1] = method
+            self.folded += 1
+            return await asyncio.shield(batch[0])
+        future = asyncio.get_running_loop().create_future()
+        batch = self._edits[key] = [future, method]
+        try:
+            await self._wait_turn(chat_bucket)
+        except asyncio.CancelledError:
+            del self._edits[key]
+            future.cancel()
+            raise
+        del self._edits[key]
+        try:
+            response = await self._send(make_request, bot, batch[1], chat_bucket, wait=False)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получит вызывающий, остальные запросы пачки - через future
+            future.exception()
+            raise
+        future.set_result(response)
+        return response
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            # Запросы не к чату (answerCallbackQuery, getMe, ...) не ограничиваем
+            return await make_request(bot, method)
+        chat_bucket = self._chat_bucket(chat_id)
+        if isinstance(method, EditMessageText) and method.message_id is not None:
+            return await self._send_edit(make_request, bot, method, chat_bucket)
+        return await self._send(make_request, bot, method, chat_bucket)
+
+    def stats(self):
+        """Возвращает количество отправленных, схлопнутых и повторенных запросов"""
+        return {
+            "sent": self.sent,
+            "folded": self.folded,
+            "retries": self.retries,
+            "wait_time": self.wait_time,
+            "tracked_chats": len(self._chats)
+        }
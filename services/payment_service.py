@@ -3,6 +3,8 @@ from aiogram.types import Message, LabeledPrice
 import os
 from dotenv import load_dotenv
 
+from services.ui_templates import TEXTS
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -71,7 +73,4 @@ async def process_successful_payment(message: Message, amount: int, payload: str
     # Здесь можно добавить сохранение информации о платеже в базу данных
     
     # Отправляем сообщение пользователю
-    await message.answer(
-        "✅ Оплата успешно получена! Приступаю к гаданию...",
-        parse_mode="Markdown"
-    )
\ No newline at end of file
+    await message.answer(TEXTS["payment_processing"], parse_mode="Markdown")
\ No newline at end of file
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+
+from aiogram.methods import GetUpdates
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from dotenv import load_dotenv
+
+from services import metrics, startup_profile
+from services.update_queue import UpdateQueue
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Таймаут long polling в секундах
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', 30))
+
+# Сколько секунд дорабатывать уже полученные обновления при остановке
+BOT_DRAIN_TIMEOUT = float(os.getenv('BOT_DRAIN_TIMEOUT', 30))
+
+# Максимальное количество полученных, но еще не обработанных обновлений
+POLLING_QUEUE_SIZE = int(os.getenv('POLLING_QUEUE_SIZE', 1000))
+
+# Время (unix time), когда служба начала перезапуск бота; задается bot_service.py
+BOT_RESTART_AT = os.getenv('BOT_RESTART_AT')
+
+# Через сколько секунд повторить getUpdates, если в ответе только уже полученные, но еще не обработанные обновления
+POLLING_REPEAT_INTERVAL = float(os.getenv('POLLING_REPEAT_INTERVAL', 0.5))
+
+# Повторы при ошибках сети: 1 с, затем в 1.3 раза дольше, но не больше 5 с
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+
+
+def next_offset(unfinished, last):
+    """Возвращает offset для getUpdates, подтверждающий только обработанные обновления
+
+    Telegram считает подтвержденными все обновления с номером меньше offset.
+
+    Args:
+        unfinished: Функция, возвращающая номер самого раннего необработанного обновления или None
+        last: Номер последнего полученного обновления или None
+    """
+    pending = unfinished() if unfinished is not None else None
+    if pending is not None:
+        return pending
+    return last + 1 if last is not None else None
+
+
+async def confirm_updates(bot, offset):
+    """Подтверждает обновления с номером меньше offset, новые при этом не забирает"""
+    if offset is None:
+        return
+    try:
+        await bot(GetUpdates(offset=offset, limit=1, timeout=0))
+    except Exception as e:
+        logging.warning(f"Не удалось подтвердить полученные обновления: {e}")
+
+
+async def fetch_updates(bot, stop, allowed_updates=None, polling_timeout=POLLING_TIMEOUT, unfinished=None):
+    """Получает обновления через getUpdates, пока не установлено событие stop
+
+    Ошибки сети повторяются с нарастающей паузой. offset не продвигается дальше
+    самого раннего необработанного обновления (unfinished), поэтому после
+    падения или убийства процесса Telegram присылает его и все последующие
+    заново; уже обработанные из них отсекает защита от повторной обработки
+    (services/update_dedup.py). Полученные ранее обновления повторно не
+    возвращаются; если в ответе нет новых, следующий запрос делается через
+    POLLING_REPEAT_INTERVAL секунд. При остановке текущий запрос прерывается,
+    но ничего не подтверждается: это делает confirm_updates после обработки.
+
+    Args:
+        bot: Бот aiogram
+        stop: asyncio.Event, по которому получение прекращается
+        allowed_updates: Типы обновлений, которые нужно получать
+        polling_timeout: Таймаут long polling в секундах
+        unfinished: Функция, возвращающая номер самого раннего необработанного обновления или None
+    """
+    backoff = Backoff(config=POLLING_BACKOFF)
+    get_updates = GetUpdates(timeout=polling_timeout, allowed_updates=allowed_updates)
+    stop_wait = asyncio.ensure_future(stop.wait())
+    last = None
+    try:
+        while not stop.is_set():
+            get_updates.offset = next_offset(unfinished, last)
+            request = asyncio.ensure_future(bot(get_updates, request_timeout=polling_timeout + 30))
+            await asyncio.wait({request, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if not request.done():
+                request.cancel()
+                break
+            try:
+                updates = request.result()
+            except Exception as e:
+                logging.error(f"Ошибка при получении обновлений: {type(e).__name__}: {e}")
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            fresh = False
+            for update in updates:
+                if last is not None and update.update_id <= last:
+                    continue
+                fresh = True
+                last = update.update_id
+                yield update
+            if updates and not fresh:
+                # Telegram вернул только обновления, которые еще обрабатываются
+                await asyncio.wait({stop_wait}, timeout=POLLING_REPEAT_INTERVAL)
+    finally:
+        stop_wait.cancel()
+
+
+def log_first_update():
+    """Записывает в лог время от перезапуска до первого обновления и выводит профиль запуска"""
+    if BOT_RESTART_AT:
+        logging.info(f"Первое обновление получено через {time.time() - float(BOT_RESTART_AT):.3f} с после перезапуска")
+    startup_profile.mark("первое обновление")
+    startup_profile.report()
+
+
+async def run_polling(dp, bot, stop, drain_timeout=BOT_DRAIN_TIMEOUT, queue_size=POLLING_QUEUE_SIZE):
+    """Запускает бота в режиме long polling с корректной остановкой
+
+    Обновления обрабатываются очередью UpdateQueue (по порядку в пределах чата).
+    Когда установлено событие stop, бот перестает получать обновления,
+    дорабатывает уже полученные (не дольше drain_timeout секунд), подтверждает
+    обработанные до самого раннего необработанного, затем вызывает
+    shutdown-обработчики, которые сохраняют хранилища.
+
+    Args:
+        dp: Диспетчер aiogram
+        bot: Бот aiogram
+        stop: asyncio.Event, сигнал остановки
+        drain_timeout: Сколько секунд дорабатывать полученные обновления
+        queue_size: Максимальное количество необработанных обновлений
+    """
+    queue = UpdateQueue(handler=lambda update: dp.feed_update(bot=bot, update=update), max_size=queue_size)
+    metrics.watch_stats('update_queue', queue.stats)
+    await dp.emit_startup(bot=bot)
+    queue.start()
+    startup_profile.mark("startup-обработчики")
+    logging.info("Получение обновлений запущено")
+    last = None
+    try:
+        first = True
+        updates = fetch_updates(bot, stop, allowed_updates=dp.resolve_used_update_types(),
+                                unfinished=queue.lowest_unfinished)
+        async for update in updates:
+            last = update.update_id
+            if first:
+                log_first_update()
+                first = False
+            # Очередь заполнена - ждем, не забирая у Telegram новые обновления
+            while len(queue) >= queue.max_size:
+                await asyncio.sleep(0.05)
+            queue.submit(update)
+    finally:
+        logging.info(f"Получение обновлений остановлено, дорабатываем {len(queue)} обновлений")
+        await queue.stop(drain_timeout)
+        # Прерванные и не начатые обновления Telegram пришлет после перезапуска
+        await confirm_updates(bot, next_offset(queue.lowest_unfinished, last))
+        # Диспетчер закрывает хранилище FSM, роутеры останавливают фоновые задачи
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
@@ -0,0 +1,115 @@
+"""Кэш персональных разделов премиум-гадания
+
+Астрологический и нумерологический анализ зависит только от даты рождения и
+текущего дня, а не от выпавших карт. Поэтому он генерируется один раз на
+(дату рождения, день, версию промпта) и переиспользуется при повторном гадании
+в тот же день и для всех пользователей с той же датой рождения. Карты и их
+толкование по-прежнему генерируются для каждого расклада.
+
+Разделы хранятся в ResponseCache (LRU в памяти и SQLite на диске) до конца
+дня, на который построены; одновременные запросы одной даты рождения объединяются в один.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from services import metrics
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Базовая директория для данных
+DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent / 'data'
+
+# Кэшировать астрологический и нумерологический анализ премиум-гадания (1 - да, 0 - генерировать каждый раз)
+PREMIUM_CACHE = os.getenv('PREMIUM_CACHE', '1') == '1'
+
+# Сколько пар (дата рождения, день) держать в памяти
+PREMIUM_CACHE_SIZE = int(os.getenv('PREMIUM_CACHE_SIZE', 5000))
+
+# Путь к базе SQLite дискового уровня (пусто - только память)
+PREMIUM_CACHE_PATH = os.getenv('PREMIUM_CACHE_PATH', str(DATA_DIR / 'premium_cache.sqlite3'))
+
+
+def make_key(birthdate, day, version):
+    """Ключ кэша по дате рождения, дню и версии промпта"""
+    raw = json.dumps([birthdate.isoformat(), day.isoformat(), version])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def seconds_until_end_of(day, now=None):
+    """Сколько секунд осталось до конца суток day по локальному времени (0, если они уже прошли)"""
+    now = now or datetime.datetime.now()
+    midnight = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time())
+    return max(0.0, (midnight - now).total_seconds())
+
+
+class PremiumCache:
+    """Кэш персональных разделов премиум-гадания до конца суток
+
+    Args:
+        max_entries: Максимальное количество ключей в памяти
+        disk_path: Путь к базе SQLite дискового уровня (None - только память)
+    """
+
+    def __init__(self, max_entries=PREMIUM_CACHE_SIZE, disk_path=PREMIUM_CACHE_PATH or None):
+        # Один вариант на ключ: разделы для даты рождения в течение дня не меняются
+        self._cache = ResponseCache(max_entries=max_entries, variants=1, disk_path=disk_path)
+        self._single_flight = SingleFlight()
+        self.generated = 0
+        # Доля попаданий выводится на /metrics
+        metrics.watch_stats('premium_cache', self.stats)
+
+    async def _generate(self, key, day, create):
+        sections = await create()
+        self.generated += 1
+        # Запись живет до конца дня day; если он уже прошел (например, сутки сменились,
+        # пока шла генерация), разделы возвращаются, но не сохраняются
+        ttl = seconds_until_end_of(day)
+        if ttl > 0:
+            self._cache.put(key, json.dumps(sections, ensure_ascii=False), ttl=ttl)
+        else:
+            logging.info(f"Разделы премиум-гадания на прошедший день {day} не кэшируются")
+        return sections
+
+    async def get_or_create(self, birthdate, day, version, create):
+        """Возвращает разделы из кэша или генерирует их через create()
+
+        Ключ и срок жизни записи определяются днем day, поэтому create() должна
+        строить разделы именно на этот день (обработчики передают сегодняшнюю
+        дату и в ключ, и в промпт). Разделы на будущий день хранятся до его
+        конца, на прошедший - не сохраняются.
+
+        Args:
+            birthdate: Дата рождения (datetime.date)
+            day: День, на который строятся разделы (datetime.date)
+            version: Версия промпта разделов (при правке промпта старые записи не используются)
+            create: Функция без аргументов, возвращающая корутину со словарем разделов на день day
+
+        Raises:
+            Исключения create() пробрасываются, неудачная генерация не кэшируется
+        """
+        key = make_key(birthdate, day, version)
+        cached = await self._cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        # Генерация идет отдельной задачей: если пользователь не дождется, разделы все равно сохранятся
+        return await self._single_flight.shared(key, lambda: self._generate(key, day, create))
+
+    def stats(self):
+        """Статистика кэша: попадания, промахи, сгенерированные и объединенные запросы"""
+        return {**self._cache.stats(), "generated": self.generated, "coalesced": self._single_flight.coalesced}
+
+    def close(self):
+        self._cache.close()
+
+
+# Общий кэш разделов для обработчиков гадания
+premium_cache = PremiumCache()
@@ -0,0 +1,201 @@
+"""Реестр промптов и бюджет токенов
+
+Каждый промпт регистрируется один раз при импорте модуля с обработчиками:
+постоянная часть шаблона (полного и компактного вариантов) сразу переводится в
+токены, и при старте в лог выводится, сколько стоит каждый промпт. Вариант
+шаблона выбирается переменной PROMPT_VARIANT.
+
+max_tokens подбирается по наблюдаемым размерам ответов: после
+MAX_TOKENS_MIN_SAMPLES ответов лимит равен квантилю MAX_TOKENS_QUANTILE с
+запасом MAX_TOKENS_HEADROOM, но не больше статического лимита промпта. Лимит
+резервируется в квоте токенов API и ограничивает «разговорившиеся» ответы,
+которые дольше всего генерируются.
+
+Токены считаются через tiktoken, если он установлен, иначе - грубой оценкой
+по длине слов.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+from collections import deque
+from string import Formatter
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Вариант шаблонов промптов: full - подробные, compact - сокращенные
+PROMPT_VARIANT = os.getenv('PROMPT_VARIANT', 'full')
+
+# Подбирать max_tokens по размерам ответов (1 - да, 0 - всегда статический лимит)
+ADAPTIVE_MAX_TOKENS = os.getenv('ADAPTIVE_MAX_TOKENS', '1') == '1'
+
+# Квантиль размера ответа, запас сверху и минимум ответов до перехода на адаптивный лимит
+MAX_TOKENS_QUANTILE = float(os.getenv('MAX_TOKENS_QUANTILE', 0.99))
+MAX_TOKENS_HEADROOM = float(os.getenv('MAX_TOKENS_HEADROOM', 1.25))
+MAX_TOKENS_MIN_SAMPLES = int(os.getenv('MAX_TOKENS_MIN_SAMPLES', 20))
+
+# Сколько последних размеров ответа хранить для каждого промпта
+OUTPUT_SAMPLES = 500
+
+# Адаптивный лимит округляется вверх до шага: max_tokens входит в ключ кэша ответов,
+# и он не должен меняться после каждого нового ответа
+MAX_TOKENS_STEP = 50
+
+# Кодировка tiktoken (False, если tiktoken не установлен)
+_encoding = None
+
+# Слова и знаки препинания для оценки числа токенов без tiktoken
+_PIECES = re.compile(r'\w+|[^\w\s]')
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+        except ImportError:
+            logging.info("tiktoken не установлен, токены промптов считаются приблизительно")
+            _encoding = False
+        else:
+            from services.generation_service import OPENAI_MODEL
+
+            try:
+                _encoding = tiktoken.encoding_for_model(OPENAI_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding('cl100k_base')
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Оценивает число токенов: латиница - около 4 символов на токен, кириллица - около 3"""
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        tokens += math.ceil(len(piece) / (4 if piece.isascii() else 3))
+    return tokens
+
+
+def count_tokens(text):
+    """Считает токены текста (через tiktoken или оценкой estimate_tokens)"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return estimate_tokens(text)
+
+
+def _literal(template):
+    """Постоянная часть шаблона str.format (без подставляемых полей)"""
+    return "".join(literal for literal, _, _, _ in Formatter().parse(template))
+
+
+class Prompt:
+    """Промпт с полным и компактным вариантами шаблона и адаптивным max_tokens
+
+    Args:
+        name: Имя промпта (совпадает с именем в статистике разбора ответов)
+        template: Полный шаблон str.format
+        compact: Компактный шаблон с теми же полями (по умолчанию совпадает с полным)
+        max_tokens: Статический лимит ответа на одну единицу (например, один расклад)
+    """
+
+    def __init__(self, name, template, compact=None, max_tokens=500):
+        self.name = name
+        self.templates = {'full': template, 'compact': compact or template}
+        self.limit = max_tokens
+        # Постоянная часть каждого варианта переводится в токены один раз
+        self.template_tokens = {variant: count_tokens(_literal(text)) for variant, text in self.templates.items()}
+        self.truncated = 0
+        self._samples = deque(maxlen=OUTPUT_SAMPLES)
+        self._budget = None
+
+    def render(self, variant=None, **values):
+        """Подставляет значения в шаблон варианта variant (по умолчанию PROMPT_VARIANT)"""
+        return self.templates[variant or PROMPT_VARIANT].format(**values)
+
+    def version(self, variant=None):
+        """Версия шаблона варианта variant: меняется при любой правке текста (для ключей кэшей)"""
+        return hashlib.sha256(self.templates[variant or PROMPT_VARIANT].encode('utf-8')).hexdigest()[:12]
+
+    def _quantile(self, q):
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def max_tokens(self, units=1):
+        """Возвращает лимит ответа на units единиц
+
+        Пока ответов меньше MAX_TOKENS_MIN_SAMPLES, используется статический
+        лимит. Квантиль пересчитывается только после новых наблюдений.
+        """
+        if not ADAPTIVE_MAX_TOKENS or len(self._samples) < MAX_TOKENS_MIN_SAMPLES:
+            return self.limit * units
+        if self._budget is None:
+            budget = self._quantile(MAX_TOKENS_QUANTILE) * MAX_TOKENS_HEADROOM
+            self._budget = min(self.limit, math.ceil(budget / MAX_TOKENS_STEP) * MAX_TOKENS_STEP)
+        return self._budget * units
+
+    def observe(self, text, units=1):
+        """Учитывает размер ответа модели (в том числе неразобранного или обрезанного)
+
+        Обрезанные по лимиту ответы тоже должны попадать в выборку, иначе
+        лимит будет только уменьшаться.
+        """
+        tokens = count_tokens(text) / units
+        if tokens >= self.max_tokens():
+            self.truncated += 1
+        self._samples.append(tokens)
+        self._budget = None
+
+    def stats(self):
+        """Размер шаблонов, распределение ответов и текущий лимит"""
+        return {
+            "template_tokens": dict(self.template_tokens),
+            "outputs": len(self._samples),
+            "output_tokens_p50": self._quantile(0.5) if self._samples else 0,
+            "output_tokens_p99": self._quantile(0.99) if self._samples else 0,
+            "max_tokens": self.max_tokens(),
+            "truncated": self.truncated
+        }
+
+
+# Зарегистрированные промпты: имя -> Prompt
+_prompts = {}
+
+
+def register(name, template, compact=None, max_tokens=500):
+    """Регистрирует промпт и сразу считает токены его шаблонов
+
+    Returns:
+        Prompt
+    """
+    prompt = Prompt(name, template, compact, max_tokens)
+    _prompts[name] = prompt
+    return prompt
+
+
+def get(name):
+    return _prompts[name]
+
+
+def observe(name, text, units=1):
+    """Учитывает ответ на промпт name; ответы на незарегистрированные промпты пропускаются"""
+    prompt = _prompts.get(name)
+    if prompt is not None and text:
+        prompt.observe(text, units)
+
+
+def stats():
+    """Возвращает статистику всех промптов"""
+    return {name: prompt.stats() for name, prompt in _prompts.items()}
+
+
+def report():
+    """Возвращает таблицу размеров шаблонов и лимитов ответа"""
+    lines = [f"Промпты (вариант {PROMPT_VARIANT}, токенов в постоянной части шаблона):",
+             f"{'промпт':<10} {'full':>6} {'compact':>8} {'max_tokens':>11}"]
+    for name, prompt in _prompts.items():
+        lines.append(f"{name:<10} {prompt.template_tokens['full']:>6} {prompt.template_tokens['compact']:>8} "
+                     f"{prompt.max_tokens():>11}")
+    return "\n".join(lines)
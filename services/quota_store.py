@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Директория для данных бота
+DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent / 'data'
+
+# Тип хранилища квот: sqlite или memory
+QUOTA_STORE = os.getenv('QUOTA_STORE', 'sqlite')
+
+# Путь к базе данных SQLite с квотами
+QUOTA_DB_PATH = Path(os.getenv('QUOTA_DB_PATH', DATA_DIR / 'quotas.sqlite3'))
+
+# Старый JSON-файл с количеством тестовых раскладов (импортируется один раз)
+LEGACY_TEST_READINGS_FILE = DATA_DIR / 'test_readings.json'
+
+
+class QuotaStore:
+    """Асинхронный интерфейс хранилища счетчиков (например, тестовых раскладов)"""
+
+    async def get(self, user_id):
+        """Возвращает текущее значение счетчика пользователя"""
+        raise NotImplementedError
+
+    async def increment_if_below(self, user_id, limit):
+        """Атомарно увеличивает счетчик, если он меньше limit
+
+        Returns:
+            Пара (увеличен ли счетчик, значение счетчика после операции)
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Освобождает ресурсы хранилища"""
+
+
+class MemoryQuotaStore(QuotaStore):
+    """Хранилище счетчиков в памяти процесса (для отладки и тестового запуска)"""
+
+    def __init__(self):
+        self._counts = {}
+
+    async def get(self, user_id):
+        return self._counts.get(user_id, 0)
+
+    async def increment_if_below(self, user_id, limit):
+        # Между чтением и записью нет await, поэтому операция атомарна в пределах event loop
+        count = self._counts.get(user_id, 0)
+        if count >= limit:
+            return False, count
+        self._counts[user_id] = count + 1
+        return True, count + 1
+
+
+class SQLiteQuotaStore(QuotaStore):
+    """Хранилище счетчиков в SQLite (режим WAL, одна строка на пользователя)
+
+    Все запросы выполняются в одном выделенном потоке, поэтому не блокируют
+    event loop и выполняются строго по очереди. Запись - это upsert одной строки,
+    ее стоимость не зависит от количества пользователей.
+
+    Args:
+        path: Путь к файлу базы данных
+        legacy_json_path: JSON-файл {user_id: count}, который импортируется при первом запуске
+    """
+
+    def __init__(self, path=QUOTA_DB_PATH, legacy_json_path=LEGACY_TEST_READINGS_FILE):
+        self.path = Path(path)
+        self.legacy_json_path = Path(legacy_json_path) if legacy_json_path else None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quota-store")
+        self._conn = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotas ("
+                "user_id INTEGER PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn = conn
+            self._import_legacy_json()
+        return self._conn
+
+    def _import_legacy_json(self):
+        """Однократно переносит данные из старого JSON-файла"""
+        conn = self._conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_imported'").fetchone():
+            return
+        rows = []
+        if self.legacy_json_path and self.legacy_json_path.exists():
+            try:
+                with open(self.legacy_json_path, 'r', encoding='utf-8') as f:
+                    rows = [(int(k), int(v)) for k, v in json.load(f).items()]
+            except Exception as e:
+                logging.error(f"Ошибка при импорте {self.legacy_json_path}: {e}")
+                return
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO quotas (user_id, count) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET count = MAX(count, excluded.count)",
+                rows
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_json_imported', ?)", (str(len(rows)),))
+        if rows:
+            logging.info(f"Импортировано {len(rows)} счетчиков из {self.legacy_json_path}")
+
+    def _get(self, user_id):
+        row = self._connect().execute("SELECT count FROM quotas WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _increment_if_below(self, user_id, limit):
+        conn = self._connect()
+        if limit <= 0:
+            return False, self._get(user_id)
+        cursor = conn.execute(
+            "INSERT INTO quotas (user_id, count) VALUES (?, 1) "
+            "ON CONFLICT(user_id) DO UPDATE SET count = count + 1 WHERE count < ?",
+            (user_id, limit)
+        )
+        return cursor.rowcount > 0, self._get(user_id)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def get(self, user_id):
+        return await self._run(self._get, user_id)
+
+    async def increment_if_below(self, user_id, limit):
+        return await self._run(self._increment_if_below, user_id, limit)
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+
+def create_quota_store(kind=QUOTA_STORE):
+    """Создает хранилище квот указанного типа (sqlite или memory)"""
+    if kind == 'memory':
+        return MemoryQuotaStore()
+    if kind == 'sqlite':
+        return SQLiteQuotaStore()
+    raise ValueError(f"Неизвестный тип хранилища квот: {kind}")
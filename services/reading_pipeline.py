@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from services import tracing
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Минимальная длительность анимации в секундах (даже если расклад уже готов)
+READING_ANIMATION_MIN_DURATION = float(os.getenv('READING_ANIMATION_MIN_DURATION', 2))
+
+# Максимальная длительность анимации в секундах (дальше просто ждем генерацию)
+READING_ANIMATION_MAX_DURATION = float(os.getenv('READING_ANIMATION_MAX_DURATION', 30))
+
+
+async def _pause(task, timeout, min_deadline):
+    """Ждет timeout секунд, но прерывается, если задача готова и минимум анимации выдержан"""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    if task is not None and not task.done():
+        await asyncio.wait({task}, timeout=timeout)
+    if task is not None and task.done():
+        end = min(end, min_deadline)
+    remaining = end - loop.time()
+    if remaining > 0:
+        await tracing.sleep(remaining)
+
+
+async def animate_while(task, frames=(), min_duration=READING_ANIMATION_MIN_DURATION,
+                        max_duration=READING_ANIMATION_MAX_DURATION):
+    """Показывает кадры анимации, пока выполняется задача генерации
+
+    Анимация длится не меньше min_duration и не больше max_duration секунд и
+    заканчивается, как только задача готова. Без задачи кадры показываются целиком.
+
+    Args:
+        task: Задача генерации (asyncio.Task) или None
+        frames: Последовательность пар (корутинная функция показа кадра, пауза после кадра)
+        min_duration: Минимальная длительность анимации в секундах
+        max_duration: Максимальная длительность анимации в секундах
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    min_deadline = started_at + min_duration
+    deadline = started_at + max(min_duration, max_duration)
+
+    for show_frame, delay in frames:
+        now = loop.time()
+        if now >= deadline or (task is not None and task.done() and now >= min_deadline):
+            return
+        await show_frame()
+        await _pause(task, min(delay, deadline - loop.time()), min_deadline)
+
+    # Кадры закончились - ждем генерацию до максимальной длительности
+    if task is not None and not task.done():
+        await asyncio.wait({task}, timeout=max(0.0, deadline - loop.time()))
+
+    # Выдерживаем минимальную длительность анимации
+    remaining = min_deadline - loop.time()
+    if remaining > 0:
+        await tracing.sleep(remaining)
+
+
+async def run_with_animation(generation, frames=(), min_duration=READING_ANIMATION_MIN_DURATION,
+                             max_duration=READING_ANIMATION_MAX_DURATION):
+    """Запускает генерацию сразу и параллельно показывает анимацию
+
+    Итоговое время ожидания - примерно max(анимация, генерация), а не их сумма.
+
+    Args:
+        generation: Корутина генерации расклада
+        frames: Кадры анимации, см. animate_while
+        min_duration: Минимальная длительность анимации в секундах
+        max_duration: Максимальная длительность анимации в секундах
+
+    Returns:
+        Результат генерации
+    """
+    task = asyncio.ensure_future(generation)
+    try:
+        await animate_while(task, frames, min_duration, max_duration)
+        return await task
+    except BaseException:
+        task.cancel()
+        raise
+
+
+class AnimationMessage:
+    """Сообщение с анимацией: первый кадр отправляется, следующие редактируют его
+
+    Вместо отдельного сообщения на каждый кадр в чат уходит одно сообщение и
+    несколько редактирований, что экономит лимиты Telegram и не засоряет чат.
+
+    Args:
+        message: Сообщение, в чат которого отправляется анимация
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.sent = None
+        self.text = None
+
+    async def show(self, text, **kwargs):
+        """Показывает кадр text (kwargs передаются в answer/edit_text)"""
+        if text == self.text:
+            # Telegram не принимает редактирование без изменений
+            return self.sent
+        if self.sent is None:
+            self.sent = await self.message.answer(text, **kwargs)
+        else:
+            self.sent = await self.sent.edit_text(text, **kwargs)
+        self.text = text
+        return self.sent
+
+
+class StreamedReading:
+    """Собирает расклад из потока событий (путь, значение) по мере их поступления
+
+    Поток читается в фоне, а обработчик может ждать отдельную карту, не дожидаясь
+    всего расклада. Время до первого объекта и до конца потока сохраняется
+    в first_object_latency и total_latency (секунды).
+
+    Args:
+        events: Асинхронный итератор событий IncrementalJSONParser
+        fallback: Запасной расклад для частей, которые не удалось получить
+    """
+
+    def __init__(self, events, fallback=None):
+        self.reading = {"cards": []}
+        self.first_object_latency = None
+        self.total_latency = None
+        self.error = None
+        self._fallback = fallback or {}
+        self._started_at = time.monotonic()
+        self._updated = asyncio.Event()
+        self.task = asyncio.ensure_future(self._consume(events))
+
+    async def _consume(self, events):
+        try:
+            async for path, value in events:
+                if path[0] == "cards":
+                    # Целый массив карт уже получен поэлементно
+                    if len(path) != 2 or not isinstance(value, dict) or "name" not in value:
+                        continue
+                    self.reading["cards"].append(value)
+                elif len(path) == 1:
+                    self.reading[path[0]] = value
+                else:
+                    continue
+                if self.first_object_latency is None:
+                    self.first_object_latency = time.monotonic() - self._started_at
+                    logging.info(f"Первый объект расклада получен через {self.first_object_latency:.2f} с")
+                self._notify()
+        except Exception as e:
+            self.error = e
+            logging.warning(f"Ошибка потоковой генерации расклада: {e}")
+        finally:
+            self.total_latency = time.monotonic() - self._started_at
+            self._notify()
+
+    def _notify(self):
+        # Будим всех ожидающих и готовим новое событие для следующего обновления
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def card(self, index):
+        """Ждет карту с номером index; если поток закончился без нее - возвращает запасную"""
+        cards = self.reading["cards"]
+        while len(cards) <= index and not self.task.done():
+            await self._updated.wait()
+        if index < len(cards):
+            return cards[index]
+        fallback_cards = self._fallback.get("cards") or []
+        return fallback_cards[index % len(fallback_cards)] if fallback_cards else None
+
+    async def result(self):
+        """Ждет окончания потока и возвращает расклад, дополненный запасными данными"""
+        await self.task
+        fallback_cards = self._fallback.get("cards") or []
+        cards = self.reading["cards"]
+        cards.extend(fallback_cards[len(cards):])
+        for key, value in self._fallback.items():
+            self.reading.setdefault(key, value)
+        return self.reading
+
+    def cancel(self):
+        """Прекращает чтение потока"""
+        self.task.cancel()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from services import metrics
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Максимальный размер пула готовых раскладов (0 - пул отключен)
+READING_POOL_SIZE = int(os.getenv('READING_POOL_SIZE', 10))
+
+# Нижняя граница: при меньшем количестве раскладов запускается пополнение
+READING_POOL_LOW_WATER = int(os.getenv('READING_POOL_LOW_WATER', 3))
+
+# Количество одновременных генераций при пополнении пула
+READING_POOL_REFILL_CONCURRENCY = int(os.getenv('READING_POOL_REFILL_CONCURRENCY', 2))
+
+# Сколько раскладов генерировать одним запросом, если пул умеет генерировать пачками
+READING_POOL_BATCH_SIZE = int(os.getenv('READING_POOL_BATCH_SIZE', 5))
+
+# Максимальный возраст расклада в пуле в секундах
+READING_POOL_MAX_AGE = float(os.getenv('READING_POOL_MAX_AGE', 3600))
+
+# Пауза после неудачной генерации, чтобы не перегружать API
+READING_POOL_RETRY_DELAY = float(os.getenv('READING_POOL_RETRY_DELAY', 10))
+
+
+class ReadingPool:
+    """Ограниченный пул заранее сгенерированных раскладов с фоновым пополнением
+
+    Args:
+        name: Имя пула для логов и статистики
+        producer: Корутинная функция без аргументов, возвращающая готовый расклад
+            (None или исключение означают неудачную генерацию)
+        max_size: Максимальное количество раскладов в пуле
+        low_water: Порог, ниже которого пул пополняется
+        refill_concurrency: Количество одновременных генераций
+        max_age: Время жизни расклада в пуле в секундах
+        batch_producer: Корутинная функция batch_producer(n), возвращающая список
+            раскладов (до n штук) за один запрос; если задана, пул пополняется пачками
+        batch_size: Количество раскладов в одной пачке
+    """
+
+    def __init__(self, name, producer, max_size=READING_POOL_SIZE, low_water=READING_POOL_LOW_WATER,
+                 refill_concurrency=READING_POOL_REFILL_CONCURRENCY, max_age=READING_POOL_MAX_AGE,
+                 batch_producer=None, batch_size=READING_POOL_BATCH_SIZE):
+        self.name = name
+        self.producer = producer
+        self.max_size = max_size
+        self.low_water = min(low_water, max_size)
+        self.refill_concurrency = max(1, refill_concurrency)
+        self.max_age = max_age
+        self.batch_producer = batch_producer
+        self.batch_size = max(1, batch_size)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failures = 0
+        # Элементы пула - пары (время создания, расклад)
+        self._items = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # Размер пула и доля попаданий выводятся на /metrics
+        metrics.watch_stats('reading_pool', self.stats, pool=name)
+
+    def __len__(self):
+        return len(self._items)
+
+    def take(self):
+        """Забирает готовый расклад из пула за O(1)
+
+        Returns:
+            Расклад или None, если пул пуст
+        """
+        now = time.monotonic()
+        while self._items:
+            created_at, reading = self._items.popleft()
+            if now - created_at > self.max_age:
+                self.expired += 1
+                continue
+            self.hits += 1
+            self._notify_if_low()
+            return reading
+        self.misses += 1
+        self._notify_if_low()
+        return None
+
+    def stats(self):
+        """Возвращает счетчики попаданий и промахов пула"""
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "expired": self.expired,
+            "failures": self.failures
+        }
+
+    def start(self):
+        """Запускает фоновую задачу пополнения пула"""
+        if self.max_size <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._refill_loop(), name=f"reading-pool-{self.name}")
+
+    async def stop(self):
+        """Останавливает фоновую задачу пополнения пула"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _notify_if_low(self):
+        if len(self._items) < self.low_water:
+            self._wakeup.set()
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        while self._items and now - self._items[0][0] > self.max_age:
+            self._items.popleft()
+            self.expired += 1
+
+    async def _produce_one(self):
+        try:
+            reading = await self.producer()
+        except Exception as e:
+            logging.warning(f"Ошибка при пополнении пула {self.name}: {e}")
+            reading = None
+        if reading is None:
+            self.failures += 1
+            return False
+        if len(self._items) < self.max_size:
+            self._items.append((time.monotonic(), reading))
+        return True
+
+    async def _produce_batch(self, count):
+        try:
+            readings = await self.batch_producer(count)
+        except Exception as e:
+            logging.warning(f"Ошибка при пакетном пополнении пула {self.name}: {e}")
+            readings = None
+        if not readings:
+            self.failures += 1
+            return False
+        now = time.monotonic()
+        for reading in readings[:max(0, self.max_size - len(self._items))]:
+            self._items.append((now, reading))
+        return True
+
+    def _refill_jobs(self):
+        """Возвращает корутины одного шага пополнения (не больше refill_concurrency)"""
+        missing = self.max_size - len(self._items)
+        if self.batch_producer is None:
+            return [self._produce_one() for _ in range(min(self.refill_concurrency, missing))]
+        jobs = []
+        while missing > 0 and len(jobs) < self.refill_concurrency:
+            count = min(self.batch_size, missing)
+            jobs.append(self._produce_batch(count))
+            missing -= count
+        return jobs
+
+    async def _refill_loop(self):
+        while True:
+            self._drop_expired()
+            if len(self._items) < self.low_water:
+                # Пополняем пул до максимального размера, по refill_concurrency запросов за раз
+                while len(self._items) < self.max_size:
+                    results = await asyncio.gather(*self._refill_jobs())
+                    if not any(results):
+                        await asyncio.sleep(READING_POOL_RETRY_DELAY)
+                        break
+                continue
+            # Ждем, пока пул опустеет ниже порога или истечет срок самого старого расклада
+            self._wakeup.clear()
+            timeout = None
+            if self._items:
+                timeout = max(0.0, self.max_age - (time.monotonic() - self._items[0][0]))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,195 @@
+"""Схемы ответов модели и устойчивый разбор JSON
+
+Модель часто оборачивает JSON в ```json ... ``` или дописывает пояснение после
+него. extract_json() находит сам JSON, а pydantic-модели проверяют, что в нем
+есть все нужные поля. Если ответ все же не разобрался, complete_structured()
+делает одну дешевую попытку исправления в режиме JSON.
+"""
+import json
+import logging
+import os
+from collections import defaultdict
+from functools import partial
+from typing import Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from services import generation_service
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Использовать режим JSON (response_format) при исправлении ответа; выключите для моделей без него
+OPENAI_JSON_MODE = os.getenv('OPENAI_JSON_MODE', '1') == '1'
+
+# Сколько открывающих скобок проверять в поисках JSON внутри текста
+MAX_JSON_CANDIDATES = 8
+
+_decoder = json.JSONDecoder()
+
+
+class _Schema(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+
+class StandardInterpretation(_Schema):
+    """Толкование стандартного расклада"""
+    summary: str = Field(min_length=1)
+    recommended_drink: str = Field(min_length=1)
+
+
+class PremiumInterpretation(StandardInterpretation):
+    """Толкование индивидуального расклада (астрология и нумерология необязательны)"""
+    astrology: Optional[str] = None
+    numerology: Optional[str] = None
+    personal_advice: Optional[str] = None
+
+
+class AstroSections(_Schema):
+    """Персональные разделы премиум-гадания: зависят только от даты рождения и дня"""
+    astrology: str = Field(min_length=1)
+    numerology: str = Field(min_length=1)
+
+
+class TestReadingMessage(_Schema):
+    """Послание таролога к тестовому гаданию"""
+    tarot_message: str = Field(min_length=1)
+
+
+class ModelOutputError(ValueError):
+    """Ответ модели не удалось разобрать по схеме
+
+    Args:
+        text: Исходный текст ответа
+        reason: Причина ошибки
+    """
+
+    def __init__(self, text, reason):
+        super().__init__(reason)
+        self.text = text
+
+
+def extract_json(text, opener="{"):
+    """Находит JSON-значение в ответе модели
+
+    Сначала пробует разобрать текст целиком (самый частый случай), затем ищет
+    первое значение, начинающееся с opener, игнорируя ограждение ``` и текст
+    до и после JSON.
+
+    Args:
+        text: Ответ модели
+        opener: "{" для объекта или "[" для массива
+
+    Raises:
+        ModelOutputError: если JSON не найден
+    """
+    if not text:
+        raise ModelOutputError(text, "Пустой ответ модели")
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    start = text.find(opener)
+    for _ in range(MAX_JSON_CANDIDATES):
+        if start < 0:
+            break
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            return value
+        except ValueError:
+            start = text.find(opener, start + 1)
+    raise ModelOutputError(text, "В ответе модели не найден JSON")
+
+
+def parse_output(text, schema):
+    """Извлекает JSON-объект из ответа и проверяет его по схеме
+
+    Raises:
+        ModelOutputError: если ответ не соответствует схеме
+    """
+    data = extract_json(text)
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        raise ModelOutputError(text, f"Ответ не соответствует схеме {schema.__name__}: {e.error_count()} ошибок") from e
+
+
+# Счетчики разбора по промптам: имя промпта -> счетчики
+_parse_stats = defaultdict(lambda: {"calls": 0, "parse_failures": 0, "repaired": 0, "failed": 0})
+
+
+def record_parse(name, ok):
+    """Учитывает разбор ответа без исправления (например, пакетного)"""
+    counters = _parse_stats[name]
+    counters["calls"] += 1
+    if not ok:
+        counters["parse_failures"] += 1
+        counters["failed"] += 1
+
+
+def build_repair_prompt(text, schema):
+    """Собирает промпт исправления ответа по JSON Schema"""
+    return f"""Преобразуй ответ ниже в JSON, строго соответствующий схеме. Сохрани смысл и язык текста, ничего не добавляй.
+Верни только JSON-объект без пояснений.
+
+Схема:
+{json.dumps(schema.model_json_schema(), ensure_ascii=False)}
+
+Ответ:
+{text}"""
+
+
+async def complete_structured(prompt, schema, name, temperature=0.7, max_tokens=500, cache=False):
+    """Генерирует ответ и разбирает его по схеме, при ошибке делает одну попытку исправления
+
+    Args:
+        prompt: Текст промпта
+        schema: pydantic-модель ожидаемого ответа
+        name: Имя промпта для статистики ошибок разбора и бюджета токенов
+        temperature: Температура генерации
+        max_tokens: Максимальное количество токенов
+        cache: Использовать кэш ответов (в кэш попадают только разобранные ответы)
+
+    Returns:
+        Экземпляр schema
+
+    Raises:
+        ModelOutputError: если ответ не удалось разобрать и после исправления
+        Исключения генерации пробрасываются вызывающему коду
+    """
+    counters = _parse_stats[name]
+    counters["calls"] += 1
+    parse = partial(parse_output, schema=schema)
+    try:
+        return await generation_service.complete(
+            prompt, temperature=temperature, max_tokens=max_tokens, cache=cache,
+            parse=parse,
+            prompt_name=name
+        )
+    except ModelOutputError as e:
+        counters["parse_failures"] += 1
+        logging.warning(f"Ответ на промпт {name} не разобран ({e}), пробуем исправить")
+        bad_text = e.text
+
+    try:
+        result = await generation_service.complete(
+            build_repair_prompt(bad_text, schema),
+            temperature=0,
+            max_tokens=max_tokens,
+            json_mode=OPENAI_JSON_MODE,
+            parse=parse
+        )
+    except Exception:
+        counters["failed"] += 1
+        raise
+    counters["repaired"] += 1
+    return result
+
+
+def stats():
+    """Возвращает долю неразобранных ответов по промптам"""
+    return {
+        name: {**counters, "failure_rate": counters["parse_failures"] / counters["calls"] if counters["calls"] else 0.0}
+        for name, counters in _parse_stats.items()
+    }
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Максимальное количество ключей в памяти
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+
+# Время жизни ответа в кэше в секундах
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+
+# Количество разных ответов на один ключ (повторные запросы получают их по кругу)
+RESPONSE_CACHE_VARIANTS = int(os.getenv('RESPONSE_CACHE_VARIANTS', 5))
+
+# Путь к базе SQLite для дискового уровня кэша (пусто - только память)
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', '')
+
+
+def make_key(model, prompt, temperature, max_tokens):
+    """Вычисляет ключ кэша по параметрам запроса"""
+    raw = json.dumps([model, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Entry:
+    """Набор вариантов ответа на один ключ"""
+
+    __slots__ = ("values", "max_variants", "expires_at", "cursor", "size")
+
+    def __init__(self, values, max_variants, expires_at):
+        self.values = values
+        self.max_variants = max_variants
+        self.expires_at = expires_at
+        self.cursor = 0
+        self.size = sum(len(value.encode('utf-8')) for value in values)
+
+
+class ResponseCache:
+    """Кэш ответов модели с LRU-вытеснением, TTL и несколькими вариантами на ключ
+
+    Пока для ключа накоплено меньше max_variants ответов, get() возвращает None и
+    вызывающий код генерирует новый ответ. Затем повторные запросы получают
+    сохраненные варианты по кругу, поэтому ответы не выглядят одинаковыми.
+
+    Чтение и запись дискового уровня выполняются в одном отдельном потоке, по
+    порядку, и не блокируют event loop: get() при промахе в памяти ждет чтения
+    с диска, а put() пишет в фоне. put() смотрит только в память: ключ,
+    сохраненный на диске, туда уже загрузил предшествующий get().
+
+    Args:
+        max_entries: Максимальное количество ключей в памяти
+        ttl: Время жизни ключа в секундах по умолчанию
+        variants: Количество вариантов ответа на ключ по умолчанию
+        disk_path: Путь к базе SQLite дискового уровня (None - только память)
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 variants=RESPONSE_CACHE_VARIANTS, disk_path=RESPONSE_CACHE_PATH or None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.disk_path = Path(disk_path) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.bytes_held = 0
+        self._entries = OrderedDict()
+        self._disk = None
+        self._executor = None
+        if self.disk_path is not None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+
+    def _disk_connection(self):
+        # Вызывается только в потоке дискового уровня
+        if self._disk is None:
+            self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.disk_path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, vals TEXT NOT NULL, max_variants INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL)"
+            )
+            self._disk = conn
+        return self._disk
+
+    def _load_from_disk(self, key):
+        try:
+            row = self._disk_connection().execute(
+                "SELECT vals, max_variants, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Ошибка чтения дискового кэша ответов: {e}")
+            return None
+        if row is None:
+            return None
+        # Время на диске абсолютное, в памяти - монотонное
+        expires_at = time.monotonic() + (row[2] - time.time())
+        return _Entry(json.loads(row[0]), row[1], expires_at)
+
+    def _save_to_disk(self, key, entry):
+        values = json.dumps(entry.values, ensure_ascii=False)
+        expires_at = time.time() + (entry.expires_at - time.monotonic())
+
+        def write():
+            try:
+                self._disk_connection().execute(
+                    "INSERT OR REPLACE INTO responses (key, vals, max_variants, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, values, entry.max_variants, expires_at)
+                )
+            except sqlite3.Error as e:
+                logging.warning(f"Ошибка записи дискового кэша ответов: {e}")
+
+        asyncio.get_running_loop().run_in_executor(self._executor, write)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes_held -= entry.size
+
+    def _lookup(self, key):
+        """Ищет ключ только в памяти"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def _lookup_with_disk(self, key):
+        """Ищет ключ в памяти, а при промахе - на диске (в потоке дискового уровня)"""
+        entry = self._lookup(key)
+        if entry is not None or self._executor is None:
+            return entry
+        entry = await asyncio.get_running_loop().run_in_executor(self._executor, self._load_from_disk, key)
+        if entry is None:
+            return None
+        # Пока шло чтение, ключ мог появиться в памяти (put() из другой задачи)
+        current = self._lookup(key)
+        if current is not None:
+            return current
+        self._insert(key, entry)
+        self.disk_hits += 1
+        return entry
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self.bytes_held += entry.size
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes_held -= evicted.size
+
+    async def get(self, key):
+        """Возвращает очередной сохраненный вариант ответа или None, если вариантов пока мало"""
+        entry = await self._lookup_with_disk(key)
+        if entry is None or len(entry.values) < entry.max_variants:
+            self.misses += 1
+            return None
+        value = entry.values[entry.cursor % len(entry.values)]
+        entry.cursor += 1
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None, variants=None):
+        """Добавляет вариант ответа для ключа
+
+        Args:
+            key: Ключ из make_key()
+            value: Текст ответа
+            ttl: Время жизни ключа в секундах (по умолчанию ttl кэша)
+            variants: Количество вариантов для ключа (по умолчанию variants кэша)
+        """
+        if value is None:
+            return
+        entry = self._lookup(key)
+        if entry is None:
+            entry = _Entry([], max(1, variants or self.variants), time.monotonic() + (ttl or self.ttl))
+            self._insert(key, entry)
+        if len(entry.values) >= entry.max_variants:
+            return
+        entry.values.append(value)
+        size = len(value.encode('utf-8'))
+        entry.size += size
+        self.bytes_held += size
+        if self._executor is not None:
+            self._save_to_disk(key, entry)
+
+    def stats(self):
+        """Возвращает статистику кэша: попадания, промахи, долю попаданий и объем"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "bytes_held": self.bytes_held
+        }
+
+    def close(self):
+        """Закрывает дисковый уровень кэша"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+
+# Общий кэш ответов для сервиса генерации
+response_cache = ResponseCache()
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Максимальное количество одновременно выполняемых ключей (сверх него запросы не объединяются)
+SINGLE_FLIGHT_MAX_KEYS = int(os.getenv('SINGLE_FLIGHT_MAX_KEYS', 1000))
+
+# Сколько секунд собирать одинаковые запросы в пачку, если такой запрос уже выполняется
+SINGLE_FLIGHT_BATCH_WINDOW = float(os.getenv('SINGLE_FLIGHT_BATCH_WINDOW', 0.05))
+
+# Максимальное количество разных ответов, запрашиваемых одним вызовом
+SINGLE_FLIGHT_MAX_BATCH = int(os.getenv('SINGLE_FLIGHT_MAX_BATCH', 8))
+
+
+def _consume_exception(task):
+    """Забирает исключение задачи, если ее результат никто не дождался"""
+    if not task.cancelled():
+        task.exception()
+
+
+class _Batch:
+    """Пачка одинаковых запросов, каждому из которых нужен свой ответ"""
+
+    __slots__ = ("waiters", "task")
+
+    def __init__(self):
+        self.waiters = []
+        self.task = None
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов
+
+    shared(): пока запрос с ключом выполняется, остальные такие же запросы не
+    идут в API, а ждут его результат (для ответов, которые можно показать
+    всем, например кэшируемых).
+
+    unique(): каждому нужен свой ответ. Первый запрос выполняется сразу; если
+    такой запрос уже выполняется, новые собираются в пачку в течение
+    batch_window секунд и получают разные варианты одного вызова с n = размер
+    пачки. Вызовов API меньше, а ответы не повторяются.
+
+    Если одновременно выполняется больше max_keys ключей, запросы идут в API
+    напрямую, поэтому память ограничена при любой нагрузке.
+
+    Args:
+        max_keys: Максимальное количество одновременно выполняемых ключей
+        batch_window: Время сбора пачки в секундах
+        max_batch: Максимальный размер пачки
+    """
+
+    def __init__(self, max_keys=SINGLE_FLIGHT_MAX_KEYS, batch_window=SINGLE_FLIGHT_BATCH_WINDOW,
+                 max_batch=SINGLE_FLIGHT_MAX_BATCH):
+        self.max_keys = max(1, max_keys)
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        # Выполняемые запросы: ключ -> задача (shared) или количество вызовов (unique)
+        self._shared = {}
+        self._active = {}
+        # Собираемые пачки: ключ -> _Batch
+        self._batches = {}
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.batched = 0
+        self.bypassed = 0
+
+    def _full(self):
+        return len(self._shared) + len(self._active) >= self.max_keys
+
+    async def shared(self, key, call):
+        """Выполняет call() один раз для всех одновременных запросов с ключом key
+
+        Args:
+            key: Ключ запроса
+            call: Функция без аргументов, возвращающая корутину запроса
+
+        Returns:
+            Результат call(), общий для всех ожидающих
+        """
+        self.calls += 1
+        task = self._shared.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        if self._full():
+            self.bypassed += 1
+            self.upstream_calls += 1
+            return await call()
+        self.upstream_calls += 1
+        # Запрос выполняется отдельной задачей: отмена первого ожидающего не отменяет остальных
+        task = self._shared[key] = asyncio.ensure_future(call())
+        task.add_done_callback(lambda _: self._shared.pop(key, None))
+        task.add_done_callback(_consume_exception)
+        return await asyncio.shield(task)
+
+    async def unique(self, key, call_many):
+        """Выполняет запрос так, чтобы одновременные одинаковые запросы получили разные ответы
+
+        Args:
+            key: Ключ запроса
+            call_many: Функция call_many(n), возвращающая корутину со списком из n ответов
+
+        Returns:
+            Один из ответов, не выданный другим ожидающим
+        """
+        self.calls += 1
+        if key not in self._active:
+            # Такой запрос сейчас не выполняется - идем в API сразу, без ожидания
+            if self._full():
+                self.bypassed += 1
+                self.upstream_calls += 1
+                return (await call_many(1))[0]
+            return (await self._run(key, call_many, 1))[0]
+
+        batch = self._batches.get(key)
+        if batch is None or len(batch.waiters) >= self.max_batch:
+            batch = self._batches[key] = _Batch()
+            batch.task = asyncio.ensure_future(self._collect(key, batch, call_many))
+            batch.task.add_done_callback(_consume_exception)
+        else:
+            self.coalesced += 1
+        self.batched += 1
+        future = asyncio.get_running_loop().create_future()
+        batch.waiters.append(future)
+        return await future
+
+    async def _run(self, key, call_many, n):
+        self._active[key] = self._active.get(key, 0) + 1
+        self.upstream_calls += 1
+        try:
+            return await call_many(n)
+        finally:
+            self._active[key] -= 1
+            if self._active[key] <= 0 and key not in self._batches:
+                del self._active[key]
+
+    async def _collect(self, key, batch, call_many):
+        """Собирает пачку в течение batch_window и раздает ожидающим разные ответы"""
+        waiters = batch.waiters
+        try:
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            # Новые запросы с этим ключом начинают следующую пачку
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+            waiters = [future for future in batch.waiters if not future.done()]
+            if not waiters:
+                return
+            results = await self._run(key, call_many, len(waiters))
+            if not results:
+                raise RuntimeError("Запрос не вернул ни одного ответа")
+        except BaseException as e:
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+            for future in waiters:
+                if not future.done():
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+            raise
+        finally:
+            if self._active.get(key) == 0 and key not in self._batches:
+                del self._active[key]
+        if len(results) < len(waiters):
+            logging.warning(f"Получено {len(results)} ответов вместо {len(waiters)}, часть ответов повторится")
+        for index, future in enumerate(waiters):
+            if not future.done():
+                future.set_result(results[index % len(results)])
+
+    def stats(self):
+        """Возвращает количество запросов, вызовов API и объединенных запросов"""
+        return {
+            "in_flight_keys": len(self._shared) + len(self._active),
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "batched": self.batched,
+            "bypassed": self.bypassed
+        }
@@ -0,0 +1,79 @@
+"""Профилирование запуска бота: время импортов и время до первого обновления
+
+Модуль использует только стандартную библиотеку, чтобы его можно было
+подключить до всех тяжелых импортов (см. main.py, флаг --profile-startup).
+"""
+import builtins
+import sys
+import time
+from collections import defaultdict
+
+# Сколько самых медленных пакетов показывать в отчете
+REPORT_TOP = 15
+
+_enabled = False
+_started_at = time.perf_counter()
+_marks = []
+_import_times = defaultdict(float)
+_stack = []
+_original_import = builtins.__import__
+
+
+def _root_package(name, globals, level):
+    if level and globals:
+        package = globals.get('__package__') or globals.get('__name__', '')
+        return package.split('.')[0] or name.split('.')[0]
+    return name.split('.')[0]
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Уже загруженные модули не замеряем: это самый частый и самый быстрый случай
+    if level == 0 and not fromlist and name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    started_at = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started_at
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        # Собственное время модуля (без вложенных импортов) относим к его пакету верхнего уровня
+        _import_times[_root_package(name, globals, level)] += elapsed - nested
+
+
+def enable():
+    """Включает замер импортов; вызывается до импорта тяжелых модулей"""
+    global _enabled, _started_at
+    if _enabled:
+        return
+    _enabled = True
+    _started_at = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def is_enabled():
+    return _enabled
+
+
+def mark(event):
+    """Отмечает момент запуска (секунды от включения профилирования)"""
+    if _enabled:
+        _marks.append((event, time.perf_counter() - _started_at))
+
+
+def report():
+    """Выводит время импортов по пакетам и отметки запуска, затем отключает замер"""
+    if not _enabled:
+        return
+    builtins.__import__ = _original_import
+    lines = ["Профиль запуска бота:", "  Импорты по пакетам (собственное время, мс):"]
+    total = sum(_import_times.values())
+    for package, seconds in sorted(_import_times.items(), key=lambda item: item[1], reverse=True)[:REPORT_TOP]:
+        lines.append(f"    {package:<28} {seconds * 1000:>9.1f}")
+    lines.append(f"    {'всего':<28} {total * 1000:>9.1f}")
+    lines.append("  Отметки (с от запуска):")
+    for event, seconds in _marks:
+        lines.append(f"    {event:<28} {seconds:>9.3f}")
+    print("\n".join(lines), flush=True)
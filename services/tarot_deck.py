@@ -0,0 +1,259 @@
+import os
+import random
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Вероятность выпадения перевернутой карты
+TAROT_REVERSAL_PROBABILITY = float(os.getenv('TAROT_REVERSAL_PROBABILITY', 0.3))
+
+MAJOR_ARCANA = "major"
+MINOR_ARCANA = "minor"
+
+
+class Card:
+    """Карта Таро с заранее подготовленными значениями"""
+
+    __slots__ = ("id", "name", "arcana", "suit", "upright", "reversed", "drunk_upright", "drunk_reversed")
+
+    def __init__(self, id, name, arcana, suit, upright, reversed, drunk_upright, drunk_reversed):
+        self.id = id
+        self.name = name
+        self.arcana = arcana
+        self.suit = suit
+        self.upright = upright
+        self.reversed = reversed
+        self.drunk_upright = drunk_upright
+        self.drunk_reversed = drunk_reversed
+
+    def __repr__(self):
+        return f"Card({self.id}, {self.name!r})"
+
+
+class DrawnCard:
+    """Карта, вытянутая в раскладе, с учетом положения"""
+
+    __slots__ = ("card", "is_reversed")
+
+    def __init__(self, card, is_reversed):
+        self.card = card
+        self.is_reversed = is_reversed
+
+    @property
+    def name(self):
+        return f"{self.card.name} (перевернутая)" if self.is_reversed else self.card.name
+
+    @property
+    def description(self):
+        return self.card.reversed if self.is_reversed else self.card.upright
+
+    @property
+    def drunk_interpretation(self):
+        return self.card.drunk_reversed if self.is_reversed else self.card.drunk_upright
+
+    def to_dict(self):
+        """Возвращает карту в формате расклада: name, description, drunk_interpretation"""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "drunk_interpretation": self.drunk_interpretation
+        }
+
+
+# Старшие арканы: (название, прямое значение, перевернутое значение,
+#                  алкогольная интерпретация прямой, алкогольная интерпретация перевернутой)
+_MAJOR_ARCANA = (
+    ("Шут", "Новые начинания, спонтанность и свобода.",
+     "Безрассудство и необдуманный риск.",
+     "Время для спонтанных решений и веселья - закажите то, что никогда не пробовали!",
+     "Тот самый тост, после которого вы решили «ну еще по одной». Остановитесь."),
+    ("Маг", "Сила воли, мастерство и умение воплощать идеи.",
+     "Манипуляции и растраченный впустую талант.",
+     "Ваши способности усиливаются с каждым бокалом - вы сегодня бармен своей судьбы!",
+     "Фокусы с коктейлями лучше отложить: шейкер может вас перехитрить."),
+    ("Верховная Жрица", "Интуиция, тайные знания и внутренний голос.",
+     "Скрытые мотивы и игнорирование интуиции.",
+     "Доверьтесь внутреннему голосу, особенно после третьего шота!",
+     "Внутренний голос шепчет «хватит», а вы делаете вид, что не слышите."),
+    ("Императрица", "Изобилие, забота и плодородие идей.",
+     "Зависимость от чужого мнения и застой.",
+     "Щедрый вечер: угощайте друзей, и вселенная угостит вас.",
+     "Не пытайтесь накормить и напоить всех - оставьте что-нибудь себе."),
+    ("Император", "Власть, порядок и устойчивая структура.",
+     "Упрямство и злоупотребление контролем.",
+     "Вы хозяин вечеринки: составьте барную карту, и все будут следовать ей.",
+     "Не командуйте барменом - он все равно нальет так, как считает нужным."),
+    ("Иерофант", "Традиции, наставничество и общие ценности.",
+     "Бунт против правил и поиск своего пути.",
+     "Классика никогда не подводит: старый добрый рецепт - ваш выбор.",
+     "Пора нарушить традицию и добавить в глинтвейн что-нибудь неожиданное."),
+    ("Влюбленные", "Любовь, гармония и важный выбор.",
+     "Разлад в отношениях и сомнения в выборе.",
+     "Два бокала лучше одного - особенно если второй для кого-то особенного.",
+     "Не пишите бывшим после второго коктейля. И после третьего тоже."),
+    ("Колесница", "Победа, целеустремленность и движение вперед.",
+     "Потеря контроля и отсутствие направления.",
+     "Вы на коне! Только за руль потом не садитесь.",
+     "Вечеринка несется без тормозов - пора вызывать такси."),
+    ("Сила", "Внутренняя сила, мужество и терпение.",
+     "Неуверенность в себе и потеря самообладания.",
+     "Вы можете укротить даже самый крепкий абсент - но зачем?",
+     "Сила воли сегодня на нуле: закажите безалкогольный мохито."),
+    ("Отшельник", "Самопознание, уединение и мудрость.",
+     "Изоляция и одиночество без пользы.",
+     "Бокал хорошего вина в тишине скажет вам больше, чем шумный бар.",
+     "Пить в одиночестве - не медитация. Позовите друзей."),
+    ("Колесо Фортуны", "Удача, перемены и поворот судьбы.",
+     "Невезение и сопротивление переменам.",
+     "Фортуна на вашей стороне: сегодня угадаете с любым коктейлем.",
+     "Колесо повернулось не туда - возможно, это был лишний шот."),
+    ("Справедливость", "Честность, баланс и последствия поступков.",
+     "Несправедливость и уход от ответственности.",
+     "Делите счет поровну и пейте в меру - карма все видит.",
+     "Утро непременно предъявит счет за вчерашний вечер."),
+    ("Повешенный", "Пауза, новый взгляд и жертва ради цели.",
+     "Застой и бессмысленное ожидание.",
+     "Посмотрите на ситуацию с другой стороны - например, сквозь дно бокала.",
+     "Вы слишком долго выбираете напиток. Просто закажите что-нибудь."),
+    ("Смерть", "Завершение этапа и трансформация.",
+     "Страх перемен и цепляние за прошлое.",
+     "Пора закончить старую главу: допивайте и переходите к новому бару.",
+     "Похмелье - это не конец света, хотя по ощущениям похоже."),
+    ("Умеренность", "Баланс, терпение и гармония.",
+     "Излишества и потеря равновесия.",
+     "Идеальный коктейль - это пропорции. Чередуйте бокал и стакан воды.",
+     "Умеренность сегодня явно не ваша сильная сторона. Вода на тумбочке обязательна."),
+    ("Дьявол", "Искушения, зависимости и материальные желания.",
+     "Освобождение от вредных привычек.",
+     "Искушение велико: десертный ликер уже подмигивает вам.",
+     "Вы разрываете цепи - может быть, сегодня тот самый трезвый вечер?"),
+    ("Башня", "Внезапные перемены и разрушение иллюзий.",
+     "Избегание катастрофы или отсроченный кризис.",
+     "Вечер пойдет не по плану, но будет что вспомнить. Или не вспомнить.",
+     "Вы едва избежали позорного караоке. Не искушайте судьбу."),
+    ("Звезда", "Надежда, вдохновение и исцеление.",
+     "Разочарование и потеря веры в себя.",
+     "Игристое под звездным небом - вселенная верит в вас!",
+     "Звезды временно скрыты облаками. Утешьтесь горячим чаем с ромом."),
+    ("Луна", "Иллюзии, страхи и подсознание.",
+     "Прояснение и выход из заблуждений.",
+     "Не все то джин, что прозрачно. Проверяйте, что вам налили.",
+     "Туман рассеивается - вы наконец поняли, почему нельзя мешать напитки."),
+    ("Солнце", "Радость, успех и жизненная сила.",
+     "Временная грусть и завышенные ожидания.",
+     "Лучший день для летней веранды и холодного пива!",
+     "Солнце светит, но голова болит. Темные очки и рассол спасут."),
+    ("Суд", "Пробуждение, переоценка и второй шанс.",
+     "Самокритика и сомнения в своих решениях.",
+     "Время поднять бокал за все ваши прошлые ошибки - они привели вас сюда.",
+     "Вы слишком строги к себе из-за вчерашнего. Все уже забыли. Почти."),
+    ("Мир", "Завершенность, гармония и достижение цели.",
+     "Незавершенные дела и ощущение пустоты.",
+     "Праздник по всем фронтам - открывайте шампанское!",
+     "Остался один шаг до цели. И одна недопитая бутылка."),
+)
+
+# Масти младших арканов: (название в родительном падеже, сфера жизни, напиток масти)
+_SUITS = (
+    ("wands", "Жезлов", "энергии, страсти и амбиций", "огненная текила"),
+    ("cups", "Кубков", "чувств, любви и отношений", "бокал красного вина"),
+    ("swords", "Мечей", "мыслей, решений и конфликтов", "строгий джин-тоник"),
+    ("pentacles", "Пентаклей", "денег, работы и материальных благ", "выдержанный виски"),
+)
+
+# Достоинства младших арканов: (название, прямое значение, перевернутое значение,
+#                               алкогольный совет прямой, алкогольный совет перевернутой)
+_RANKS = (
+    ("Туз", "Новая возможность и мощный импульс", "Упущенный шанс и ложный старт",
+     "Первый бокал вечера задает тон - пусть это будет {drink}",
+     "Не начинайте вечер с самого крепкого - разгон будет слишком резким"),
+    ("Двойка", "Выбор, партнерство и планирование", "Нерешительность и разлад",
+     "Закажите две порции: {drink} для вас и для того, с кем вы сомневаетесь",
+     "Вы не можете выбрать между двумя напитками. Возьмите воду"),
+    ("Тройка", "Рост, сотрудничество и первые успехи", "Задержки и разногласия в команде",
+     "Компания из трех друзей и {drink} - идеальная формула",
+     "Третий в компании лишний, особенно если это третий бокал"),
+    ("Четверка", "Стабильность, отдых и передышка", "Застой и скука",
+     "Тихий вечер, удобное кресло и {drink}",
+     "Сидеть весь вечер над одним бокалом - тоже не лучший план"),
+    ("Пятерка", "Испытания, потери и борьба", "Восстановление после трудностей",
+     "Трудный день заслуживает хорошего напитка - но только одного",
+     "Худшее позади: {drink} за то, что вы выстояли"),
+    ("Шестерка", "Гармония, помощь и приятные воспоминания", "Жизнь прошлым и неравный обмен",
+     "Угостите того, кто вам помогал, - {drink} укрепит дружбу",
+     "Ностальгия по студенческим вечеринкам не повод пить как студент"),
+    ("Семерка", "Настойчивость, оценка и выбор пути", "Сомнения и распыление сил",
+     "Отстаивайте свой выбор в барной карте до конца",
+     "Семь видов настоек за вечер - это не дегустация, это ошибка"),
+    ("Восьмерка", "Движение, перемены и усердная работа", "Суета и потеря темпа",
+     "Вечер будет насыщенным: смена баров гарантирована",
+     "Вы застряли в одном баре на восемь часов. Пора домой"),
+    ("Девятка", "Почти достигнутая цель и удовлетворение", "Тревога и усталость",
+     "Вы почти у цели - отметьте это, но без фанатизма",
+     "Бессонная ночь не лечится девятым бокалом"),
+    ("Десятка", "Завершение цикла и его итог", "Перегрузка и бремя ответственности",
+     "Итоги подведены, {drink} в руке - вы заслужили",
+     "Вы взвалили на себя слишком много, включая счет за всю компанию"),
+    ("Паж", "Любопытство, новости и ученичество", "Незрелость и пустые обещания",
+     "Попробуйте новый напиток: бармен будет вашим учителем",
+     "Обещание «я только одну» сегодня не сработает"),
+    ("Рыцарь", "Действие, смелость и стремительность", "Импульсивность и безрассудство",
+     "Смело делайте заказ - {drink} и танцпол ждут вас",
+     "Не лезьте в спор с охранником. Поверьте картам"),
+    ("Королева", "Зрелость, забота и уверенность", "Капризность и холодность",
+     "Вы королева вечера - {drink} подается только лучшим",
+     "Не требуйте у бармена невозможного, он не волшебник"),
+    ("Король", "Лидерство, контроль и опыт", "Властность и потеря самообладания",
+     "Вы знаете меру и умеете ей следовать - сегодня вам можно доверить бар",
+     "Король без меры теряет корону. И телефон. И ключи"),
+)
+
+
+def _build_deck():
+    """Собирает колоду из 78 карт (вызывается один раз при импорте)"""
+    cards = []
+    for name, upright, reversed_, drunk_upright, drunk_reversed in _MAJOR_ARCANA:
+        cards.append(Card(len(cards), name, MAJOR_ARCANA, None, upright, reversed_, drunk_upright, drunk_reversed))
+    for suit, suit_name, domain, drink in _SUITS:
+        for rank, upright, reversed_, drunk_upright, drunk_reversed in _RANKS:
+            cards.append(Card(
+                len(cards),
+                f"{rank} {suit_name}",
+                MINOR_ARCANA,
+                suit,
+                f"{upright} в сфере {domain}.",
+                f"{reversed_} в сфере {domain}.",
+                drunk_upright.format(drink=drink) + "!",
+                drunk_reversed.format(drink=drink) + "."
+            ))
+    return tuple(cards)
+
+
+# Колода загружается один раз при импорте модуля
+DECK = _build_deck()
+
+# Индекс карт по названию
+CARDS_BY_NAME = {card.name: card for card in DECK}
+
+
+def draw(count=3, seed=None, reversals=True, rng=None):
+    """Вытягивает карты из колоды без повторений
+
+    Args:
+        count: Количество карт
+        seed: Зерно генератора для воспроизводимого расклада
+        reversals: Разрешить перевернутые карты
+        rng: Собственный генератор random.Random (имеет приоритет над seed)
+
+    Returns:
+        Список DrawnCard
+    """
+    if rng is None:
+        rng = random.Random(seed) if seed is not None else random
+    indices = rng.sample(range(len(DECK)), count)
+    return [
+        DrawnCard(DECK[index], reversals and rng.random() < TAROT_REVERSAL_PROBABILITY)
+        for index in indices
+    ]
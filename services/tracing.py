@@ -0,0 +1,455 @@
+"""Легковесная трассировка обработки обновлений
+
+Для каждого обновления создается корневой спан update (от постановки в
+очередь до возврата обработчика, то есть до последнего отправленного
+сообщения), внутри него - спаны обработчика, запросов к OpenAI, пауз анимации
+и запросов к Bot API. Текущий спан хранится в contextvars, поэтому контекст
+сам переходит в задачи, запущенные из обработчика (генерация параллельно с
+анимацией), и не требует передачи через аргументы.
+
+Завершенные спаны копятся в буфере и раз в TRACE_FLUSH_INTERVAL секунд
+записываются в JSONL-файл (в отдельном потоке) или отправляются в формате
+OTLP/JSON на коллектор (например, заглушку из benchmarks/mock_servers.py).
+Отчет по критическому пути самых медленных раскладов строит
+benchmarks/trace_report.py.
+
+Когда трассировка выключена (TRACING=off), start_span() возвращает общий
+пустой спан, и накладные расходы сводятся к одной проверке.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from pathlib import Path
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Директория для данных бота
+DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent / 'data'
+
+# Куда выгружать спаны: off (трассировка выключена), jsonl (файл TRACE_FILE) или otlp (коллектор TRACE_OTLP_URL)
+TRACING = os.getenv('TRACING', 'off')
+
+# Файл со спанами для режима jsonl
+TRACE_FILE = Path(os.getenv('TRACE_FILE', DATA_DIR / 'traces.jsonl'))
+
+# Адрес приема спанов коллектора в формате OTLP/HTTP JSON
+TRACE_OTLP_URL = os.getenv('TRACE_OTLP_URL', 'http://127.0.0.1:4318/v1/traces')
+
+# Доля трассируемых обновлений (решение принимается для корневого спана)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+
+# Интервал выгрузки накопленных спанов в секундах
+TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', 1.0))
+
+# Максимум спанов в буфере: при недоступном коллекторе лишние отбрасываются
+TRACE_BUFFER_LIMIT = 10_000
+
+# Имя сервиса в экспорте OTLP
+SERVICE_NAME = 'tarot-bot'
+
+_current = ContextVar('tarot_current_span', default=None)
+# Время постановки обновления в очередь (time.monotonic()), выставляется обработчиком очереди
+_arrival = ContextVar('tarot_update_arrival', default=None)
+
+
+class _NoopSpan:
+    """Пустой спан: трассировка выключена или родитель не попал в выборку
+
+    Один общий экземпляр на все вызовы, поэтому контекст не меняет.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _UnsampledSpan(_NoopSpan):
+    """Корневой спан обновления, не попавшего в выборку
+
+    Становится текущим, чтобы дочерние спаны этого обновления тоже не
+    создавались. Создается на каждое обновление: токен контекста у каждого свой.
+    """
+
+    __slots__ = ('_token',)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """Интервал работы с атрибутами, используется как контекстный менеджер
+
+    Args:
+        name: Имя спана; часть до точки - категория в отчете (llm, sleep, telegram)
+        parent: Родительский спан или None для корневого
+        attrs: Атрибуты спана
+        start: Время начала (time.time()), по умолчанию - сейчас
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'end', 'attrs', '_token')
+
+    def __init__(self, name, parent=None, attrs=None, start=None):
+        self.trace_id = parent.trace_id if parent is not None else f'{random.getrandbits(128):032x}'
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.attrs = attrs or {}
+        self._token = None
+
+    def set(self, **attrs):
+        """Добавляет атрибуты спану"""
+        self.attrs.update(attrs)
+        return self
+
+    def finish(self, end=None):
+        """Завершает спан и передает его на выгрузку"""
+        self.end = end if end is not None else time.time()
+        _exporter.add(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'end': self.end,
+            'attrs': self.attrs
+        }
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.finish()
+        return False
+
+
+def start_span(name, start=None, **attrs):
+    """Создает дочерний спан текущего (или корневой, если текущего нет)
+
+    Пример:
+        with start_span('llm.complete', prompt='premium'):
+            ...
+
+    Returns:
+        Span или пустой спан, если трассировка выключена или обновление не в выборке
+    """
+    if _exporter is None:
+        return _NOOP
+    parent = _current.get()
+    if parent is None:
+        if TRACE_SAMPLE_RATE < 1 and random.random() >= TRACE_SAMPLE_RATE:
+            return _UnsampledSpan()
+    elif isinstance(parent, _NoopSpan):
+        return _NOOP
+    return Span(name, parent, attrs, start)
+
+
+def record_span(name, start, end, **attrs):
+    """Записывает уже завершенный дочерний спан текущего (например, по данным хука)"""
+    if _exporter is None:
+        return
+    parent = _current.get()
+    if parent is None or isinstance(parent, _NoopSpan):
+        return
+    Span(name, parent, attrs, start).finish(end)
+
+
+async def sleep(seconds, **attrs):
+    """asyncio.sleep в спане sleep: паузы анимации видны в трассировке"""
+    with start_span('sleep', seconds=seconds, **attrs):
+        await asyncio.sleep(seconds)
+
+
+def mark_arrival(enqueued_at):
+    """Запоминает время постановки обновления в очередь (time.monotonic()) для корневого спана"""
+    _arrival.set(enqueued_at)
+
+
+class _BufferedExporter:
+    """Буфер завершенных спанов с периодической выгрузкой"""
+
+    def __init__(self, flush_interval=TRACE_FLUSH_INTERVAL, limit=TRACE_BUFFER_LIMIT):
+        self.flush_interval = flush_interval
+        self.limit = limit
+        self._buffer = []
+        self._flush_task = None
+        self.exported = 0
+        self.dropped = 0
+
+    def add(self, span):
+        if len(self._buffer) >= self.limit:
+            self.dropped += 1
+            return
+        self._buffer.append(span)
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+            except RuntimeError:
+                # Вне цикла событий (скрипты, тесты) спаны выгружаются при close()
+                pass
+
+    async def _flush_later(self):
+        if self.flush_interval > 0:
+            await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Выгружает накопленные спаны"""
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        try:
+            await self._export([span.to_dict() for span in spans])
+            self.exported += len(spans)
+        except Exception as e:
+            self.dropped += len(spans)
+            logging.warning(f"Не удалось выгрузить {len(spans)} спанов: {e}")
+
+    async def _export(self, spans):
+        raise NotImplementedError
+
+    async def close(self):
+        """Выгружает оставшиеся спаны"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+
+class JsonlExporter(_BufferedExporter):
+    """Дописывает спаны в JSONL-файл, по одному спану в строке"""
+
+    def __init__(self, path=TRACE_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trace-writer')
+
+    def _write(self, spans):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('a', encoding='utf-8') as file:
+            file.writelines(json.dumps(span, ensure_ascii=False) + '\n' for span in spans)
+
+    async def _export(self, spans):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, spans)
+
+    async def close(self):
+        await super().close()
+        self._executor.shutdown(wait=True)
+
+
+class OTLPExporter(_BufferedExporter):
+    """Отправляет спаны на коллектор в формате OTLP/HTTP JSON"""
+
+    def __init__(self, url=TRACE_OTLP_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self._client = None
+
+    async def _export(self, spans):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(timeout=5)
+        response = await self._client.post(self.url, json=to_otlp(spans))
+        response.raise_for_status()
+
+    async def close(self):
+        await super().close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans):
+    """Преобразует спаны (словари to_dict) в тело запроса OTLP/HTTP JSON"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': 'services.tracing'},
+            'spans': [{
+                'traceId': span['trace_id'],
+                'spanId': span['span_id'],
+                'parentSpanId': span['parent_id'] or '',
+                'name': span['name'],
+                'kind': 1,
+                'startTimeUnixNano': str(int(span['start'] * 1e9)),
+                'endTimeUnixNano': str(int(span['end'] * 1e9)),
+                'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span['attrs'].items()]
+            } for span in spans]
+        }]
+    }]}
+
+
+def from_otlp(payload):
+    """Преобразует тело запроса OTLP/HTTP JSON обратно в спаны (словари to_dict)"""
+    spans = []
+    for resource_spans in payload.get('resourceSpans', []):
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for span in scope_spans.get('spans', []):
+                attrs = {}
+                for attribute in span.get('attributes', []):
+                    value = attribute.get('value', {})
+                    for kind, cast in (('stringValue', str), ('intValue', int), ('doubleValue', float),
+                                       ('boolValue', bool)):
+                        if kind in value:
+                            attrs[attribute['key']] = cast(value[kind])
+                            break
+                spans.append({
+                    'trace_id': span['traceId'],
+                    'span_id': span['spanId'],
+                    'parent_id': span.get('parentSpanId') or None,
+                    'name': span['name'],
+                    'start': int(span['startTimeUnixNano']) / 1e9,
+                    'end': int(span['endTimeUnixNano']) / 1e9,
+                    'attrs': attrs
+                })
+    return spans
+
+
+def _create_exporter(kind):
+    if kind == 'off':
+        return None
+    if kind == 'jsonl':
+        return JsonlExporter()
+    if kind == 'otlp':
+        return OTLPExporter()
+    raise ValueError(f"Неизвестный режим трассировки: {kind}")
+
+
+# Текущий экспортер (None - трассировка выключена)
+_exporter = _create_exporter(TRACING)
+
+
+def configure(exporter):
+    """Заменяет экспортер (None выключает трассировку); используется в нагрузочных тестах"""
+    global _exporter
+    _exporter = exporter
+
+
+def stats():
+    """Возвращает количество выгруженных и отброшенных спанов"""
+    if _exporter is None:
+        return {'enabled': False}
+    return {'enabled': True, 'exported': _exporter.exported, 'dropped': _exporter.dropped}
+
+
+async def close():
+    """Выгружает оставшиеся спаны (вызывается при остановке диспетчера)"""
+    if _exporter is not None:
+        await _exporter.close()
+
+
+def observe_llm_call(kind, duration, response_usage, error):
+    """Хук сервиса генерации: спан запроса к OpenAI в текущей трассировке"""
+    end = time.time()
+    attrs = {'outcome': 'ok' if error is None else type(error).__name__}
+    if response_usage is not None:
+        attrs['prompt_tokens'] = response_usage.prompt_tokens or 0
+        attrs['completion_tokens'] = response_usage.completion_tokens or 0
+    record_span(f'llm.{kind}', end - duration, end, **attrs)
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: корневой спан обновления
+
+    Если обновление пришло через очередь, спан начинается с момента постановки
+    в очередь, а ожидание в ней записывается отдельным спаном queue_wait.
+    """
+
+    async def __call__(self, handler, event, data):
+        if _exporter is None:
+            return await handler(event, data)
+        now = time.time()
+        enqueued_at = _arrival.get()
+        start = now - (time.monotonic() - enqueued_at) if enqueued_at is not None else now
+        user = data.get('event_from_user')
+        with start_span('update', start=start, type=event.event_type, update_id=event.update_id,
+                        user_id=user.id if user else None) as span:
+            if enqueued_at is not None and isinstance(span, Span):
+                Span('queue_wait', span, start=start).finish(now)
+            return await handler(event, data)
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Внутренний middleware событий: спан обработчика с его именем"""
+
+    async def __call__(self, handler, event, data):
+        if _exporter is None:
+            return await handler(event, data)
+        with start_span('handler', handler=data['handler'].callback.__name__):
+            return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: спан каждого запроса к Bot API
+
+    Подключается до OutboundScheduler, поэтому спан включает ожидание
+    очереди отправки с учетом лимитов Telegram.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        if _exporter is None:
+            return await make_request(bot, method)
+        with start_span(f'telegram.{method.__api_method__}'):
+            return await make_request(bot, method)
+
+
+def setup_tracing(dispatcher, bot):
+    """Подключает трассировку к диспетчеру, боту и сервису генерации
+
+    Вызывается до подключения OutboundScheduler к сессии бота, чтобы спаны
+    запросов к Bot API включали ожидание в планировщике.
+    """
+    from services import generation_service
+
+    dispatcher.update.outer_middleware(UpdateTracingMiddleware())
+    handler_middleware = HandlerTracingMiddleware()
+    for event_name, observer in dispatcher.observers.items():
+        if event_name not in ('update', 'error'):
+            observer.middleware(handler_middleware)
+    bot.session.middleware(TelegramTracingMiddleware())
+    generation_service.add_call_hook(observe_llm_call)
+    # Оставшиеся спаны выгружаются при остановке
+    dispatcher.shutdown.register(close)
@@ -0,0 +1,229 @@
+"""Готовые клавиатуры и шаблоны сообщений бота
+
+Клавиатуры и статические тексты создаются один раз при импорте модуля, а
+обработчики берут их по ключу, не собирая InlineKeyboardBuilder на каждое
+обновление. Параметризованные сообщения - это шаблоны MessageTemplate:
+разметка и постоянные значения (цены, лимиты) подставляются при создании,
+в обработчике остается только подстановка данных расклада.
+
+Клавиатуры общие для всех обновлений, поэтому изменять их нельзя; если
+нужна другая клавиатура, добавьте ее в реестр.
+"""
+import string
+from types import MappingProxyType
+
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+# Максимальное количество тестовых раскладов для одного пользователя
+MAX_TEST_READINGS = 3
+
+# Стоимость стандартного и индивидуального гадания в Stars
+STANDARD_READING_STARS = 100
+PREMIUM_READING_STARS = 300
+
+
+def build_keyboard(buttons):
+    """Собирает клавиатуру с кнопками в один столбец
+
+    Args:
+        buttons: Список кортежей (текст, callback_data)
+    """
+    builder = InlineKeyboardBuilder()
+    for text, callback_data in buttons:
+        builder.button(text=text, callback_data=callback_data)
+    builder.adjust(1)  # Размещаем кнопки в один столбец
+    return builder.as_markup()
+
+
+# Реестр клавиатур: ключ -> InlineKeyboardMarkup (только для чтения)
+KEYBOARDS = MappingProxyType({
+    "main_menu": build_keyboard([
+        ("🔮 Начать гадать", "start_reading"),
+        ("🌟 Индивидуальное гадание", "premium_reading"),
+        ("🧪 Тест", "test_reading")
+    ]),
+    "start_reading": build_keyboard([("🔮 Начать гадать", "start_reading")]),
+    "after_reading": build_keyboard([
+        ("🔮 Сделать новый расклад", "start_reading"),
+        ("🏠 Вернуться в меню", "return_to_menu")
+    ]),
+    "payment": build_keyboard([
+        (f"💳 Оплатить {STANDARD_READING_STARS} Stars", "pay_reading"),
+        ("❌ Отмена", "cancel_reading")
+    ]),
+    "premium_payment": build_keyboard([
+        (f"💳 Оплатить {PREMIUM_READING_STARS} Stars", "pay_premium_reading"),
+        ("❌ Отмена", "cancel_reading")
+    ])
+})
+
+
+class MessageTemplate:
+    """Шаблон сообщения, подготовленный один раз при создании
+
+    Постоянные значения подставляются сразу, в обработчике остается только
+    подстановка данных расклада через str.format_map. Поля проверяются при
+    создании: опечатка в имени постоянного значения обнаруживается при
+    запуске бота, а не при первом раскладе.
+
+    render(values) берет значения из словаря (например, карты; лишние ключи
+    игнорируются), render(**kwargs) - из именованных аргументов.
+
+    Args:
+        text: Текст в формате str.format
+        parse_mode: Режим разметки для Telegram
+        **constants: Значения, подставляемые один раз при создании
+    """
+
+    __slots__ = ("text", "parse_mode", "fields")
+
+    def __init__(self, text, parse_mode=None, **constants):
+        parts = []
+        fields = set()
+        used_constants = set()
+        for literal, name, spec, conversion in string.Formatter().parse(text):
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if name is None:
+                continue
+            if not name.isidentifier():
+                raise ValueError(f"Поле шаблона должно быть именем: {name!r}")
+            if name in constants:
+                used_constants.add(name)
+                parts.append(format(constants[name], spec or "").replace("{", "{{").replace("}", "}}"))
+                continue
+            fields.add(name)
+            parts.append("{" + name + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}")
+        missing = set(constants) - used_constants
+        if missing:
+            raise ValueError(f"В шаблоне нет полей {sorted(missing)}")
+        self.text = "".join(parts)
+        self.fields = frozenset(fields)
+        self.parse_mode = parse_mode
+
+    def render(self, values=None, /, **kwargs):
+        """Подставляет значения полей из словаря values или из именованных аргументов"""
+        return self.text.format_map(kwargs if values is None else values)
+
+
+# Статические тексты: ключ -> готовая строка
+TEXTS = MappingProxyType({
+    "special_reading_intro": "🔮 *Специальный расклад Таро* 🔮\n\n"
+                             "Подготавливаю ваш полный расклад...",
+    "reading_ready": "🔮 *Ваш расклад готов!* 🍸\n\nВот что говорят карты:",
+    "what_next": "Что бы вы хотели сделать дальше?",
+    "new_reading_or_menu": "Хотите сделать новый расклад или вернуться в главное меню?",
+    "standard_offer": "🔮 *Пьяное Таро* 🍸\n\n"
+                      "Я проведу для вас гадание на картах Таро с алкогольной интерпретацией!\n"
+                      f"Стоимость гадания: {STANDARD_READING_STARS} Stars.\n\n"
+                      "Нажмите кнопку ниже, чтобы перейти к оплате.",
+    "reading_command_offer": "🔮 *Пьяное Таро* 🍸\n\n"
+                             "Я проведу для вас гадание на картах Таро с алкогольной интерпретацией!\n"
+                             f"Стоимость гадания: {STANDARD_READING_STARS} Stars.\n\n"
+                             "Нажмите кнопку ниже, чтобы оплатить и получить гадание.",
+    "premium_offer": "💰 *Индивидуальное гадание* 💰\n\n"
+                     "Вы можете заказать персональное гадание с подробной интерпретацией.\n"
+                     f"Стоимость индивидуального гадания: {PREMIUM_READING_STARS} Stars.\n\n"
+                     "Гадание будет включать расширенный расклад из 5 карт и детальный анализ вашей ситуации.",
+    "ask_birthdate": "🔮 *Индивидуальное гадание* 🔮\n\n"
+                     "Для составления персонального расклада, пожалуйста, введите вашу дату рождения "
+                     "в формате ДД.ММ.ГГГГ (например, 15.05.1990).",
+    "invoice_error": "❌ Произошла ошибка при создании счета. Пожалуйста, попробуйте позже.",
+    "reading_cancelled": "❌ Гадание отменено. Вы можете начать снова в любое время.",
+    "test_demo_done": "Это было демо-гадание. Для полного расклада из 3 карт с рекомендацией напитка, "
+                      "нажмите кнопку ниже:",
+    "test_error": "😔 *Упс! Что-то пошло не так...*\n\n"
+                  "Карты Таро сегодня капризничают. Пожалуйста, попробуйте еще раз позже.",
+    "invalid_birthdate": "❌ Пожалуйста, введите дату в формате ДД.ММ.ГГГГ (например, 15.05.1990).",
+    "premium_start": "<b>🔮 Начинаю индивидуальное гадание...</b>",
+    "premium_shuffling": "<b>🃏 Перемешиваю карты...</b>",
+    "premium_drawing": "<b>🃏 Вытягиваю карту...</b>",
+    "payment_processing": "✅ Оплата успешно получена! Приступаю к гаданию...",
+    "payment_ask_birthdate": "<b>🔮 Для индивидуального гадания мне нужна ваша дата рождения.</b>\n\n"
+                             "Пожалуйста, введите дату рождения в формате ДД.ММ.ГГГГ (например, 01.01.1990)",
+    "payment_invalid_birthdate": "<b>❌ Неверный формат даты.</b>\n\n"
+                                 "Пожалуйста, введите дату рождения в формате ДД.ММ.ГГГГ (например, 01.01.1990)",
+    "birthdate_accepted": "<b>✅ Дата рождения принята!</b>\n\n"
+                          "Начинаю подготовку индивидуального гадания с учетом вашей даты рождения..."
+})
+
+# Параметризованные сообщения
+WELCOME = MessageTemplate(
+    "🔮 <b>Добро пожаловать в Пьяное Таро!</b> 🍸\n\n"
+    "Я - бот-таролог с алкогольным уклоном. Я могу погадать вам на картах Таро "
+    "и дать интерпретацию с алкогольной тематикой.\n\n"
+    "У вас осталось <b>{remaining_tests} из {max_tests}</b> бесплатных тестовых раскладов.\n\n"
+    "Нажмите кнопку ниже, чтобы начать гадание:",
+    parse_mode="HTML",
+    max_tests=MAX_TEST_READINGS
+)
+
+CARD = MessageTemplate(
+    "🃏 *{name}*\n\n"
+    "{description}\n\n"
+    "🍸 *Алкогольная интерпретация:*\n{drunk_interpretation}",
+    parse_mode="Markdown"
+)
+
+READING_SUMMARY = MessageTemplate(
+    "🔮 *Общее толкование:*\n\n{summary}\n\n"
+    "🍸 *Рекомендуемый напиток:*\n"
+    "{recommended_drink}",
+    parse_mode="Markdown"
+)
+
+TAROT_MESSAGE = MessageTemplate(
+    "✨ *Послание таролога:*\n\n{tarot_message}",
+    parse_mode="Markdown"
+)
+
+TEST_LIMIT_REACHED = MessageTemplate(
+    "⚠️ *Вы уже использовали максимальное количество тестовых раскладов!*\n\n"
+    "Лимит: {max_tests} тестовых раскладов.\n\n"
+    "Для полного расклада из 3 карт с рекомендацией напитка, "
+    "нажмите кнопку ниже:",
+    parse_mode="Markdown",
+    max_tests=MAX_TEST_READINGS
+)
+
+TEST_INTRO = MessageTemplate(
+    "🧪 *Тестовое гадание* 🧪\n\n"
+    "Это бесплатное демо-гадание на одной карте.\n"
+    "Вы получите базовую интерпретацию с алкогольной тематикой.\n\n"
+    "Осталось тестовых раскладов: {remaining_tests} из {max_tests}\n\n"
+    "Подготавливаю вашу карту...",
+    max_tests=MAX_TEST_READINGS
+)
+
+PAYMENT_RECEIVED = MessageTemplate(
+    "✅ *Оплата успешно получена!*\n\n"
+    "Сумма: {amount} Stars\n"
+    "ID платежа: {charge_id}...\n\n"
+    "Начинаю подготовку вашего гадания...",
+    parse_mode="Markdown"
+)
+
+PREMIUM_CARD = MessageTemplate(
+    "<b>🃏 {title}: {name}</b>\n\n"
+    "{description}\n\n"
+    "<b>🍸 Алкогольная интерпретация:</b>\n{drunk_interpretation}",
+    parse_mode="HTML"
+)
+
+PREMIUM_ANALYSIS = MessageTemplate(
+    "<b>🌟 Астрологический анализ:</b>\n\n{astrology}\n\n"
+    "<b>🔢 Нумерологический анализ:</b>\n{numerology}",
+    parse_mode="HTML"
+)
+
+PREMIUM_SUMMARY = MessageTemplate(
+    "<b>🔮 Общее толкование расклада:</b>\n\n{summary}\n\n"
+    "<b>💫 Персональный совет:</b>\n{personal_advice}\n\n"
+    "<b>🍸 Рекомендуемый напиток:</b>\n{recommended_drink}",
+    parse_mode="HTML"
+)
+
+STANDARD_SUMMARY = MessageTemplate(
+    "<b>🔮 Общее толкование расклада:</b>\n\n{summary}\n\n"
+    "<b>🍸 Рекомендуемый напиток:</b>\n{recommended_drink}",
+    parse_mode="HTML"
+)
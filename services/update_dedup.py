@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aiogram import BaseMiddleware
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Директория для данных бота
+DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent / 'data'
+
+# Тип хранилища обработанных обновлений: sqlite (переживает перезапуски) или memory
+UPDATE_DEDUP_STORE = os.getenv('UPDATE_DEDUP_STORE', 'sqlite')
+
+# Путь к базе данных SQLite с обработанными обновлениями
+UPDATE_DEDUP_DB_PATH = Path(os.getenv('UPDATE_DEDUP_DB_PATH', DATA_DIR / 'dedup.sqlite3'))
+
+# Сколько последних ключей помнить (объем памяти и базы не растет сверх этого)
+UPDATE_DEDUP_CAPACITY = int(os.getenv('UPDATE_DEDUP_CAPACITY', 100_000))
+
+# Интервал записи новых ключей в базу в секундах
+UPDATE_DEDUP_FLUSH_INTERVAL = float(os.getenv('UPDATE_DEDUP_FLUSH_INTERVAL', 0.5))
+
+
+class RecentKeys:
+    """Множество последних capacity ключей: кольцевой буфер плюс set
+
+    Проверка и добавление выполняются за O(1). Когда буфер заполнен, самый
+    старый ключ вытесняется, поэтому память ограничена при любой нагрузке.
+
+    Ключ проходит два состояния: «обрабатывается» (begin, только в памяти
+    процесса) и «обработан» (finish, сохраняется в базу). Повтором считается
+    ключ в любом из них, но на диск попадают только обработанные: если процесс
+    упал посреди обработки, после перезапуска обновление будет обработано снова.
+
+    Args:
+        capacity: Количество хранимых ключей
+        path: Путь к базе SQLite для сохранения ключей между перезапусками (None - только память)
+        flush_interval: Интервал записи новых ключей в базу в секундах
+    """
+
+    def __init__(self, capacity=UPDATE_DEDUP_CAPACITY, path=None, flush_interval=UPDATE_DEDUP_FLUSH_INTERVAL):
+        self.capacity = max(1, capacity)
+        self.path = Path(path) if path else None
+        self.flush_interval = flush_interval
+        self.duplicates = 0
+        self._order = deque()
+        self._keys = set()
+        self._in_progress = set()
+        self._pending = []
+        self._flush_task = None
+        self._conn = None
+        self._executor = None
+        if self.path is not None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="update-dedup")
+            self._load()
+
+    def __contains__(self, key):
+        return key in self._keys or key in self._in_progress
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _remember(self, key):
+        if len(self._order) >= self.capacity:
+            self._keys.discard(self._order.popleft())
+        self._order.append(key)
+        self._keys.add(key)
+
+    def begin(self, key):
+        """Отмечает ключ как обрабатываемый
+
+        Returns:
+            True, если ключ новый, и False, если он уже обработан или обрабатывается
+        """
+        if key in self:
+            self.duplicates += 1
+            return False
+        self._in_progress.add(key)
+        return True
+
+    def finish(self, key):
+        """Отмечает ключ как обработанный и ставит его в очередь записи в базу"""
+        self._in_progress.discard(key)
+        if key in self._keys:
+            return
+        self._remember(key)
+        if self.path is not None:
+            self._pending.append((key, time.time()))
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+    def abandon(self, key):
+        """Снимает отметку обработки без сохранения: повтор ключа будет обработан заново"""
+        self._in_progress.discard(key)
+
+    def add(self, key):
+        """Запоминает ключ сразу как обработанный
+
+        Returns:
+            True, если ключ новый, и False, если он уже встречался
+        """
+        if not self.begin(key):
+            return False
+        self.finish(key)
+        return True
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE, seen_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _load(self):
+        """Загружает последние ключи из базы (выполняется один раз при создании)"""
+        try:
+            rows = self._connect().execute(
+                "SELECT key FROM (SELECT id, key FROM seen ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (self.capacity,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при загрузке обработанных обновлений: {e}")
+            return
+        for (key,) in rows:
+            self._remember(key)
+        if rows:
+            logging.info(f"Загружено {len(rows)} ключей обработанных обновлений из {self.path}")
+
+    def _write(self, rows):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO seen (key, seen_at) VALUES (?, ?)", rows)
+            # Оставляем в базе только последние capacity ключей
+            conn.execute("DELETE FROM seen WHERE id <= (SELECT MAX(id) FROM seen) - ?", (self.capacity,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _flush_later(self):
+        if self.flush_interval > 0:
+            await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Записывает новые ключи в базу одной транзакцией"""
+        if not self._pending or self._executor is None:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, rows)
+        except Exception as e:
+            logging.error(f"Ошибка при записи обработанных обновлений: {e}")
+
+    async def close(self):
+        """Записывает оставшиеся ключи и закрывает базу"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def update_dedup_keys(update):
+    """Возвращает ключи, по которым обновление считается повтором
+
+    Кроме update_id учитывается telegram_payment_charge_id: один платеж
+    обрабатывается один раз, даже если пришел в разных обновлениях.
+    """
+    keys = [f"update:{update.update_id}"]
+    message = update.message
+    if message is not None and message.successful_payment is not None:
+        keys.append(f"charge:{message.successful_payment.telegram_payment_charge_id}")
+    return keys
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера, пропускающий повторно доставленные обновления
+
+    На время обработки ключи отмечаются как обрабатываемые, поэтому повтор,
+    пришедший пока первая копия еще обрабатывается, отбрасывается. Обработанными
+    (и сохраненными в базу) они становятся только после выхода из обработчика,
+    в том числе с ошибкой. Если обработка прервана (отмена задачи или падение
+    процесса), ключи не сохраняются и повторно доставленное обновление, например
+    отправленное заново перезапущенному обработчику, обрабатывается.
+
+    Args:
+        keys: Хранилище RecentKeys
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    async def __call__(self, handler, event, data):
+        started = []
+        for key in update_dedup_keys(event):
+            if not self.keys.begin(key):
+                for started_key in started:
+                    self.keys.abandon(started_key)
+                logging.warning(f"Пропущено повторное обновление {event.update_id}")
+                return None
+            started.append(key)
+        try:
+            return await handler(event, data)
+        except asyncio.CancelledError:
+            for key in started:
+                self.keys.abandon(key)
+            started = []
+            raise
+        finally:
+            # Ошибка обработчика тоже завершает обработку: повтор ее не исправит,
+            # но может, например, второй раз выдать оплаченный расклад
+            for key in started:
+                self.keys.finish(key)
+
+
+def setup_update_deduplication(dispatcher, kind=UPDATE_DEDUP_STORE):
+    """Подключает к диспетчеру защиту от повторов с хранилищем указанного типа (sqlite или memory)"""
+    if kind == 'memory':
+        keys = RecentKeys()
+    elif kind == 'sqlite':
+        keys = RecentKeys(path=UPDATE_DEDUP_DB_PATH)
+    else:
+        raise ValueError(f"Неизвестный тип хранилища обработанных обновлений: {kind}")
+    dispatcher.update.outer_middleware(DeduplicationMiddleware(keys))
+    # Несохраненные ключи записываются при остановке диспетчера
+    dispatcher.shutdown.register(keys.close)
+    return keys
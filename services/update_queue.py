@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import deque
+
+from aiogram.types.update import UpdateTypeLookupError
+from dotenv import load_dotenv
+
+from services import tracing
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Количество обработчиков очереди обновлений
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 16))
+
+# Максимальное количество обновлений в очереди
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+
+# Что делать при переполнении очереди: reject (ответить 429, Telegram повторит) или drop (отбросить)
+WEBHOOK_QUEUE_OVERFLOW = os.getenv('WEBHOOK_QUEUE_OVERFLOW', 'reject')
+
+# Сколько секунд ждать обработки оставшихся обновлений при остановке
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 10))
+
+# Сколько последних значений времени ожидания учитывать в статистике
+WAIT_SAMPLES = 1000
+
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+DROPPED = "dropped"
+
+
+def update_order_key(update):
+    """Возвращает ключ, в пределах которого обновления обрабатываются по порядку
+
+    Обновления одного чата (или одного пользователя, если чата нет) выполняются
+    строго последовательно, остальные - параллельно.
+    """
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return f"update:{update.update_id}"
+    chat = getattr(event, 'chat', None)
+    if chat is None:
+        message = getattr(event, 'message', None)
+        chat = getattr(message, 'chat', None)
+    if chat is not None:
+        return f"chat:{chat.id}"
+    user = getattr(event, 'from_user', None) or getattr(event, 'user', None)
+    if user is not None:
+        return f"user:{user.id}"
+    return f"update:{update.update_id}"
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений с пулом обработчиков
+
+    Обновления раскладываются по "полосам" - по одной на чат. Полоса, в которой
+    есть обновления и которую никто не обрабатывает, стоит в очереди готовых;
+    обработчик берет из нее одно обновление и после обработки возвращает полосу
+    в конец очереди. Так обновления одного чата идут по порядку, а долгий расклад
+    в одном чате не задерживает остальные.
+
+    Очередь помнит номера принятых обновлений, обработка которых не
+    завершилась (в том числе прерванных при остановке): lowest_unfinished
+    возвращает самый ранний из них, дальше него получение не подтверждается.
+
+    Args:
+        handler: Корутина, обрабатывающая одно обновление
+        workers: Количество обработчиков
+        max_size: Максимальное количество ожидающих обновлений
+        overflow: Политика при переполнении: reject или drop
+        key_func: Функция, возвращающая ключ порядка для обновления
+    """
+
+    def __init__(self, handler, workers=WEBHOOK_WORKERS, max_size=WEBHOOK_QUEUE_SIZE,
+                 overflow=WEBHOOK_QUEUE_OVERFLOW, key_func=update_order_key):
+        if overflow not in ('reject', 'drop'):
+            raise ValueError(f"Неизвестная политика переполнения очереди: {overflow}")
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_size = max(1, max_size)
+        self.overflow = overflow
+        self.key_func = key_func
+        self._lanes = {}
+        self._ready = asyncio.Queue()
+        self._size = 0
+        self._tasks = []
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.accepted = 0
+        self.processed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.failures = 0
+        # Номера принятых обновлений (куча) и обработанные из них, но еще не снятые с вершины кучи
+        self._unfinished = []
+        self._finished = set()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._max_wait = 0.0
+
+    def __len__(self):
+        return self._size
+
+    def submit(self, update):
+        """Ставит обновление в очередь без ожидания
+
+        Returns:
+            ACCEPTED, либо REJECTED или DROPPED, если очередь переполнена
+        """
+        if self._size >= self.max_size:
+            if self.overflow == 'reject':
+                self.rejected += 1
+                return REJECTED
+            self.dropped += 1
+            return DROPPED
+        key = self.key_func(update)
+        lane = self._lanes.get(key)
+        if lane is None:
+            # Новая полоса сразу становится готовой; существующая уже стоит в очереди или обрабатывается
+            lane = self._lanes[key] = deque()
+            self._ready.put_nowait(key)
+        lane.append((update, time.monotonic()))
+        update_id = getattr(update, 'update_id', None)
+        if update_id is not None:
+            heapq.heappush(self._unfinished, update_id)
+        self._size += 1
+        self.accepted += 1
+        self._idle.clear()
+        return ACCEPTED
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            update, enqueued_at = lane.popleft()
+            self._size -= 1
+            self._active += 1
+            wait = time.monotonic() - enqueued_at
+            self._waits.append(wait)
+            self._max_wait = max(self._max_wait, wait)
+            # Корневой спан трассировки начинается с постановки обновления в очередь
+            tracing.mark_arrival(enqueued_at)
+            try:
+                await self.handler(update)
+            except asyncio.CancelledError:
+                # Прерванное обновление остается необработанным
+                raise
+            except Exception as e:
+                self.failures += 1
+                logging.exception(f"Ошибка при обработке обновления {getattr(update, 'update_id', '?')}: {e}")
+            finally:
+                self._active -= 1
+                self.processed += 1
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+                if self._size == 0 and self._active == 0:
+                    self._idle.set()
+            self._mark_finished(update)
+
+    def _mark_finished(self, update):
+        update_id = getattr(update, 'update_id', None)
+        if update_id is None:
+            return
+        self._finished.add(update_id)
+        while self._unfinished and self._unfinished[0] in self._finished:
+            self._finished.remove(heapq.heappop(self._unfinished))
+
+    def lowest_unfinished(self):
+        """Возвращает номер самого раннего принятого и не обработанного обновления или None"""
+        return self._unfinished[0] if self._unfinished else None
+
+    def start(self):
+        """Запускает обработчики очереди"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}") for i in range(self.workers)
+        ]
+        logging.info(f"Очередь обновлений запущена: {self.workers} обработчиков, до {self.max_size} обновлений")
+
+    async def stop(self, drain_timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """Дожидается обработки очереди (не дольше drain_timeout) и останавливает обработчики"""
+        if self._tasks and drain_timeout > 0:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Очередь обновлений не обработана за {drain_timeout} с, "
+                                f"осталось {self._size} обновлений")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        """Возвращает глубину очереди, время ожидания и счетчики обновлений"""
+        waits = sorted(self._waits)
+        now = time.monotonic()
+        oldest = min((lane[0][1] for lane in self._lanes.values() if lane), default=None)
+        return {
+            "depth": self._size,
+            "max_size": self.max_size,
+            "chats": len(self._lanes),
+            "workers": self.workers,
+            "busy_workers": self._active,
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "oldest_wait": now - oldest if oldest is not None else 0.0,
+            "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max": self._max_wait
+        }
@@ -66,11 +66,11 @@ async def main():
             logging.error(f"Ошибка при запуске webhook: {e}")
             logging.info("Переключение на режим long polling")
             from main import main as start_polling
-            await start_polling()
+            await start_polling(metrics_server=False)
     else:
-        # Запускаем в режиме long polling
+        # Запускаем в режиме long polling (/metrics отдает сервер keep_alive)
         from main import main as start_polling
-        await start_polling()
+        await start_polling(metrics_server=False)
 
 if __name__ == "__main__":
     try:
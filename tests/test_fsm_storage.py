@@ -0,0 +1,66 @@
+"""Хранилище FSM: повторное чтение ключа не обращается к базе"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from aiogram.fsm.storage.base import StorageKey
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+def _counting_reads(storage):
+    reads = []
+    read = storage._read
+
+    def counted(keys):
+        reads.append(list(keys))
+        return read(keys)
+
+    storage._read = counted
+    return reads
+
+
+def test_repeated_reads_served_from_memory_and_see_own_writes(tmp_path):
+    async def scenario():
+        writer = SQLiteStorage(path=tmp_path / "fsm.sqlite3", flush_interval=0)
+        await writer.set_state(KEY, "Form:name")
+        await writer.set_data(KEY, {"step": 1})
+        await writer.close()
+
+        storage = SQLiteStorage(path=tmp_path / "fsm.sqlite3", flush_interval=0)
+        reads = _counting_reads(storage)
+        first = await asyncio.gather(storage.get_state(KEY), storage.get_data(KEY))
+        await storage.flush()
+        await storage.update_data(KEY, {"step": 2})
+        await storage.flush()
+        second = await asyncio.gather(storage.get_state(KEY), storage.get_data(KEY))
+        await storage.close()
+        return first, second, len(reads)
+
+    first, second, reads = asyncio.run(scenario())
+    assert first == ["Form:name", {"step": 1}]
+    assert second == ["Form:name", {"step": 2}]
+    assert reads == 1
+
+
+def test_expired_cached_state_read_again(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(path=tmp_path / "fsm.sqlite3", flush_interval=0, ttl=60)
+        await storage.set_state(KEY, "Form:name")
+        await storage.flush()
+        reads = _counting_reads(storage)
+        assert await storage.get_state(KEY) == "Form:name"
+        # Запомненное состояние как будто не менялось дольше ttl
+        for cached in storage._cache.values():
+            cached[2] = time.time() - 120
+        state = await storage.get_state(KEY)
+        await storage.close()
+        return state, len(reads)
+
+    assert asyncio.run(scenario()) == ("Form:name", 2)
@@ -0,0 +1,111 @@
+"""Long polling: Telegram подтверждаются только обработанные обновления"""
+import asyncio
+import queue
+import sys
+from pathlib import Path
+
+import pytest
+from aiogram import types
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.polling import fetch_updates, run_polling
+
+# Обновление, обработка которого не успевает завершиться до остановки
+HANGING_UPDATE = 2
+
+
+class FakeBot:
+    """Бот, отвечающий на getUpdates заранее заданными пачками и запоминающий offset"""
+
+    def __init__(self, batches, stop):
+        self.batches = list(batches)
+        self.stop = stop
+        self.offsets = []
+        self.session = self
+
+    async def __call__(self, method, request_timeout=None):
+        self.offsets.append(method.offset)
+        if method.timeout == 0:
+            return []
+        if not self.batches:
+            self.stop.set()
+            await asyncio.sleep(3600)
+        return [types.Update(update_id=update_id) for update_id in self.batches.pop(0)]
+
+    async def close(self):
+        pass
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.handled = []
+
+    def resolve_used_update_types(self):
+        return []
+
+    async def emit_startup(self, bot):
+        pass
+
+    async def emit_shutdown(self, bot):
+        pass
+
+    async def feed_update(self, bot, update):
+        if update.update_id == HANGING_UPDATE:
+            await asyncio.sleep(3600)
+        self.handled.append(update.update_id)
+
+
+def test_offset_stops_at_unfinished_update_and_repeats_are_skipped():
+    async def scenario():
+        stop = asyncio.Event()
+        # Обновление 2 обрабатывается, пока Telegram повторно присылает его вместе с новым 4
+        bot = FakeBot([[1, 2, 3], [2, 3, 4]], stop)
+        unfinished = set()
+        received = []
+        async for update in fetch_updates(bot, stop, unfinished=lambda: min(unfinished, default=None)):
+            received.append(update.update_id)
+            if update.update_id == HANGING_UPDATE:
+                unfinished.add(update.update_id)
+        return received, bot.offsets
+
+    received, offsets = asyncio.run(scenario())
+    assert received == [1, 2, 3, 4]
+    assert offsets == [None, HANGING_UPDATE, HANGING_UPDATE]
+
+
+def test_interrupted_update_not_confirmed_at_stop():
+    async def scenario():
+        stop = asyncio.Event()
+        bot = FakeBot([[1, 2, 3]], stop)
+        dp = FakeDispatcher()
+        await run_polling(dp, bot, stop, drain_timeout=0.2)
+        return dp.handled, bot.offsets
+
+    handled, offsets = asyncio.run(scenario())
+    assert sorted(handled) == [1, 3]
+    # Последний запрос - подтверждение после остановки очереди: обновление 2 Telegram пришлет снова
+    assert offsets[-1] == HANGING_UPDATE
+
+
+def test_sharded_worker_acks_failed_update_but_not_cancelled():
+    from bot_service import feed_and_ack
+
+    async def scenario():
+        acks = queue.Queue()
+
+        async def failing():
+            raise RuntimeError("ошибка обработчика")
+
+        with pytest.raises(RuntimeError):
+            await feed_and_ack(failing, acks, 0, 1)
+        task = asyncio.create_task(feed_and_ack(lambda: asyncio.sleep(3600), acks, 0, HANGING_UPDATE))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await feed_and_ack(lambda: asyncio.sleep(0), acks, 0, 3)
+        return [acks.get_nowait()[2] for _ in range(acks.qsize())]
+
+    assert asyncio.run(scenario()) == [1, 3]
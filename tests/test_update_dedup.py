@@ -0,0 +1,126 @@
+"""Защита от повторов: обработчик, убитый посреди обработки, не теряет обновление"""
+import asyncio
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from aiogram import types
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.update_dedup import DeduplicationMiddleware, RecentKeys
+
+# Обновление, на котором первый процесс зависает и убивается
+HANGING_UPDATE = 2
+
+
+def _record(log_path, line):
+    with open(log_path, "a", encoding="utf-8") as file:
+        file.write(line + "\n")
+
+
+async def _handle_updates(db_path, log_path, update_ids, hang):
+    keys = RecentKeys(path=db_path, flush_interval=0)
+    middleware = DeduplicationMiddleware(keys)
+
+    async def handler(event, data):
+        _record(log_path, f"start {event.update_id}")
+        if hang and event.update_id == HANGING_UPDATE:
+            await asyncio.sleep(3600)
+        _record(log_path, f"done {event.update_id}")
+
+    for update_id in update_ids:
+        await middleware(handler, types.Update(update_id=update_id), {})
+    await keys.close()
+
+
+def worker(db_path, log_path, update_ids, hang):
+    """Процесс-обработчик: обрабатывает обновления через защиту от повторов с базой db_path"""
+    asyncio.run(_handle_updates(db_path, log_path, update_ids, hang))
+
+
+def _read_log(log_path):
+    return log_path.read_text(encoding="utf-8").splitlines() if log_path.exists() else []
+
+
+def test_killed_worker_update_processed_exactly_once(tmp_path):
+    db_path, log_path = tmp_path / "dedup.sqlite3", tmp_path / "handled.log"
+    context = multiprocessing.get_context("spawn")
+
+    process = context.Process(target=worker, args=(db_path, log_path, [1, HANGING_UPDATE], True))
+    process.start()
+    deadline = time.monotonic() + 30
+    while f"start {HANGING_UPDATE}" not in _read_log(log_path):
+        assert time.monotonic() < deadline, "обработчик не начал обработку"
+        time.sleep(0.05)
+    # Даем ключам первого обновления и (при ошибке) зависшего записаться в базу
+    time.sleep(0.5)
+    process.kill()
+    process.join()
+
+    # Перезапущенный обработчик получает заново все неподтвержденные обновления
+    process = context.Process(target=worker, args=(db_path, log_path, [1, HANGING_UPDATE], False))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+    log = _read_log(log_path)
+    assert log.count("done 1") == 1
+    assert log.count(f"start {HANGING_UPDATE}") == 2
+    assert log.count(f"done {HANGING_UPDATE}") == 1
+
+
+def test_duplicate_dropped_while_in_progress_and_after_finish():
+    async def scenario():
+        keys = RecentKeys()
+        middleware = DeduplicationMiddleware(keys)
+        handled = []
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            handled.append(event.update_id)
+            await release.wait()
+
+        first = asyncio.create_task(middleware(handler, types.Update(update_id=1), {}))
+        await asyncio.sleep(0)
+        await middleware(handler, types.Update(update_id=1), {})
+        release.set()
+        await first
+        await middleware(handler, types.Update(update_id=1), {})
+        return handled, keys.duplicates
+
+    assert asyncio.run(scenario()) == ([1], 2)
+
+
+def test_cancelled_update_processed_again_and_failed_is_not():
+    async def scenario():
+        keys = RecentKeys()
+        middleware = DeduplicationMiddleware(keys)
+        handled = []
+
+        async def hanging(event, data):
+            await asyncio.sleep(3600)
+
+        async def failing(event, data):
+            handled.append(event.update_id)
+            raise RuntimeError("ошибка обработчика")
+
+        async def handler(event, data):
+            handled.append(event.update_id)
+
+        task = asyncio.create_task(middleware(hanging, types.Update(update_id=1), {}))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await middleware(handler, types.Update(update_id=1), {})
+
+        with pytest.raises(RuntimeError):
+            await middleware(failing, types.Update(update_id=2), {})
+        await middleware(handler, types.Update(update_id=2), {})
+        return handled
+
+    assert asyncio.run(scenario()) == [1, 2]